@@ -0,0 +1,172 @@
+import queue
+import heapq
+import asyncio
+from enum import Enum
+from collections import OrderedDict
+
+from SubmitCommon   import SubmissionType, routeStdout
+from JobStatus      import PollInterval
+from LocalResources import LocalResources
+from Profiler       import Profiler
+
+class Engine( Enum ):
+  THREADS = "threads" # a worker thread per running step
+  ASYNCIO = "asyncio" # every step a task on one event loop
+
+  def __str__( self ) :
+    return self.value
+
+# Runs the steps of many tests on a single asyncio event loop. Steps spend
+# nearly all their time waiting on a subprocess or an HPC scheduler, so rather
+# than holding a thread each they are tasks, cheap enough to have thousands in
+# flight with --threadpool still limiting how many run at once
+class AsyncScheduler( ) :
+
+  def __init__( self, tests, threadpool ) :
+    self.tests_      = tests
+    self.threadpool_ = threadpool
+    self.notifier_   = queue.SimpleQueue() # Steps of all tests report back here when done
+    self.resources_  = {}                  # LOCAL resources of steps, limited to the host
+    self.launch_     = None                # Steps prepare off the loop one at a time, made on the loop
+
+  def run( self, testComplete=None ) :
+    return asyncio.run( self.runAsync( testComplete ) )
+
+  async def runAsync( self, testComplete ) :
+    self.launch_ = asyncio.Lock()
+    owner    = {}
+    priority = {}
+    for testIdx, test in enumerate( self.tests_ ) :
+      test.setNotifier( self.notifier_ )
+      testPriority = test.stepPriorities()
+      for step in test.steps_.values() :
+        owner[ step ] = test
+        # Ties between tests go to the test listed first
+        priority[ step ] = ( testPriority[ step.name_ ], testIdx, step.name_ )
+
+    stepsAlreadyRun = OrderedDict()
+    stepsDone       = { test.name_ : 0 for test in self.tests_ }
+    running         = {}
+    postProcessing  = {}
+
+    # Ready steps wait here until there is room for them, then go in the requested order
+    queued = []
+    def submitSteps( steps ) :
+      for step in steps :
+        heapq.heappush( queued, ( priority[ step ], step ) )
+
+      # Steps that do not fit on the host yet keep their place for next time
+      deferred = []
+      while queued and len( running ) < self.threadpool_ :
+        entry = heapq.heappop( queued )
+        step  = entry[1]
+        if step in stepsAlreadyRun :
+          continue
+        if not self.claimResources( owner[ step ], step ) :
+          deferred.append( entry )
+          continue
+        stepsAlreadyRun[ step ] = asyncio.create_task( self.runStep( owner[ step ], step ) )
+        running[ stepsAlreadyRun[ step ] ] = step
+
+      for entry in deferred :
+        heapq.heappush( queued, entry )
+
+    def finishTest( test ) :
+      # Results are reported in the order steps were submitted
+      stepOrder = [ step.name_ for step in stepsAlreadyRun if owner[ step ] is test ]
+      postProcessing[ asyncio.create_task( self.finishTest( test, stepOrder ) ) ] = test
+
+    results = OrderedDict()
+    try :
+      readySteps = []
+      for test in self.tests_ :
+        test.runRouted( test.startSteps )
+        if not test.steps_ :
+          finishTest( test )
+        readySteps.extend( [ step for step in test.steps_.values() if step.runnable() ] )
+
+      # Steps only become ready when a parent finishes, so once nothing is
+      # running every step of every test has run
+      submitSteps( readySteps )
+      while running :
+        done, _ = await asyncio.wait( running, return_when=asyncio.FIRST_COMPLETED )
+        for task in done :
+          step = running.pop( task )
+          # Make sure the step was okay
+          task.result()
+
+          test = owner[ step ]
+          stepsDone[ test.name_ ] += 1
+          if stepsDone[ test.name_ ] == len( test.steps_ ) :
+            finishTest( test )
+
+        # Every step that finished told us which of its children it made ready
+        readySteps = []
+        while not self.notifier_.empty() :
+          _, ready = self.notifier_.get_nowait()
+          readySteps.extend( ready )
+        submitSteps( readySteps )
+
+      pending = set( postProcessing )
+      while pending :
+        done, pending = await asyncio.wait( pending, return_when=asyncio.FIRST_COMPLETED )
+        for task in done :
+          test = postProcessing[ task ]
+          results[ test.name_ ] = task.result()
+          if testComplete is not None :
+            testComplete( ( results[ test.name_ ], [ test.name_ ], [ test.logfile_ ] ) )
+
+    except Exception as e :
+      # Nothing new is started, but let whatever is already going finish
+      await asyncio.gather( *running, *postProcessing, return_exceptions=True )
+      raise e
+
+    return results
+
+  # Take what a LOCAL step needs on the host if it is free, the threaded engine
+  # would instead have the step wait for it
+  def claimResources( self, test, step ) :
+    if step.submitOptions_.submitType_ != SubmissionType.LOCAL or step.globalOpts_.dryRun :
+      return True
+
+    host = LocalResources.host( step.globalOpts_ )
+    if step not in self.resources_ :
+      resources = step.submitOptions_.getLocalResources()
+      if resources is not None :
+        with routeStdout( test.stdout_ ) :
+          resources = host.limit( *resources, print=step.log )
+      self.resources_[ step ] = resources
+
+    resources = self.resources_[ step ]
+    if resources is None :
+      return True
+    step.heldResources_ = host.tryAcquire( *resources )
+    return step.heldResources_ is not None
+
+  async def runStep( self, test, step ) :
+    with routeStdout( test.stdout_ ), Profiler.span( step.name_, "step", test=test.name_ ) :
+      # Immediately consider ourselves submitted, thus not runnable anymore
+      step.submitted_ = True
+      step.setWorkingDirectory()
+      await step.executeActionAsync( self.launch_ )
+
+  async def finishTest( self, test, stepOrder ) :
+    loop = asyncio.get_running_loop()
+    globalOpts = test.globalOpts_
+    if test.waitResults_ and not globalOpts.nopost and not globalOpts.nowait :
+      # Wait here rather than in post-processing so waiting does not hold a thread
+      with routeStdout( test.stdout_ ), Profiler.span( "hpc wait", "test", test=test.name_ ) :
+        pendingSteps = test.pendingHPCSteps( stepOrder )
+        if pendingSteps is not None :
+          pollInterval = PollInterval()
+          while pendingSteps :
+            await asyncio.sleep( test.nextPoll( pendingSteps, pollInterval ) )
+            # Scheduler queries block on a subprocess, keep them off the loop
+            await loop.run_in_executor( None, test.runRouted, test.pollHPCSteps, pendingSteps )
+
+          test.log( "All HPC steps complete" )
+          test.log_pop()
+      test.waitResults_ = False
+
+    # Post-processing reads every logfile, also off the loop
+    return await loop.run_in_executor( None, test.runRouted, test.finishSteps, stepOrder )
@@ -28,13 +28,23 @@ class HpcArgpacks( SubmitArgpacks ) :
     for key, nestedArg in self.nestedArguments_.items() :
       nestedArg.setName( name )
 
+  def layer( self ) :
+    child = super().layer()
+    child.nestedArguments_ = OrderedDict( ( key, nestedArg.layer() ) for key, nestedArg in self.nestedArguments_.items() )
+    return child
+
+  def unshare( self ) :
+    super().unshare()
+    for nestedArg in self.nestedArguments_.values() :
+      nestedArg.unshare()
+
   # Updates and overrides current with values from rhs if they exist
   def update( self, rhs, print=print ) :
     for key, rhsNestedArg in rhs.nestedArguments_.items() :
       if key in self.nestedArguments_ :
         self.nestedArguments_[key].update( rhs.nestedArguments_[key], print )
       else :
-        self.nestedArguments_[key] = rhs.nestedArguments_[key]
+        self.nestedArguments_[key] = rhs.nestedArguments_[key].layer()
       
     super().update( rhs, print )
 
@@ -51,13 +61,16 @@ class HpcArgpacks( SubmitArgpacks ) :
     
 
   def selectAncestrySpecificSubmitArgpacks( self, sortArgpacks=False, print=print ) :
-    keysToUse = super().selectAncestrySpecificSubmitArgpacks( sortArgpacks, print ).arguments_.keys()
     hpcArgpacksToUse = OrderedDict()
 
-    for argpack in keysToUse :
+    for argpack in self.ancestryArgpacks( sortArgpacks ) :
       # We've downselected which hpc argpacks to use, now further select which resources if present
+      nestedArgpacks = self.nestedArguments_[argpack]
       hpcArgpacksToUse[argpack] = OrderedDict()
-      hpcArgpacksToUse[argpack][next( iter( self.arguments_[argpack] ) )] = self.nestedArguments_[argpack].selectAncestrySpecificSubmitArgpacks( sortArgpacks, print ).arguments_
+      hpcArgpacksToUse[argpack][next( iter( self.arguments_[argpack] ) )] = OrderedDict(
+                                                                                          ( res, nestedArgpacks.arguments_[res] )
+                                                                                          for res in nestedArgpacks.ancestryArgpacks( sortArgpacks )
+                                                                                          )
     
     finalHpcArgpacks = HpcArgpacks( hpcArgpacksToUse )
     finalHpcArgpacks.origins_ = self.origins_
@@ -132,6 +145,7 @@ class HpcArgpacks( SubmitArgpacks ) :
     # not the flags or resources as this would provide the greatest flexibility
     # to users in partitioning out resources. Only throw error on conflict in option
     # flag if it doesn't match
+    self.unshare()
     for key, value in rhs.arguments_.items() : 
       # print( "Checking if {key} exists in {name}".format( key=key, name=self.name_ ) )
       exists, occurrences = self.keyExists( key )
@@ -203,21 +217,21 @@ class HpcArgpacks( SubmitArgpacks ) :
           
           else :
             # assign new resource - remove all regex to signify generalization
-            self.nestedArguments_[argpack].arguments_[res.split( SubmitArgpacks.REGEX_DELIMETER )[-1]] = amount
-            self.nestedArguments_[argpack].origins_  [res.split( SubmitArgpacks.REGEX_DELIMETER )[-1]] = HpcArgpacks.HPC_JOIN_NAME
+            self.nestedArguments_[argpack].arguments_[SubmitArgpacks.argpackName( res )] = amount
+            self.nestedArguments_[argpack].origins_  [SubmitArgpacks.argpackName( res )] = HpcArgpacks.HPC_JOIN_NAME
 
       else :
         # Just add
         # print( "No {key} in {name}, adding to list".format( key=key, name=self.name_ ) )
-        genArgpack = key.split( SubmitArgpacks.REGEX_DELIMETER )[-1]
+        genArgpack = SubmitArgpacks.argpackName( key )
         self.arguments_[genArgpack]       = copy.deepcopy(value)
         self.origins_  [genArgpack]       = HpcArgpacks.HPC_JOIN_NAME
         self.nestedArguments_[genArgpack] = SubmitArgpacks( OrderedDict() )
         self.nestedArguments_[genArgpack].unique_ = True
 
         for res, amount in rhs.nestedArguments_[key].arguments_.items() :
-          self.nestedArguments_[genArgpack].arguments_[res.split( SubmitArgpacks.REGEX_DELIMETER )[-1]] = amount
-          self.nestedArguments_[genArgpack].origins_  [res.split( SubmitArgpacks.REGEX_DELIMETER )[-1]] = HpcArgpacks.HPC_JOIN_NAME 
+          self.nestedArguments_[genArgpack].arguments_[SubmitArgpacks.argpackName( res )] = amount
+          self.nestedArguments_[genArgpack].origins_  [SubmitArgpacks.argpackName( res )] = HpcArgpacks.HPC_JOIN_NAME 
   
 
 
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+import os
+import sys
+import json
+import threading
+import subprocess
+from collections import OrderedDict
+
+import SubmitCommon as sc
+from SubmitLogger import SubmitLogger
+
+ABS_FILEPATH = os.path.abspath( __file__ )
+
+# Environment each scheduler gives the tasks of a job array their index in
+ARRAY_INDEX_VARIABLES = [ "PBS_ARRAY_INDEX", "SLURM_ARRAY_TASK_ID" ]
+
+# Steps of a test that only differ in what they run, submitted as one job array
+# rather than a job each. Every index of the array runs one step, writing to
+# that step's logfile, and the steps all share the job ID of the array
+class JobArray( ) :
+
+  def __init__( self, steps ) :
+    self.steps_   = steps
+    self.lock_    = threading.Lock()
+    self.retval_  = None
+    self.content_ = None
+
+    first         = steps[0]
+    self.name_    = "{0}.{1}-array".format( first.parent_, first.name_ )
+    # Per index scheduler output and the tasks of each index
+    self.logfile_ = os.path.abspath( "{0}/{1}".format( first.rootDir_, self.name_ ) )
+    self.tasks_   = self.logfile_ + ".tasks.json"
+
+    for index, step in enumerate( steps ) :
+      step.jobArray_   = self
+      step.arrayIndex_ = index
+
+  # Everything that goes into submitting a step besides what it runs
+  @staticmethod
+  def key( step ) :
+    opts = step.submitOptions_
+    hpcArguments = ""
+    if opts.hpcArguments_.arguments_ :
+      hpcArguments = opts.hpcArguments_.selectAncestrySpecificSubmitArgpacks( print=lambda *args : None ).format( opts.submitType_, print=lambda *args : None )
+    return (
+            opts.submitType_, opts.queue_, opts.timelimit_, opts.wait_, opts.account_, hpcArguments,
+            # Same parents means they all become ready at once
+            tuple( sorted( ( depStep, str( depType ) ) for depStep, depType in step.dependencies_.items() ) )
+            )
+
+  # Group HPC steps that can share a submission, steps are kept in the order given
+  @staticmethod
+  def group( steps ) :
+    groups = OrderedDict()
+    for step in steps :
+      if step.submitOptions_.submitType_ == sc.SubmissionType.LOCAL :
+        continue
+      groups.setdefault( JobArray.key( step ), [] ).append( step )
+    return [ JobArray( grouped ) for grouped in groups.values() if len( grouped ) > 1 ]
+
+  # Submit the array the first time any of its steps asks, afterwards hand out
+  # the same result. Returns the submission return code and output
+  def submit( self, step ) :
+    with self.lock_ :
+      if self.retval_ is None :
+        self.retval_, self.content_ = self.submitArray( step )
+      else :
+        step.log( "Job array {0} already submitted".format( self.name_ ) )
+    step.log( "Step runs as index {0} of job array {1}".format( step.arrayIndex_, self.name_ ) )
+    return self.retval_, self.content_
+
+  def submitArray( self, step ) :
+    tasks = []
+    for member in self.steps_ :
+      workingDir = member.resolveWorkingDirectory()
+      _, additionalArgs = member.submitOptions_.format( print=lambda *args : None )
+      tasks.append( { "args" : member.taskArgs( workingDir, additionalArgs ), "cwd" : workingDir, "logfile" : member.logfile_ } )
+    with open( self.tasks_, "w" ) as fp :
+      json.dump( tasks, fp, indent=2 )
+
+    # Submitted with the options of this step, which all others share
+    submitOptions          = step.submitOptions_.layer()
+    submitOptions.name_    = self.name_
+    submitOptions.logfile_ = self.logfile_
+    submitOptions.array_   = "0-{0}".format( len( tasks ) - 1 )
+    args, _ = submitOptions.format( print=lambda *args : None )
+    args.extend( [ ABS_FILEPATH, self.tasks_ ] )
+
+    step.log( "Submitting job array {0} of {1} steps :".format( self.name_, len( tasks ) ) )
+    step.log( "  {0}".format( " ".join( [ arg if " " not in arg else "\"{0}\"".format( arg ) for arg in args ] ) ) )
+    proc = subprocess.run(
+                          args,
+                          cwd   =step.workingDirectory_,
+                          stdin =subprocess.DEVNULL,
+                          stdout=subprocess.PIPE,
+                          stderr=subprocess.STDOUT
+                          )
+    content = proc.stdout.decode( "utf-8", "replace" )
+    SubmitLogger.raw( content )
+    return proc.returncode, content
+
+# Runs the step of the current index of a job array
+def main() :
+  index = next( ( os.environ[ variable ] for variable in ARRAY_INDEX_VARIABLES if variable in os.environ ), None )
+  if index is None :
+    print( "No job array index found in any of [ {0} ]".format( ", ".join( ARRAY_INDEX_VARIABLES ) ) )
+    return 1
+
+  with open( sys.argv[1], "r" ) as fp :
+    task = json.load( fp )[ int( index ) ]
+
+  with open( task[ "logfile" ], "wb" ) as logfile :
+    return subprocess.call(
+                            task[ "args" ],
+                            cwd   =task[ "cwd" ],
+                            stdin =subprocess.DEVNULL,
+                            stdout=logfile,
+                            stderr=subprocess.STDOUT
+                            )
+
+if __name__ == '__main__' :
+  exit( main() )
@@ -0,0 +1,121 @@
+import heapq
+from enum import Enum
+from collections import OrderedDict
+from datetime import timedelta
+
+from HpcArgpacks import HpcArgpacks
+
+class JobOrder( Enum ):
+  FIFO = "fifo" # order of appearance in config
+  LPT  = "lpt"  # longest processing time first
+  CPF  = "cpf"  # critical path first, longest chain of dependent work first
+
+  def __str__( self ) :
+    return self.value
+
+# Everything the simulation needs to know about a step or test, taken once up front
+# so nothing about the real steps is touched while simulating
+class SimJob( ) :
+  def __init__( self, name, duration, resources=None, dependencies=[] ) :
+    self.name_         = name
+    self.duration_     = duration if duration is not None else timedelta()
+    self.seconds_      = self.duration_.total_seconds()
+    self.resources_    = resources
+    self.dependencies_ = list( dependencies )
+
+class JobSimulator( ) :
+
+  def __init__( self, jobs, workers, order=JobOrder.FIFO ) :
+    self.jobs_     = OrderedDict( ( job.name_, job ) for job in jobs )
+    self.workers_  = workers
+    self.order_    = JobOrder( order )
+
+    self.children_ = { name : [] for name in self.jobs_ }
+    for job in self.jobs_.values() :
+      for dep in job.dependencies_ :
+        self.children_[ dep ].append( job.name_ )
+
+    self.priority_ = JobSimulator.priorities( self.jobs_, self.children_, self.order_ )
+
+  # Smaller sorts first, ties fall back to config order
+  @staticmethod
+  def priorities( jobs, children, order ) :
+    priority = {}
+    if order == JobOrder.CPF :
+      # Longest path from each job to the end of the graph, children before parents
+      # so it is never recursive no matter how deep the graph goes
+      pathLength      = {}
+      pendingChildren = { name : len( children[ name ] ) for name in jobs }
+      done            = [ name for name, pending in pendingChildren.items() if pending == 0 ]
+      while done :
+        name = done.pop()
+        pathLength[ name ] = jobs[ name ].seconds_ + max( [ pathLength[ child ] for child in children[ name ] ], default=0 )
+        for dep in jobs[ name ].dependencies_ :
+          pendingChildren[ dep ] -= 1
+          if pendingChildren[ dep ] == 0 :
+            done.append( dep )
+
+    for idx, ( name, job ) in enumerate( jobs.items() ) :
+      if order == JobOrder.FIFO :
+        priority[ name ] = ( idx, )
+      elif order == JobOrder.LPT :
+        priority[ name ] = ( -job.seconds_, idx )
+      elif order == JobOrder.CPF :
+        priority[ name ] = ( -pathLength[ name ], -job.seconds_, idx )
+    return priority
+
+  # Order jobs that become ready at the same time should be started in
+  def sort( self, names ) :
+    return sorted( names, key=lambda name : self.priority_[ name ] )
+
+  # Run the jobs through a pool of workers and report each phase, a phase being
+  # the span between two jobs starting or finishing. Returns the total time and the
+  # largest resources needed at once if resources were provided
+  def run( self, submitType=None, phaseInfo=None, print=print ) :
+    pendingDeps = { name : len( job.dependencies_ ) for name, job in self.jobs_.items() }
+    ready       = [ ( self.priority_[ name ], name ) for name, pending in pendingDeps.items() if pending == 0 ]
+    heapq.heapify( ready )
+    running     = [] # ( finish time, start order, name )
+    started     = 0
+    now         = 0.0
+
+    maxResources = HpcArgpacks( OrderedDict() )
+    maxResources.setName( HpcArgpacks.HPC_JOIN_NAME + "max" )
+    phase = 0
+
+    while ready or running :
+      # If we have free workers and jobs left, fill in
+      while len( running ) < self.workers_ and ready :
+        _, name = heapq.heappop( ready )
+        heapq.heappush( running, ( now + self.jobs_[ name ].seconds_, started, name ) )
+        started += 1
+
+      # Run until the next job finishes
+      runFor = running[0][0] - now
+      runningJobs = [ name for _, _, name in sorted( running, key=lambda r : r[1] ) ]
+
+      if submitType is not None :
+        # What would our max resource consumption be whilst running this set?
+        currentResources = HpcArgpacks.joinAll(
+                                                [ self.jobs_[ name ].resources_ for name in runningJobs if self.jobs_[ name ].resources_ is not None ],
+                                                submitType,
+                                                lambda rhs,lhs : rhs + lhs,
+                                                print=print
+                                                )
+        maxResources.join( currentResources, submitType, max, print=print )
+        if phaseInfo is not None :
+          phaseInfo( phase, runningJobs, currentResources, timedelta( seconds=runFor ) )
+      elif phaseInfo is not None :
+        phaseInfo( phase, runningJobs, None, timedelta( seconds=runFor ) )
+      phase += 1
+
+      # Everything finishing at this time completes together
+      now = running[0][0]
+      while running and running[0][0] <= now :
+        _, _, name = heapq.heappop( running )
+        for child in self.children_[ name ] :
+          pendingDeps[ child ] -= 1
+          if pendingDeps[ child ] == 0 :
+            heapq.heappush( ready, ( self.priority_[ child ], child ) )
+
+    return timedelta( seconds=now ), maxResources
@@ -0,0 +1,227 @@
+import re
+import json
+import random
+import subprocess
+from collections import OrderedDict
+
+import SubmitCommon as sc
+
+# Scheduler job IDs may carry a server suffix, e.g. 12345.server
+JOBID_REGEX = re.compile( r"^(\d+)" )
+
+# Polling starts short and backs off towards the maximum
+HPC_POLL_MIN_SECONDS        =   5
+HPC_POLL_MAX_SECONDS        = 120
+HPC_POLL_BACKOFF            = 1.5
+HPC_POLL_JITTER             = 0.1
+# Never wait longer than this fraction of the shortest outstanding timelimit
+HPC_POLL_TIMELIMIT_FRACTION = 0.1
+# Polls in a row a job may go without the scheduler telling us anything about it
+# before it is assumed complete, so an outage or missing accounting never waits forever
+HPC_POLL_UNKNOWN_MAX        = 10
+
+# States that mean the job has left the scheduler
+PBS_COMPLETE_STATES   = [ "F", "X", "C" ]
+# qstat answered, though maybe not about every job : unknown job ID and job
+# finished without history asked for
+PBS_QUERY_RETVALS     = [ 0, 153, 35 ]
+SLURM_PENDING_STATES  = [
+                          "PENDING", "CONFIGURING", "RUNNING", "COMPLETING", "SUSPENDED",
+                          "REQUEUED", "REQUEUE_FED", "REQUEUE_HOLD", "RESIZING", "SIGNALING",
+                          "STAGE_OUT", "STOPPED", "RESV_DEL_HOLD"
+                        ]
+
+class JobStatus( ) :
+
+  def __init__( self, jobid, complete=False, state=None, exitCode=None, unknown=False ) :
+    self.jobid_    = jobid
+    self.complete_ = complete
+    self.state_    = state
+    self.exitCode_ = exitCode
+    self.unknown_  = unknown # the scheduler could not tell us anything this time
+
+  # Job arrays are reported as a whole, complete once every index is
+  @staticmethod
+  def query( submitType, jobids, arrayJobids=[], print=print ) :
+    jobids = list( jobids )
+    if not jobids :
+      return {}
+
+    if submitType == sc.SubmissionType.PBS :
+      return JobStatus.queryPBS( jobids, arrayJobids, print=print )
+    elif submitType == sc.SubmissionType.SLURM :
+      return JobStatus.querySLURM( jobids, print=print )
+    else :
+      print( "Don't know how to query {0} job status, assumed complete".format( submitType ) )
+      return { jobid : JobStatus( jobid, complete=True ) for jobid in jobids }
+
+  @staticmethod
+  def run( cmd ) :
+    proc = subprocess.run(
+                          cmd,
+                          stdin =subprocess.DEVNULL,
+                          stdout=subprocess.PIPE,
+                          stderr=subprocess.PIPE
+                          )
+    return proc.returncode, proc.stdout.decode( "utf-8", "replace" ), proc.stderr.decode( "utf-8", "replace" )
+
+  @staticmethod
+  def queryPBS( jobids, arrayJobids=[], print=print ) :
+    # Anything the scheduler answered for but no longer knows about is assumed complete
+    statuses = { jobid : JobStatus( jobid, complete=True ) for jobid in jobids }
+    # Job arrays are only known by their ID with an empty index
+    queryIds = [ "{0}[]".format( jobid ) if jobid in arrayJobids else str( jobid ) for jobid in jobids ]
+
+    # One query for all jobs, unknown job IDs only affect the return code
+    retVal, output, _ = JobStatus.run( [ "qstat", "-x", "-f", "-F", "json" ] + queryIds )
+    jobsInfo = None
+    if retVal in PBS_QUERY_RETVALS :
+      try :
+        jobsInfo = json.loads( output ).get( "Jobs", {} )
+      except ValueError :
+        pass
+
+    if jobsInfo is not None :
+      for fullJobid, info in jobsInfo.items() :
+        jobid = JobStatus.matchJobid( fullJobid, statuses )
+        if jobid is not None :
+          state = info.get( "job_state" )
+          statuses[ jobid ] = JobStatus(
+                                        jobid,
+                                        complete=( state in PBS_COMPLETE_STATES ),
+                                        state=state,
+                                        exitCode=info.get( "Exit_status" )
+                                        )
+    else :
+      # Maybe no structured output available, fall back to the plain listing
+      retVal, output, _ = JobStatus.run( [ "qstat" ] + queryIds )
+      if retVal not in PBS_QUERY_RETVALS :
+        # Not being listed means nothing if the query itself failed, try again next time
+        print( "Job status unavailable, jobs [ {0} ] assumed still active".format( ",".join( queryIds ) ) )
+        return { jobid : JobStatus( jobid, complete=False, unknown=True ) for jobid in jobids }
+
+      print( "Scheduler does not provide JSON job status, using plain qstat listing" )
+      for line in output.splitlines() :
+        fields = line.split()
+        if not fields :
+          continue
+        jobid = JobStatus.matchJobid( fields[0], statuses )
+        if jobid is not None :
+          # Job ID, Name, User, Time Use, S, Queue
+          state = fields[4] if len( fields ) > 4 else None
+          statuses[ jobid ] = JobStatus( jobid, complete=( state in PBS_COMPLETE_STATES ), state=state )
+
+    return statuses
+
+  @staticmethod
+  def querySLURM( jobids, print=print ) :
+    statuses = OrderedDict()
+    jobidsStr = ",".join( [ str( jobid ) for jobid in jobids ] )
+
+    # Active jobs first, squeue only knows about these
+    retVal, output, errors = JobStatus.run( [ "squeue", "-h", "-j", jobidsStr, "-o", "%i %T" ] )
+    active = { jobid : JobStatus( jobid, complete=False ) for jobid in jobids }
+    if retVal != 0 :
+      if "Invalid job id" in errors :
+        # Jobs long gone from the controller, only accounting still knows them
+        output = ""
+      else :
+        # Not being listed means nothing if the query itself failed, try again next time
+        print( "Job status unavailable, jobs [ {0} ] assumed still active".format( jobidsStr ) )
+        return { jobid : JobStatus( jobid, complete=False, unknown=True ) for jobid in jobids }
+
+    for line in output.splitlines() :
+      fields = line.split()
+      if len( fields ) < 2 :
+        continue
+      jobid = JobStatus.matchJobid( fields[0], active )
+      if jobid is not None :
+        state = fields[1].split( "+" )[0]
+        if state in SLURM_PENDING_STATES :
+          statuses[ jobid ] = JobStatus( jobid, complete=False, state=state )
+
+    finished = [ jobid for jobid in jobids if jobid not in statuses ]
+    if not finished :
+      return statuses
+
+    # Everything else has left the queue, get the final state and exit code from
+    # accounting. Only a final state reported there makes a job complete
+    for jobid in finished :
+      statuses[ jobid ] = JobStatus( jobid, complete=False, unknown=True )
+
+    # Tasks of job arrays are listed as <jobid>_<index>
+    retVal, output, _ = JobStatus.run( [
+                                          "sacct", "-n", "-P", "-X",
+                                          "-j", ",".join( [ str( jobid ) for jobid in finished ] ),
+                                          "-o", "JobID,State,ExitCode"
+                                        ] )
+    reported = set()
+    for line in output.splitlines() :
+      fields = line.split( "|" )
+      if len( fields ) < 3 :
+        continue
+      jobid = JobStatus.matchJobid( fields[0], statuses )
+      if jobid is None or jobid not in finished :
+        continue
+      # The first task not done or failed stands for the whole array
+      if jobid in reported and ( not statuses[ jobid ].complete_ or statuses[ jobid ].exitCode_ ) :
+        continue
+      reported.add( jobid )
+
+      # States may carry extra info, e.g. "CANCELLED by 1234"
+      state = fields[1].split()[0] if fields[1] else None
+      statuses[ jobid ] = JobStatus(
+                                    jobid,
+                                    complete=( state is not None and state not in SLURM_PENDING_STATES ),
+                                    state=state,
+                                    exitCode=JobStatus.parseSLURMExitCode( fields[2] )
+                                    )
+
+    unknown = [ jobid for jobid in finished if jobid not in reported ]
+    if unknown :
+      reason = "unavailable" if retVal != 0 else "has no record"
+      print( "Job accounting {0}, final state of jobs [ {1} ] unknown, assumed still active".format( reason, ", ".join( map( str, unknown ) ) ) )
+
+    return statuses
+
+  @staticmethod
+  def parseSLURMExitCode( exitCode ) :
+    # <exit code>:<signal>
+    try :
+      code, signal = [ int( field ) for field in exitCode.split( ":" ) ]
+    except ValueError :
+      return None
+    if code == 0 and signal != 0 :
+      return 128 + signal
+    return code
+
+  @staticmethod
+  def matchJobid( fullJobid, statuses ) :
+    jobidMatch = JOBID_REGEX.match( fullJobid )
+    if jobidMatch is not None and int( jobidMatch.group(1) ) in statuses :
+      return int( jobidMatch.group(1) )
+    return None
+
+
+class PollInterval( ) :
+
+  def __init__( self ) :
+    self.interval_    = HPC_POLL_MIN_SECONDS
+    self.maxInterval_ = HPC_POLL_MAX_SECONDS
+
+  # Limit backoff by the shortest job we are still waiting on
+  def update( self, timelimits ) :
+    timelimits = [ timelimit.total_seconds() for timelimit in timelimits if timelimit is not None ]
+    self.maxInterval_ = HPC_POLL_MAX_SECONDS
+    if timelimits :
+      self.maxInterval_ = max(
+                              HPC_POLL_MIN_SECONDS,
+                              min( HPC_POLL_MAX_SECONDS, min( timelimits ) * HPC_POLL_TIMELIMIT_FRACTION )
+                              )
+    self.interval_ = min( self.interval_, self.maxInterval_ )
+
+  def next( self ) :
+    # Jitter so many runners do not hit the scheduler in lockstep
+    wait = self.interval_ * random.uniform( 1.0 - HPC_POLL_JITTER, 1.0 + HPC_POLL_JITTER )
+    self.interval_ = min( self.interval_ * HPC_POLL_BACKOFF, self.maxInterval_ )
+    return wait
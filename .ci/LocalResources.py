@@ -0,0 +1,154 @@
+import os
+import re
+import math
+import threading
+
+# Sizes as accepted by PBS (kb, mb, gb, w...) or SLURM (K, M, G...)
+MEMORY_SIZE_REGEX = re.compile( r"^(?P<numeric>\d+)[ ]*(?P<scale>k|m|g|t)?(?P<unit>b|w)?$", re.I )
+MEMORY_MULTIPLIERS = { None : 1, "k" : 1024, "m" : 1024**2, "g" : 1024**3, "t" : 1024**4 }
+WORD_SIZE = 8
+
+# Resource names in "hpc_arguments" that tell us what a step needs on a single host
+HPC_CPU_RESOURCES    = [ "ncpus", "cpus-per-task", "cpus" ]
+HPC_MEMORY_RESOURCES = [ "mem", "memory" ]
+
+# cgroup v1 reports "no limit" as a very large number
+CGROUP_NO_LIMIT = 2**60
+
+# Tracks cpus and memory on this host so LOCAL steps that declare what they need are
+# only let through when they fit alongside what is already running
+class LocalResources( ) :
+
+  HOST_LOCK      = threading.Lock()
+  HOST_RESOURCES = None
+
+  def __init__( self, cpus=None, memory=None ) :
+    self.cpus_       = cpus   if cpus   is not None else LocalResources.detectCpus()
+    self.memory_     = memory if memory is not None else LocalResources.detectMemory()
+    self.freeCpus_   = self.cpus_
+    self.freeMemory_ = self.memory_
+    self.condition_  = threading.Condition()
+
+  # One pool per process, shared by every step running in it
+  @staticmethod
+  def host( globalOpts ) :
+    with LocalResources.HOST_LOCK :
+      if LocalResources.HOST_RESOURCES is None :
+        memory = None
+        if globalOpts.localMemory is not None :
+          memory = LocalResources.parseMemory( globalOpts.localMemory )
+        LocalResources.HOST_RESOURCES = LocalResources( globalOpts.localCpus, memory )
+      return LocalResources.HOST_RESOURCES
+
+  def fits( self, cpus, memory ) :
+    return cpus <= self.freeCpus_ and memory <= self.freeMemory_
+
+  def acquire( self, cpus, memory, print=print ) :
+    cpus, memory = self.limit( cpus, memory, print=print )
+    with self.condition_ :
+      if not self.fits( cpus, memory ) :
+        print( "Waiting for {0} cpus and {1} memory to be free on host...".format( cpus, LocalResources.formatMemory( memory ) ) )
+        self.condition_.wait_for( lambda : self.fits( cpus, memory ) )
+      self.freeCpus_   -= cpus
+      self.freeMemory_ -= memory
+
+    return cpus, memory
+
+  # Same as acquire() without waiting for resources already limited to the host,
+  # None if they are not free right now
+  def tryAcquire( self, cpus, memory ) :
+    with self.condition_ :
+      if not self.fits( cpus, memory ) :
+        return None
+      self.freeCpus_   -= cpus
+      self.freeMemory_ -= memory
+
+    return cpus, memory
+
+  def limit( self, cpus, memory, print=print ) :
+    # Anything bigger than the host would never fit, so run it alone instead
+    if cpus > self.cpus_ or memory > self.memory_ :
+      print( "Requested {0} cpus and {1} memory exceeds host capacity of {2} cpus and {3}, limiting to host capacity".format(
+                                                                                                                            cpus,
+                                                                                                                            LocalResources.formatMemory( memory ),
+                                                                                                                            self.cpus_,
+                                                                                                                            LocalResources.formatMemory( self.memory_ )
+                                                                                                                            )
+            )
+      cpus   = min( cpus,   self.cpus_ )
+      memory = min( memory, self.memory_ )
+    return cpus, memory
+
+  def release( self, cpus, memory ) :
+    with self.condition_ :
+      self.freeCpus_   += cpus
+      self.freeMemory_ += memory
+      self.condition_.notify_all()
+
+  @staticmethod
+  def detectCpus() :
+    cpus = len( os.sched_getaffinity( 0 ) ) if hasattr( os, "sched_getaffinity" ) else os.cpu_count()
+
+    # Containers may be given a cpu quota smaller than the cpus visible
+    quota = None
+    cpuMax = LocalResources.readFile( "/sys/fs/cgroup/cpu.max" )
+    if cpuMax is not None :
+      fields = cpuMax.split()
+      if len( fields ) == 2 and fields[0] != "max" :
+        quota = int( fields[0] ) / int( fields[1] )
+    else :
+      cfsQuota  = LocalResources.readFile( "/sys/fs/cgroup/cpu/cpu.cfs_quota_us" )
+      cfsPeriod = LocalResources.readFile( "/sys/fs/cgroup/cpu/cpu.cfs_period_us" )
+      if cfsQuota is not None and cfsPeriod is not None and int( cfsQuota ) > 0 :
+        quota = int( cfsQuota ) / int( cfsPeriod )
+
+    if quota is not None :
+      cpus = min( cpus, max( 1, math.ceil( quota ) ) )
+    return cpus
+
+  @staticmethod
+  def detectMemory() :
+    memory = None
+    meminfo = LocalResources.readFile( "/proc/meminfo" )
+    if meminfo is not None :
+      for line in meminfo.splitlines() :
+        if line.startswith( "MemTotal:" ) :
+          # Always reported in kB
+          memory = int( line.split()[1] ) * 1024
+          break
+    if memory is None :
+      memory = os.sysconf( "SC_PAGE_SIZE" ) * os.sysconf( "SC_PHYS_PAGES" )
+
+    for limitFile in [ "/sys/fs/cgroup/memory.max", "/sys/fs/cgroup/memory/memory.limit_in_bytes" ] :
+      limit = LocalResources.readFile( limitFile )
+      if limit is not None and limit != "max" and int( limit ) < CGROUP_NO_LIMIT :
+        memory = min( memory, int( limit ) )
+        break
+    return memory
+
+  @staticmethod
+  def readFile( filename ) :
+    try :
+      with open( filename, "r" ) as f :
+        return f.read().strip()
+    except OSError :
+      return None
+
+  @staticmethod
+  def parseMemory( amount ) :
+    if isinstance( amount, int ) :
+      return amount
+
+    memMatch = MEMORY_SIZE_REGEX.match( str( amount ).strip() )
+    if memMatch is None :
+      return None
+    scale = memMatch.group( "scale" ).lower() if memMatch.group( "scale" ) else None
+    unit  = memMatch.group( "unit"  ).lower() if memMatch.group( "unit"  ) else "b"
+    return int( memMatch.group( "numeric" ) ) * MEMORY_MULTIPLIERS[ scale ] * ( WORD_SIZE if unit == "w" else 1 )
+
+  @staticmethod
+  def formatMemory( memory ) :
+    for scale in [ "t", "g", "m", "k" ] :
+      if memory >= MEMORY_MULTIPLIERS[ scale ] :
+        return "{0:.1f}{1}b".format( memory / MEMORY_MULTIPLIERS[ scale ], scale )
+    return "{0}b".format( memory )
@@ -0,0 +1,166 @@
+import os
+import gzip
+import collections
+from enum import Enum
+
+# zstd from the standard library where there is one, otherwise the zstandard package if installed
+try :
+  from compression import zstd
+except ImportError :
+  try :
+    import zstandard as zstd
+  except ImportError :
+    zstd = None
+
+# Read size when walking a file backwards, large enough that even very long
+# last lines only take a few reads
+TAIL_BLOCK_SIZE = 64 * 1024
+# Most of the end of a compressed logfile kept uncompressed next to it
+TAIL_SIDECAR_SIZE = 64 * 1024
+TAIL_SIDECAR_SUFFIX = ".tail"
+# Logs are written once and rarely read, favour speed over the last few percent
+GZIP_LEVEL = 6
+
+class LogCompression( Enum ):
+  GZIP = "gzip"
+  ZSTD = "zstd"
+
+  def __str__( self ) :
+    return self.value
+
+  def suffix( self ) :
+    return ".gz" if self == LogCompression.GZIP else ".zst"
+
+  def available( self ) :
+    return self == LogCompression.GZIP or zstd is not None
+
+  def open( self, filename, mode, errors=None ) :
+    if self == LogCompression.GZIP :
+      return gzip.open( filename, mode, compresslevel=GZIP_LEVEL, errors=errors )
+    return zstd.open( filename, mode, errors=errors )
+
+# Where a logfile written under this name actually is, and how it was compressed
+def resolve( filename ) :
+  if os.path.exists( filename ) :
+    return filename, None
+  for compression in LogCompression :
+    if os.path.exists( filename + compression.suffix() ) :
+      return filename + compression.suffix(), compression
+  # Nothing there, let opening it report that
+  return filename, None
+
+# Every file a logfile written under this name may have left behind
+def files( filename ) :
+  return [ filename, filename + TAIL_SIDECAR_SUFFIX ] + [ filename + compression.suffix() for compression in LogCompression ]
+
+def clear( filename ) :
+  for stale in files( filename ) :
+    try :
+      os.unlink( stale )
+    except FileNotFoundError :
+      pass
+
+# Opens a logfile whichever way it was written, "r" decodes as text
+def openLog( filename, mode="rb" ) :
+  path, compression = resolve( filename )
+  errors = None if "b" in mode else "replace"
+  if compression is None :
+    return open( path, mode, errors=errors )
+  return compression.open( path, mode if "b" in mode else mode + "t", errors=errors )
+
+# Writes a logfile as it streams in, compressed or not. Compressed logfiles keep
+# their last whole lines in an uncompressed sidecar so checking the last line
+# never has to decompress the entire log
+class LogWriter( ) :
+  def __init__( self, filename, compression=None ) :
+    self.filename_    = filename
+    self.compression_ = compression
+    self.tail_        = bytearray()
+    self.truncated_   = False
+    clear( filename )
+    if compression is None :
+      self.output_ = open( filename, "wb" )
+    else :
+      self.output_ = compression.open( filename + compression.suffix(), "wb" )
+
+  def __enter__( self ) :
+    return self
+
+  def __exit__( self, *args ) :
+    self.close()
+
+  def write( self, chunk ) :
+    self.output_.write( chunk )
+    if self.compression_ is not None :
+      self.tail_ += chunk
+      if len( self.tail_ ) > TAIL_SIDECAR_SIZE :
+        del self.tail_[:len( self.tail_ ) - TAIL_SIDECAR_SIZE]
+        self.truncated_ = True
+
+  def flush( self ) :
+    # Flushing a compressed stream every write only costs compression
+    if self.compression_ is None :
+      self.output_.flush()
+
+  def close( self ) :
+    self.output_.close()
+    if self.compression_ is not None :
+      tail = bytes( self.tail_ )
+      if self.truncated_ :
+        # Only whole lines, a partial one would read as the wrong last line
+        tail = tail[tail.find( b"\n" ) + 1:] if b"\n" in tail[:-1] else b""
+      with open( self.filename_ + TAIL_SIDECAR_SUFFIX, "wb" ) as sidecar :
+        sidecar.write( tail )
+
+# Last lines of a file, reading fixed size blocks backwards from the end only as
+# far as needed. A trailing newline does not count as an empty last line
+def lastLinesPlain( filename, count=1, blockSize=TAIL_BLOCK_SIZE ) :
+  if count < 1 :
+    return []
+
+  blocks   = []
+  newlines = 0
+  with open( filename, "rb" ) as f :
+    end      = f.seek( 0, os.SEEK_END )
+    position = end
+    while position > 0 and newlines < count :
+      readSize  = min( blockSize, position )
+      position -= readSize
+      f.seek( position )
+      block = f.read( readSize )
+      blocks.append( block )
+      # The very last byte of the file is never a line break between lines
+      newlines += block.count( b"\n", 0, len( block ) - ( 1 if position + readSize == end else 0 ) )
+
+  if not blocks :
+    return []
+
+  data  = b"".join( reversed( blocks ) )
+  lines = data[:-1].split( b"\n" )
+  lines[-1] += data[-1:]
+  if position > 0 :
+    # First line was only partially read
+    lines = lines[1:]
+
+  return [ line.decode( "utf-8", "replace" ).rstrip( "\r\n" ) for line in lines[-count:] ]
+
+# Last lines of a logfile however it was written, compressed logfiles are only
+# decompressed if their sidecar does not hold enough lines
+def lastLines( filename, count=1, blockSize=TAIL_BLOCK_SIZE ) :
+  path, compression = resolve( filename )
+  if compression is None :
+    return lastLinesPlain( path, count, blockSize )
+
+  try :
+    lines = lastLinesPlain( filename + TAIL_SIDECAR_SUFFIX, count, blockSize )
+    if len( lines ) >= count :
+      return lines
+  except FileNotFoundError :
+    pass
+
+  with openLog( filename, "r" ) as f :
+    return [ line.rstrip( "\r\n" ) for line in collections.deque( f, maxlen=count ) ]
+
+def lastLine( filename, blockSize=TAIL_BLOCK_SIZE ) :
+  lines = lastLines( filename, 1, blockSize )
+  return lines[-1].rstrip() if lines else ""
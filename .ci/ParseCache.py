@@ -0,0 +1,75 @@
+import os
+import sys
+import glob
+import pickle
+import hashlib
+import tempfile
+
+PARSE_CACHE_SUFFIX = ".pickle"
+# Source of the framework itself, any change to it may change what a parsed tree looks like
+FRAMEWORK_DIR = os.path.dirname( os.path.realpath( __file__ ) )
+
+# Pickled, fully parsed and host-resolved suites keyed by the config contents and
+# every option that goes into parsing, so a process can skip straight to running
+class ParseCache( ) :
+
+  FRAMEWORK_HASH = None
+
+  def __init__( self, directory ) :
+    self.directory_ = os.path.abspath( directory )
+    os.makedirs( self.directory_, exist_ok=True )
+
+  @staticmethod
+  def frameworkHash() :
+    if ParseCache.FRAMEWORK_HASH is None :
+      hasher = hashlib.sha256( sys.version.encode() )
+      for source in sorted( glob.glob( os.path.join( FRAMEWORK_DIR, "*.py" ) ) ) :
+        with open( source, "rb" ) as f :
+          hasher.update( b"\0" + f.read() )
+      ParseCache.FRAMEWORK_HASH = hasher.hexdigest()
+    return ParseCache.FRAMEWORK_HASH
+
+  # Key from the config contents, all items in parts and the framework source
+  @staticmethod
+  def key( config, parts ) :
+    hasher = hashlib.sha256( ParseCache.frameworkHash().encode() )
+    with open( config, "rb" ) as f :
+      hasher.update( f.read() )
+    for part in parts :
+      hasher.update( b"\0" + str( part ).encode() )
+    return hasher.hexdigest()
+
+  # Entries of one config on one host share a prefix so only the latest is kept
+  @staticmethod
+  def prefix( config, host ) :
+    return hashlib.sha256( "{0}\0{1}".format( os.path.abspath( config ), host ).encode() ).hexdigest()[:16]
+
+  def entry( self, prefix, key ) :
+    return os.path.join( self.directory_, "{0}.{1}{2}".format( prefix, key, PARSE_CACHE_SUFFIX ) )
+
+  # Returns the cached object or None, anything unreadable is treated as missing
+  def load( self, prefix, key ) :
+    try :
+      with open( self.entry( prefix, key ), "rb" ) as cached :
+        return pickle.load( cached )
+    except Exception :
+      return None
+
+  def store( self, prefix, key, obj ) :
+    entry = self.entry( prefix, key )
+    fd, tmpfile = tempfile.mkstemp( dir=self.directory_, prefix=".tmp" )
+    try :
+      with os.fdopen( fd, "wb" ) as tmp :
+        pickle.dump( obj, tmp, protocol=pickle.HIGHEST_PROTOCOL )
+      os.replace( tmpfile, entry )
+    except BaseException :
+      os.unlink( tmpfile )
+      raise
+
+    # Anything else under this prefix came from an older config or framework
+    for stale in glob.glob( os.path.join( self.directory_, prefix + ".*" + PARSE_CACHE_SUFFIX ) ) :
+      if stale != entry :
+        try :
+          os.unlink( stale )
+        except FileNotFoundError :
+          pass
@@ -0,0 +1,128 @@
+import os
+import glob
+import json
+import time
+import tempfile
+import threading
+import contextlib
+
+PROFILE_PART_SUFFIX = ".part"
+
+# Spans of what the framework itself spends time on, written as Chrome trace
+# events viewable in Perfetto. Every process writes its own part next to the
+# profile and the top level runner merges them into one timeline
+class Profiler( ) :
+
+  PROFILER_LOCK = threading.Lock()
+  PROFILER      = None
+
+  def __init__( self, filename ) :
+    self.filename_ = os.path.abspath( filename )
+    self.lock_     = threading.Lock()
+    self.events_   = []
+    self.threads_  = {}
+
+  # One profiler per process, configured once from the CLI options
+  @staticmethod
+  def configure( filename=None ) :
+    with Profiler.PROFILER_LOCK :
+      if filename is None :
+        Profiler.PROFILER = None
+      elif Profiler.PROFILER is None or Profiler.PROFILER.filename_ != os.path.abspath( filename ) :
+        Profiler.PROFILER = Profiler( filename )
+      return Profiler.PROFILER
+
+  # Forked processes start without the parent's spans, those are the parent's to write
+  @staticmethod
+  def reset() :
+    Profiler.PROFILER_LOCK = threading.Lock()
+    profiler = Profiler.PROFILER
+    if profiler is not None :
+      profiler.lock_    = threading.Lock()
+      profiler.events_  = []
+      profiler.threads_ = {}
+
+  # Times the enclosed block, nothing at all happens unless profiling
+  @staticmethod
+  @contextlib.contextmanager
+  def span( name, category, **args ) :
+    profiler = Profiler.PROFILER
+    if profiler is None :
+      yield
+      return
+
+    start = time.time_ns() // 1000
+    try :
+      yield
+    finally :
+      stop   = time.time_ns() // 1000
+      thread = threading.current_thread()
+      event  = {
+                "name" : name,
+                "cat"  : category,
+                "ph"   : "X",
+                "ts"   : start,
+                "dur"  : stop - start,
+                "pid"  : os.getpid(),
+                "tid"  : thread.native_id
+                }
+      if args :
+        event[ "args" ] = args
+      with profiler.lock_ :
+        profiler.events_.append( event )
+        profiler.threads_[ thread.native_id ] = thread.name
+
+  # Write out everything recorded so far in this process as a part of the profile
+  @staticmethod
+  def write( processName ) :
+    profiler = Profiler.PROFILER
+    if profiler is None :
+      return
+    with profiler.lock_ :
+      events, threads = profiler.events_, profiler.threads_
+      profiler.events_, profiler.threads_ = [], {}
+    if not events :
+      return
+
+    pid = os.getpid()
+    metadata = [ { "name" : "process_name", "ph" : "M", "pid" : pid, "tid" : 0, "args" : { "name" : "{0} [{1}]".format( processName, pid ) } } ]
+    metadata.extend(
+                    { "name" : "thread_name", "ph" : "M", "pid" : pid, "tid" : tid, "args" : { "name" : name } }
+                    for tid, name in threads.items()
+                    )
+
+    directory, basename = os.path.split( profiler.filename_ )
+    fd, part = tempfile.mkstemp( prefix=basename + ".", suffix=PROFILE_PART_SUFFIX, dir=directory )
+    with os.fdopen( fd, "w" ) as fp :
+      json.dump( metadata + events, fp )
+
+  # Merge every part written so far into the profile, returns how many events it holds
+  @staticmethod
+  def merge() :
+    profiler = Profiler.PROFILER
+    if profiler is None :
+      return 0
+
+    events = []
+    for part in sorted( glob.glob( glob.escape( profiler.filename_ ) + ".*" + PROFILE_PART_SUFFIX ) ) :
+      with open( part, "r" ) as fp :
+        events.extend( json.load( fp ) )
+      os.unlink( part )
+
+    # Metadata of a process is repeated in each part it wrote
+    unique = []
+    seen   = set()
+    for event in events :
+      if event[ "ph" ] == "M" :
+        key = ( event[ "name" ], event[ "pid" ], event[ "tid" ] )
+        if key in seen :
+          continue
+        seen.add( key )
+      unique.append( event )
+
+    with open( profiler.filename_, "w" ) as fp :
+      json.dump( { "traceEvents" : unique, "displayTimeUnit" : "ms" }, fp )
+    return len( unique )
+
+if hasattr( os, "register_at_fork" ) :
+  os.register_at_fork( after_in_child=Profiler.reset )
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+import os
+import time
+import sqlite3
+import argparse
+import threading
+from collections import OrderedDict
+
+RESULTS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+  id        INTEGER PRIMARY KEY,
+  config    TEXT,
+  host      TEXT,
+  masterlog TEXT,
+  relfile   TEXT,
+  reloffset TEXT,
+  start     REAL,
+  stop      REAL,
+  success   INTEGER
+);
+CREATE TABLE IF NOT EXISTS tests (
+  id      INTEGER PRIMARY KEY,
+  run     INTEGER NOT NULL REFERENCES runs( id ),
+  name    TEXT NOT NULL,
+  success INTEGER,
+  line    TEXT,
+  start   REAL,
+  stop    REAL,
+  logfile TEXT,
+  stdout  TEXT
+);
+CREATE TABLE IF NOT EXISTS steps (
+  id      INTEGER PRIMARY KEY,
+  test    INTEGER NOT NULL REFERENCES tests( id ),
+  name    TEXT NOT NULL,
+  success INTEGER,
+  line    TEXT,
+  start   REAL,
+  stop    REAL,
+  runtime REAL,
+  jobid   INTEGER,
+  cached  INTEGER,
+  user    REAL,
+  system  REAL,
+  maxrss  INTEGER,
+  logfile TEXT
+);
+CREATE INDEX IF NOT EXISTS runs_config   ON runs( config, host );
+CREATE INDEX IF NOT EXISTS tests_run     ON tests( run );
+CREATE INDEX IF NOT EXISTS tests_name    ON tests( name, success, run );
+CREATE INDEX IF NOT EXISTS steps_test    ON steps( test );
+CREATE INDEX IF NOT EXISTS steps_name    ON steps( name );
+CREATE INDEX IF NOT EXISTS steps_runtime ON steps( runtime );
+"""
+
+# Columns added to the schema since its first version, listed by the version
+# that added them. A database is shared across runs so one made by an older
+# runner is brought up to date when opened, the version is kept in user_version
+RESULTS_MIGRATIONS = [
+  # 1 : resource usage of LOCAL steps
+  [ ( "steps", "user", "REAL" ), ( "steps", "system", "REAL" ), ( "steps", "maxrss", "INTEGER" ) ]
+]
+RESULTS_VERSION = len( RESULTS_MIGRATIONS )
+
+# Seconds to wait on another process writing to the same database
+RESULTS_BUSY_TIMEOUT = 60
+
+# Results of every run in one SQLite database, written test by test as they
+# complete. Holds the same information as the master log and test logs of a
+# run so either can be read back as a master log
+class ResultsDB( ) :
+  def __init__( self, filename ) :
+    self.filename_ = os.path.abspath( filename )
+    self.lock_     = threading.Lock()
+    # Tests complete on pool callback and scheduler threads
+    self.db_       = sqlite3.connect( self.filename_, timeout=RESULTS_BUSY_TIMEOUT, check_same_thread=False )
+    self.db_.row_factory = sqlite3.Row
+    with self.lock_, self.db_ :
+      self.db_.execute( "PRAGMA journal_mode=WAL" )
+      self.db_.executescript( RESULTS_SCHEMA )
+    self.migrate()
+
+  def migrate( self ) :
+    with self.lock_, self.db_ :
+      # Only one process gets to upgrade a database
+      self.db_.execute( "BEGIN IMMEDIATE" )
+      version = self.db_.execute( "PRAGMA user_version" ).fetchone()[0]
+      if version >= RESULTS_VERSION :
+        return
+      for columns in RESULTS_MIGRATIONS[ version: ] :
+        for table, column, columnType in columns :
+          # Tables just created above already have every column
+          existing = [ row[ "name" ] for row in self.db_.execute( "PRAGMA table_info( {0} )".format( table ) ) ]
+          if column not in existing :
+            self.db_.execute( "ALTER TABLE {0} ADD COLUMN {1} {2}".format( table, column, columnType ) )
+      self.db_.execute( "PRAGMA user_version = {0}".format( RESULTS_VERSION ) )
+
+  def close( self ) :
+    self.db_.close()
+
+  def startRun( self, config, host, masterlog, metadata ) :
+    with self.lock_, self.db_ :
+      return self.db_.execute(
+                              "INSERT INTO runs ( config, host, masterlog, relfile, reloffset, start ) VALUES ( ?, ?, ?, ?, ?, ? )",
+                              ( config, host, masterlog, metadata[ "rel_file" ], metadata[ "rel_offset" ], time.time() )
+                              ).lastrowid
+
+  def finishRun( self, run, success ) :
+    with self.lock_, self.db_ :
+      self.db_.execute( "UPDATE runs SET stop = ?, success = ? WHERE id = ?", ( time.time(), success, run ) )
+
+  # Test entry as found in the master log
+  def addTest( self, run, name, testLog ) :
+    steps = testLog.get( "steps", {} )
+    starts = [ step[ "start" ] for step in steps.values() if step.get( "start" ) is not None ]
+    stops  = [ step[ "stop"  ] for step in steps.values() if step.get( "stop"  ) is not None ]
+    with self.lock_, self.db_ :
+      test = self.db_.execute(
+                              "INSERT INTO tests ( run, name, success, line, start, stop, logfile, stdout ) VALUES ( ?, ?, ?, ?, ?, ?, ?, ? )",
+                              (
+                                run, name, testLog[ "success" ], testLog.get( "line" ),
+                                min( starts ) if starts else None, max( stops ) if stops else None,
+                                testLog.get( "logfile" ), testLog.get( "stdout" )
+                              )
+                              ).lastrowid
+      self.db_.executemany(
+                            "INSERT INTO steps ( test, name, success, line, start, stop, runtime, jobid, cached, user, system, maxrss, logfile ) VALUES ( ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ? )",
+                            [
+                              (
+                                test, stepname, step[ "success" ], step.get( "line" ),
+                                step.get( "start" ), step.get( "stop" ),
+                                step[ "stop" ] - step[ "start" ] if step.get( "start" ) is not None and step.get( "stop" ) is not None else None,
+                                step.get( "jobid" ), step.get( "cached" ),
+                                step.get( "user" ), step.get( "system" ), step.get( "maxrss" ),
+                                step.get( "logfile" )
+                              )
+                              for stepname, step in steps.items()
+                            ]
+                            )
+    return test
+
+  # Latest run if none is given
+  def run( self, run=None ) :
+    if run is None :
+      return self.db_.execute( "SELECT * FROM runs ORDER BY id DESC LIMIT 1" ).fetchone()
+    return self.db_.execute( "SELECT * FROM runs WHERE id = ?", ( run, ) ).fetchone()
+
+  # Same layout as the master log written by the runner
+  def masterLog( self, run=None ) :
+    runRow = self.run( run )
+    if runRow is None :
+      raise Exception( "Error: no run {0} in results database {1}".format( "" if run is None else run, self.filename_ ) )
+
+    logs = OrderedDict()
+    logs[ "metadata" ] = { "rel_file" : runRow[ "relfile" ], "rel_offset" : runRow[ "reloffset" ] }
+    for test in self.db_.execute( "SELECT * FROM tests WHERE run = ? ORDER BY id", ( runRow[ "id" ], ) ) :
+      steps = OrderedDict()
+      for step in self.db_.execute( "SELECT * FROM steps WHERE test = ? ORDER BY id", ( test[ "id" ], ) ) :
+        steps[ step[ "name" ] ] = {
+                                    "logfile" : step[ "logfile" ],
+                                    "success" : bool( step[ "success" ] ),
+                                    "line"    : step[ "line" ],
+                                    "jobid"   : step[ "jobid" ],
+                                    "start"   : step[ "start" ],
+                                    "stop"    : step[ "stop" ]
+                                  }
+        if step[ "cached" ] is not None :
+          steps[ step[ "name" ] ][ "cached" ] = bool( step[ "cached" ] )
+        if step[ "maxrss" ] is not None :
+          steps[ step[ "name" ] ].update( { key : step[ key ] for key in [ "user", "system", "maxrss" ] } )
+      logs[ test[ "name" ] ] = {
+                                  "success" : bool( test[ "success" ] ),
+                                  "logfile" : test[ "logfile" ],
+                                  "stdout"  : test[ "stdout" ],
+                                  "line"    : test[ "line" ],
+                                  "steps"   : steps
+                                }
+    return runRow[ "masterlog" ], logs
+
+  def failures( self, test, limit=20 ) :
+    return self.db_.execute(
+                            "SELECT runs.id AS run, runs.start AS date, tests.line AS line FROM tests JOIN runs ON runs.id = tests.run "
+                            "WHERE tests.name = ? AND NOT tests.success ORDER BY tests.run DESC LIMIT ?",
+                            ( test, limit )
+                            ).fetchall()
+
+  def slowSteps( self, seconds, limit=None ) :
+    return self.db_.execute(
+                            "SELECT tests.run AS run, tests.name AS test, steps.name AS step, steps.runtime AS runtime FROM steps JOIN tests ON tests.id = steps.test "
+                            "WHERE steps.runtime > ? ORDER BY steps.runtime DESC LIMIT ?",
+                            ( seconds, -1 if limit is None else limit )
+                            ).fetchall()
+
+
+def getOptionsParser():
+  parser = argparse.ArgumentParser(
+                                    description="Query a results database written by runner.py",
+                                  )
+
+  parser.add_argument(
+                      "resultsDB",
+                      help="Results database from runner.py --resultsDB",
+                      type=str
+                      )
+  parser.add_argument(
+                      "-f", "--failures",
+                      dest="failures",
+                      help="Show the most recent failures of this test",
+                      type=str,
+                      default=None
+                      )
+  parser.add_argument(
+                      "-s", "--slowerThan",
+                      dest="slowerThan",
+                      help="Show steps that took longer than this many seconds",
+                      type=float,
+                      default=None
+                      )
+  parser.add_argument(
+                      "-n", "--limit",
+                      dest="limit",
+                      help="Most results to show (default : %(default)s)",
+                      type=int,
+                      default=20
+                      )
+  return parser
+
+class Options(object):
+  """Empty namespace"""
+  pass
+
+def main() :
+  parser  = getOptionsParser()
+  options = Options()
+  parser.parse_args( namespace=options )
+
+  results = ResultsDB( options.resultsDB )
+  if options.failures is not None :
+    for failure in results.failures( options.failures, options.limit ) :
+      print( "run {run:<6} {date} : {line}".format( run=failure[ "run" ], date=time.ctime( failure[ "date" ] ), line=failure[ "line" ] ) )
+  if options.slowerThan is not None :
+    for step in results.slowSteps( options.slowerThan, options.limit ) :
+      print( "run {run:<6} {test}.{step} : {runtime:.2f}s".format( **step ) )
+  results.close()
+
+if __name__ == '__main__' :
+  main()
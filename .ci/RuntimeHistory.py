@@ -0,0 +1,64 @@
+import math
+import threading
+from datetime import timedelta
+
+from ResultsDB import ResultsDB
+
+# Most recent successful runs of a step considered, older ones may no longer be representative
+RUNTIME_HISTORY_SAMPLES = 20
+
+# Observed wall times of steps in previous runs of a config on this host, read
+# from the results database so estimates follow what steps really take rather
+# than their padded timelimits. Only LOCAL steps that really ran count, cached
+# results take no time and HPC steps are timed from submission to being polled
+# finished, queue wait included
+class RuntimeHistory( ) :
+
+  HISTORY_LOCK = threading.Lock()
+  HISTORY      = None
+
+  def __init__( self, resultsDB, config, host, percentile, samples=RUNTIME_HISTORY_SAMPLES ) :
+    self.resultsDB_  = resultsDB
+    self.config_     = config
+    self.host_       = host
+    self.percentile_ = percentile
+    self.runtimes_   = {}
+
+    # One query up front, estimates are asked for many times while simulating
+    results = ResultsDB( resultsDB )
+    for row in results.db_.execute(
+                                    "SELECT tests.name AS test, steps.name AS step, steps.runtime AS runtime FROM steps "
+                                    "JOIN tests ON tests.id = steps.test JOIN runs ON runs.id = tests.run "
+                                    "WHERE runs.config = ? AND runs.host = ? AND steps.success AND steps.runtime IS NOT NULL "
+                                    "AND steps.jobid = 0 AND NOT IFNULL( steps.cached, 0 ) "
+                                    "ORDER BY steps.id DESC",
+                                    ( config, host )
+                                    ) :
+      runtimes = self.runtimes_.setdefault( ( row[ "test" ], row[ "step" ] ), [] )
+      if len( runtimes ) < samples :
+        runtimes.append( row[ "runtime" ] )
+    results.close()
+
+    for runtimes in self.runtimes_.values() :
+      runtimes.sort()
+
+  # One history per process, shared by every test in it
+  @staticmethod
+  def instance( globalOpts ) :
+    with RuntimeHistory.HISTORY_LOCK :
+      history = RuntimeHistory.HISTORY
+      if (
+          history is None or
+          ( history.resultsDB_, history.config_, history.host_, history.percentile_ ) !=
+          ( globalOpts.resultsDB, globalOpts.testsConfig, globalOpts.forceFQDN, globalOpts.runtimePercentile )
+          ) :
+        RuntimeHistory.HISTORY = RuntimeHistory( globalOpts.resultsDB, globalOpts.testsConfig, globalOpts.forceFQDN, globalOpts.runtimePercentile )
+      return RuntimeHistory.HISTORY
+
+  # Nearest rank percentile of the recorded runtimes, None if never recorded
+  def runtime( self, test, step ) :
+    runtimes = self.runtimes_.get( ( test, step ) )
+    if not runtimes :
+      return None
+    rank = max( int( math.ceil( self.percentile_ / 100.0 * len( runtimes ) ) ), 1 )
+    return timedelta( seconds=runtimes[ rank - 1 ] )
@@ -1,15 +1,27 @@
 from enum import Enum
 import subprocess
-import sys
 import os
 import re
 import io
-
-from SubmitCommon  import SubmissionType
-from SubmitAction  import SubmitAction
-from SubmitOptions import SubmitOptions
+import sys
+import time
+import codecs
+import asyncio
+import contextvars
+
+from SubmitCommon   import SubmissionType
+from SubmitAction   import SubmitAction
+from SubmitOptions  import SubmitOptions
+from JobStatus      import JobStatus
+from LocalResources import LocalResources
+from StepCache      import StepCache
+from SubmitLogger   import SubmitLogger
+from Profiler       import Profiler
+import LogReader
 
 jobidRegex  = re.compile( r"(\d{5,})" )
+# Read size when copying step output, large enough to keep syscalls out of the way
+OUTPUT_CHUNK_SIZE = 64 * 1024
 
 class Step( SubmitAction ):
 
@@ -26,6 +38,9 @@ class Step( SubmitAction ):
     # def fromString( s ) :
     #   return DependencyType[ s ]
 
+  # Keys a step may define besides "submit_options"
+  OPTION_KEYS = [ "command", "arguments", "inputs", "dependencies" ]
+
   def scope( self ) :
     return "step"
 
@@ -33,36 +48,61 @@ class Step( SubmitAction ):
     self.submitted_ = False
     self.jobid_     = None
     self.retval_    = None
+    # Final scheduler state of HPC jobs, if known
+    self.jobState_    = None
+    self.jobExitCode_ = None
+    # Wall clock of submitting the step and of it being known finished
+    self.startTime_   = None
+    self.stopTime_    = None
+    # Polls in a row the scheduler could not tell us anything about our job
+    self.unknownPolls_ = 0
+    # Resources used by LOCAL steps and everything they ran, if known
+    self.usage_       = None
     self.command_       = None
     self.arguments_     = None
+    self.inputs_        = [] # files the step reads, only used to key the step cache
+    self.cached_        = None # whether results came from the step cache, None if not using it
     self.dependencies_  = {} # our steps we are dependent on and their type
     self.depSignOff_    = {} # steps we are dependent on will need to tell us when to go
+    self.pendingDeps_   = 0  # number of steps we are still waiting on to sign off
     self.children_      = [] # steps that are dependent on us that we will need to sign off for
     # DO NOT MODIFY THIS UNLESS YOU UNDERSTAND THE IMPLICATIONS
     self.addTestScriptArgs_ = True
     self.lock_          = lock
     self.wakeTest_      = notifier
+    self.heldResources_ = None # host cpus and memory held while running locally
+    self.jobArray_      = None # job array this step is submitted as part of, if any
+    self.arrayIndex_    = None
 
     super().__init__( name, options, defaultSubmitOptions, globalOpts, parent, rootDir )
 
     self.printDir_ = True
+    # Steps may run concurrently in one process, so never rely on the process directory
+    self.changeDirectory_ = False
 
-  def parseSpecificOptions( self ) :
+  # Lock and notifier belong to the owning test and are restored by it
+  def __getstate__( self ) :
+    state = super().__getstate__()
+    state[ "lock_" ]     = None
+    state[ "wakeTest_" ] = None
+    state[ "jobArray_" ] = None
+    return state
 
-    optionKeys = []
+  def parseSpecificOptions( self ) :
 
     key = "command"
-    optionKeys.append( key )
     if key in self.options_ :
       self.command_ = self.options_[ key ]
 
     key = "arguments"
-    optionKeys.append( key )
     if key in self.options_ :
       self.arguments_ = self.options_[ key ]
 
+    key = "inputs"
+    if key in self.options_ :
+      self.inputs_ = self.options_[ key ]
+
     key = "dependencies"
-    optionKeys.append( key )
     if key in self.options_ :
       for depStep, depType in self.options_[ key ].items() :
         self.dependencies_[ depStep ] = Step.DependencyType( depType )
@@ -71,7 +111,7 @@ class Step( SubmitAction ):
     self.submitOptions_ = self.submitOptions_.selectHostSpecificSubmitOptions( host=self.globalOpts_.forceFQDN, print=self.log )
 
     # return valid keys
-    return optionKeys
+    return list( Step.OPTION_KEYS )
 
   def validate( self ) :
     self.submitOptions_.validate( print=self.log )
@@ -84,7 +124,13 @@ class Step( SubmitAction ):
 
     for dep, signoff in self.depSignOff_.items() :
       allDepsJobID = ( signoff[ "jobid" ] is not None ) and allDepsJobID
-      deps[ self.dependencies_[ dep ] ].append( signoff[ "jobid" ] )
+      jobid = signoff[ "jobid" ]
+      # PBS only takes a whole job array as dependency when marked as such
+      if signoff.get( "array" ) and jobid is not None and jobid > 0 and self.submitOptions_.submitType_ == SubmissionType.PBS :
+        jobid = "{0}[]".format( jobid )
+      # Steps of the same job array share one
+      if jobid not in deps[ self.dependencies_[ dep ] ] :
+        deps[ self.dependencies_[ dep ] ].append( jobid )
 
     # only perform list comprehension if we have dependencies,
     # then join all types with ","
@@ -98,20 +144,19 @@ class Step( SubmitAction ):
     return allDepsJobID, depsFormat
 
   def runnable( self ) :
-    canRun = False
-    # If no depenedencies just run
-    if not self.submitted_ :
-      if not self.depSignOff_ :
-        canRun = True
-      else:
-        # See if our dependencies are satisfied
-        canRun, self.submitOptions_.dependencies_ = self.formatDependencies()
-
-    return canRun
+    # Dependencies are counted down as they sign off, nothing to rescan
+    return not self.submitted_ and self.pendingDeps_ == 0
   
   def resetRunnable( self ) :
     self.submitted_ = False
     self.jobid_     = None
+    self.jobState_    = None
+    self.jobExitCode_ = None
+    self.startTime_   = None
+    self.stopTime_    = None
+    self.unknownPolls_ = 0
+    self.usage_       = None
+    self.pendingDeps_ = len( self.depSignOff_ )
     if self.depSignOff_ :
       for key in self.depSignOff_.keys() :
         self.depSignOff_[ key ][ "jobid"  ] = None
@@ -123,82 +168,158 @@ class Step( SubmitAction ):
 
   def prepExecuteAction( self ) :
     # We are about to execute - these are the first to happen
+    # Wait for room on the host before the lock so other steps can still go meanwhile
+    if self.submitOptions_.submitType_ == SubmissionType.LOCAL and not self.globalOpts_.dryRun :
+      resources = self.submitOptions_.getLocalResources()
+      if resources is not None :
+        with Profiler.span( "resources wait", "step", step=self.name_ ) :
+          self.heldResources_ = LocalResources.host( self.globalOpts_ ).acquire( *resources, print=self.log )
     # Acquire the lock until we have finished submitting our step
-    self.lock_.acquire()
+    with Profiler.span( "lock wait", "step", step=self.name_ ) :
+      self.lock_.acquire()
     # Immediately consider ourselves submitted, thus not runnable anymore
     self.submitted_ = True
 
+  # Everything up to launching the step, shared by every execution engine
+  def prepareAction( self ) :
+    # Do submission logic....
+    self.log( "Submitting step {0}...".format( self.name_ ) )
+    self.log_push()
+    self.startTime_ = time.time()
+    self.executeInfo()
+    self.retval_ = -1
+    self.submitOptions_.logfile_ = self.logfile_
+    with Profiler.span( "argpacks", "step", step=self.name_ ) :
+      args, additionalArgs   = self.submitOptions_.format( print=self.log_debug )
+    workingDir = self.workingDirectory_
+    
+
+    self.log( "Script : {0}".format( self.command_ ) )
+    if self.jobArray_ is not None :
+      # Only our own part runs as an index of the array, which is submitted for us
+      args = []
+    args.extend( self.taskArgs( workingDir, additionalArgs ) )
+
+    if self.submitOptions_.debug_ :
+      self.log( "Arguments: {0}".format( args ) )
+
+
+    command = " ".join( [ arg if " " not in arg else "\"{0}\"".format( arg ) for arg in args ] )
+    self.log( "Running command:" )
+    self.log( "  {0}".format( command ) )
+
+    # Unchanged LOCAL steps can reuse a previous successful result
+    cacheKey = None
+    if self.globalOpts_.cache is not None and self.submitOptions_.submitType_ == SubmissionType.LOCAL and not self.globalOpts_.dryRun :
+      cacheKey     = self.cacheKey( args )
+      self.cached_ = StepCache.instance( self.globalOpts_ ).restore( cacheKey, self.logfile_ )
+      if self.cached_ :
+        self.log( "Restored cached result {0} to logfile {1}, step will not run".format( cacheKey, self.logfile_ ) )
+      else :
+        self.log( "No cached result {0}".format( cacheKey ) )
+
+    self.log(  "*" * 15 + "{:^15}".format( "START " + self.name_ ) + "*" * 15 + "\n" )
+    return args, cacheKey
+
+  # What the step itself runs, without any submission in front of it
+  def taskArgs( self, workingDir, additionalArgs ) :
+    args = [ os.path.normpath( os.path.join( workingDir, self.command_ ) ) ]
+    if self.addTestScriptArgs_ :
+      args.extend( [ self.globalOpts_.forceFQDN, workingDir ] )
+
+    if self.arguments_ :
+      args.extend( self.arguments_ )
+
+    # Additional args added by submit_options
+    if additionalArgs :
+      args.extend( additionalArgs )
+    return args
+
+  # Whether output goes only to the logfile rather than also our stdout
+  def redirected( self ) :
+    return self.submitOptions_.submitType_ == SubmissionType.LOCAL and not self.globalOpts_.inlineLocal
+
+  # Only output of our own making can be compressed, submitted jobs write their logfile themselves
+  def compression( self ) :
+    return self.globalOpts_.compressLogs if self.submitOptions_.submitType_ == SubmissionType.LOCAL else None
+
   def executeAction( self ) :
     try :
-      # Do submission logic....
-      self.log( "Submitting step {0}...".format( self.name_ ) )
-      self.log_push()
-      self.executeInfo()
-      redirect = ( self.submitOptions_.submitType_ == SubmissionType.LOCAL and not self.globalOpts_.inlineLocal )
-      output = None
-      err    = ""
-      self.retval_ = -1
-      self.submitOptions_.logfile_ = self.logfile_
-      args, additionalArgs   = self.submitOptions_.format( print=self.log )
-      workingDir = os.getcwd()
-      
-
-      self.log( "Script : {0}".format( self.command_ ) )
-      args.append( os.path.abspath( self.command_ ) )
-      if self.addTestScriptArgs_ :
-        args.extend( [ self.globalOpts_.forceFQDN, workingDir ] )
-
-      if self.arguments_ :
-        args.extend( self.arguments_ )
-
-      # Additional args added by submit_options
-      if additionalArgs :
-        args.extend( additionalArgs )
-
-      if self.submitOptions_.debug_ :
-        self.log( "Arguments: {0}".format( args ) )
-
-
-      command = " ".join( [ arg if " " not in arg else "\"{0}\"".format( arg ) for arg in args ] )
-      self.log( "Running command:" )
-      self.log( "  {0}".format( command ) )
-      self.log(  "*" * 15 + "{:^15}".format( "START " + self.name_ ) + "*" * 15 + "\n" )
-
-      if not self.globalOpts_.dryRun :
+      args, cacheKey = self.prepareAction()
+      redirect = self.redirected()
+      content  = None
+
+      if self.cached_ :
+        self.retval_ = 0
+        self.lock_.release()
+      elif self.jobArray_ is not None and not self.globalOpts_.dryRun :
+        # Whichever step of the array goes first submits it for all of them
+        self.retval_, content = self.jobArray_.submit( self )
+        self.lock_.release()
+      elif not self.globalOpts_.dryRun :
         ############################################################################
         ##
         ## Call step
         ##
-        # https://stackoverflow.com/a/18422264
-        logfileOutput = open( self.logfile_, "w+", buffering=1 )
-        if redirect :
+        compression = self.compression()
+        if redirect and compression is None :
           self.log( "Local step will be redirected to logfile {0}".format( self.logfile_ ) )
+          # Hand the logfile directly to the step, no need to pump its output through python
+          LogReader.clear( self.logfile_ )
+          with open( self.logfile_, "wb" ) as logfileOutput :
+            with Profiler.span( "spawn", "step", step=self.name_ ) :
+              proc = subprocess.Popen(
+                                      args,
+                                      cwd   =self.workingDirectory_,
+                                      stdin =subprocess.DEVNULL,
+                                      stdout=logfileOutput,
+                                      stderr=subprocess.STDOUT
+                                      )
+
+            # We are at this point only waiting on the step running, no need to hold others up
+            self.lock_.release()
+            self.retval_ = self.waitLocal( proc )
         else :
-          # Just keep in memory as a string
-          output = io.BytesIO()
-
-        proc = subprocess.Popen(
-                                args,
-                                stdin =subprocess.PIPE,
-                                stdout=subprocess.PIPE,
-                                stderr=subprocess.STDOUT
-                                )
-
-        # We are at this point only reading in the step running, no need to hold others up
-        self.lock_.release()
-
-        for c in iter( lambda: proc.stdout.read(1), b"" ):
-          # Always store in logfile
-          logfileOutput.write( c.decode( 'utf-8', 'replace' ) )
-          logfileOutput.flush()
-          if not redirect :
-            output.write( c )
-            sys.stdout.buffer.write(c)
-            sys.stdout.flush()
-
-        # We don't mind doing this as the process should block us until we are ready to continue
-        dump, err    = proc.communicate()
-        self.retval_ = proc.returncode
+          if redirect :
+            self.log( "Local step will be redirected to {0} compressed logfile {1}".format( compression, self.logfile_ ) )
+          # Only submissions need their output kept in memory to find the job ID
+          output = None
+          if self.submitOptions_.submitType_ != SubmissionType.LOCAL :
+            output = io.BytesIO()
+          # Decode incrementally so multibyte characters split across chunks are not mangled
+          decoder = codecs.getincrementaldecoder( "utf-8" )( errors="replace" )
+
+          with LogReader.LogWriter( self.logfile_, compression ) as logfileOutput :
+            with Profiler.span( "spawn", "step", step=self.name_ ) :
+              proc = subprocess.Popen(
+                                      args,
+                                      cwd   =self.workingDirectory_,
+                                      stdin =subprocess.DEVNULL,
+                                      stdout=subprocess.PIPE,
+                                      stderr=subprocess.STDOUT
+                                      )
+
+            # We are at this point only reading in the step running, no need to hold others up
+            self.lock_.release()
+
+            # Copy in large chunks straight from the pipe, always storing in logfile
+            fd = proc.stdout.fileno()
+            for chunk in iter( lambda: os.read( fd, OUTPUT_CHUNK_SIZE ), b"" ) :
+              logfileOutput.write( chunk )
+              logfileOutput.flush()
+              if output is not None :
+                output.write( chunk )
+              if not redirect :
+                SubmitLogger.raw( decoder.decode( chunk ) )
+
+            if not redirect :
+              SubmitLogger.raw( decoder.decode( b"", final=True ) )
+            proc.stdout.close()
+            self.retval_ = self.waitLocal( proc )
+
+          if output is not None :
+            content = output.getvalue().decode( "utf-8", "replace" )
+            output.close()
         ##
         ## 
         ##
@@ -206,74 +327,197 @@ class Step( SubmitAction ):
       else :
         self.log( "Doing dry-run, no ouptut" )
         self.retval_ = 0
-        output       = "12345"
+        content      = "12345"
         self.lock_.release()
 
-
-      print( "\n", flush=True, end="" )
-      self.log(  "*" * 15 + "{:^15}".format( "STOP " + self.name_ ) + "*" * 15 )
-
-      # if submitted properly
-      if self.retval_ == 0 :
-        # Process output
-        if self.submitOptions_.submitType_ != SubmissionType.LOCAL :
-          content = None
-          if not self.globalOpts_.dryRun :
-            if redirect :
-              output.seek(0)
-              content = output.read()
-            else : 
-              content = output.getvalue().decode( 'utf-8' )
-            output.close()
-          else :
-            content = output
-
-          self.log( "Finding job ID in \"{0}\"".format( content.rstrip() ) )
-          # Find job id
-          self.jobid_ = int( jobidRegex.match( content ).group(1) )
-        else:
-          self.jobid_ = 0
-      else:
-        self.jobid_ = -1
-        msg = "Error: Failed to run step '{0}' exit code {1}".format(
-                                                                      self.name_,
-                                                                      self.retval_ 
-                                                                    )
-        self.log( msg )
-
-        if self.submitOptions_.submitType_ != SubmissionType.LOCAL and not self.globalOpts_.nofatal :
-          raise Exception( msg )
-
-      # If we get this far sign off
-      if self.children_ :
-        self.log( "Notifying children..." )
-        # Step is done and we need to write to other steps so re-acquire the lock for safe writing 
-        # ALSO do this after all error handling so we know we are safe to lock without leaving us in a catatonic state
-        self.lock_.acquire()
-        self.notifyChildren( )
-        self.lock_.release()
-
-      self.log_pop()
-      
-      self.log( "Finished submitting step {0}\n".format( self.name_ ) )
-
-      # Tell our test to wake up and check any changes to states
-      self.wakeTest_.release()
+      self.finishAction( content, cacheKey )
 
     except Exception as e :
         # If we fail, we need to tell our parent test :(
-        self.wakeTest_.release()
+        self.failAction()
         # And release other lock
         self.lock_.release()
         # and propagate the exception
         raise e
 
+  # Blocking work on an event loop goes to a worker thread so other steps keep going,
+  # our output still routed to wherever it goes now
+  @staticmethod
+  async def runBlocking( func, *args ) :
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor( None, contextvars.copy_context().run, func, *args )
+
+  # Same as executeAction() but on an event loop, where many steps share one thread.
+  # Only one of our own calls runs at a time so the step lock is never taken, the
+  # launch lock keeps steps launching in the order they were scheduled in
+  async def executeActionAsync( self, launchLock ) :
+    try :
+      # Hashing inputs and restoring from the step cache touches the filesystem,
+      # without it preparing is quick enough to stay on the loop
+      if self.globalOpts_.cache is not None :
+        async with launchLock :
+          args, cacheKey = await Step.runBlocking( self.prepareAction )
+      else :
+        args, cacheKey = self.prepareAction()
+      redirect = self.redirected()
+      content  = None
+
+      if self.cached_ :
+        self.retval_ = 0
+      elif self.jobArray_ is not None and not self.globalOpts_.dryRun :
+        self.retval_, content = await Step.runBlocking( self.jobArray_.submit, self )
+      elif not self.globalOpts_.dryRun :
+        compression = self.compression()
+        if redirect and compression is None :
+          self.log( "Local step will be redirected to logfile {0}".format( self.logfile_ ) )
+          LogReader.clear( self.logfile_ )
+          with open( self.logfile_, "wb" ) as logfileOutput :
+            with Profiler.span( "spawn", "step", step=self.name_ ) :
+              proc = await asyncio.create_subprocess_exec(
+                                                          *args,
+                                                          cwd   =self.workingDirectory_,
+                                                          stdin =subprocess.DEVNULL,
+                                                          stdout=logfileOutput,
+                                                          stderr=subprocess.STDOUT
+                                                          )
+            self.retval_ = await proc.wait()
+        else :
+          if redirect :
+            self.log( "Local step will be redirected to {0} compressed logfile {1}".format( compression, self.logfile_ ) )
+          output = None
+          if self.submitOptions_.submitType_ != SubmissionType.LOCAL :
+            output = io.BytesIO()
+          decoder = codecs.getincrementaldecoder( "utf-8" )( errors="replace" )
+
+          with LogReader.LogWriter( self.logfile_, compression ) as logfileOutput :
+            with Profiler.span( "spawn", "step", step=self.name_ ) :
+              proc = await asyncio.create_subprocess_exec(
+                                                          *args,
+                                                          cwd   =self.workingDirectory_,
+                                                          stdin =subprocess.DEVNULL,
+                                                          stdout=subprocess.PIPE,
+                                                          stderr=subprocess.STDOUT
+                                                          )
+
+            while True :
+              chunk = await proc.stdout.read( OUTPUT_CHUNK_SIZE )
+              if not chunk :
+                break
+              logfileOutput.write( chunk )
+              logfileOutput.flush()
+              if output is not None :
+                output.write( chunk )
+              if not redirect :
+                SubmitLogger.raw( decoder.decode( chunk ) )
+
+            if not redirect :
+              SubmitLogger.raw( decoder.decode( b"", final=True ) )
+            self.retval_ = await proc.wait()
+
+          if output is not None :
+            content = output.getvalue().decode( "utf-8", "replace" )
+            output.close()
+      else :
+        self.log( "Doing dry-run, no ouptut" )
+        self.retval_ = 0
+        content      = "12345"
+
+      # Storing in the step cache copies the logfile, off the loop as well
+      if cacheKey is not None :
+        await Step.runBlocking( self.finishAction, content, cacheKey )
+      else :
+        self.finishAction( content, cacheKey )
+
+    except Exception as e :
+        self.failAction()
+        raise e
+
+  # Everything after the step has run, content is the output of a submission
+  def finishAction( self, content, cacheKey ) :
+    # Submitted jobs are only finished once the scheduler says so
+    if self.submitOptions_.submitType_ == SubmissionType.LOCAL :
+      self.stopTime_ = time.time()
+
+    SubmitLogger.raw( "\n" )
+    self.log(  "*" * 15 + "{:^15}".format( "STOP " + self.name_ ) + "*" * 15 )
+    self.releaseLocalResources()
+
+    # Only keep results that would pass post-processing
+    if cacheKey is not None and not self.cached_ and self.retval_ == 0 :
+      if re.match( self.globalOpts_.key, SubmitAction.getLastLine( self.logfile_ ) ) is not None :
+        StepCache.instance( self.globalOpts_ ).store( cacheKey, self.logfile_ )
+        self.log( "Stored result {0} in step cache".format( cacheKey ) )
+
+    # if submitted properly
+    if self.retval_ == 0 :
+      # Process output
+      if self.submitOptions_.submitType_ != SubmissionType.LOCAL :
+        self.log( "Finding job ID in \"{0}\"".format( content.rstrip() ) )
+        # Find job id, SLURM prefixes it with "Submitted batch job"
+        self.jobid_ = int( jobidRegex.search( content ).group(1) )
+      else:
+        self.jobid_ = 0
+    else:
+      self.jobid_ = -1
+      msg = "Error: Failed to run step '{0}' exit code {1}".format(
+                                                                    self.name_,
+                                                                    self.retval_ 
+                                                                  )
+      self.log( msg )
+
+      if self.submitOptions_.submitType_ != SubmissionType.LOCAL and not self.globalOpts_.nofatal :
+        raise Exception( msg )
+
+    # If we get this far sign off
+    readyChildren = []
+    if self.children_ :
+      self.log( "Notifying children..." )
+      # Step is done and we need to write to other steps so re-acquire the lock for safe writing 
+      # ALSO do this after all error handling so we know we are safe to lock without leaving us in a catatonic state
+      self.lock_.acquire()
+      readyChildren = self.notifyChildren( )
+      self.lock_.release()
+
+    self.log_pop()
+    
+    self.log( "Finished submitting step {0}\n".format( self.name_ ) )
+
+    # Tell our test we are done and which of our children are now ready to go
+    self.wakeTest_.put( ( self, readyChildren ) )
+
+  def failAction( self ) :
+    self.releaseLocalResources()
+    self.wakeTest_.put( ( self, [] ) )
+
+  def cacheKey( self, args ) :
+    return StepCache.key(
+                          os.path.normpath( os.path.join( self.workingDirectory_, self.command_ ) ),
+                          args + [ self.submitOptions_.submitType_, self.workingDirectory_, self.globalOpts_.key ],
+                          self.inputs_,
+                          self.workingDirectory_
+                          )
+
+  def releaseLocalResources( self ) :
+    if self.heldResources_ is not None :
+      LocalResources.host( self.globalOpts_ ).release( *self.heldResources_ )
+      self.heldResources_ = None
+
   def notifyChildren( self ) :
+    readyChildren = []
     if self.children_ :
       # Go to all children and mark ok
       for child in self.children_ :
         child.depSignOff_[ self.name_ ][ "jobid"  ] = self.jobid_
         child.depSignOff_[ self.name_ ][ "retval" ] = self.retval_
+        child.depSignOff_[ self.name_ ][ "array"  ] = self.jobArray_ is not None
+        child.pendingDeps_ -= 1
+
+        if child.pendingDeps_ == 0 :
+          # All dependencies have job IDs now, so this only needs to be done once
+          _, child.submitOptions_.dependencies_ = child.formatDependencies()
+          readyChildren.append( child )
+
+    return readyChildren
   
   def checkJobComplete( self ) :
     if self.globalOpts_.dryRun :
@@ -283,30 +527,53 @@ class Step( SubmitAction ):
     if self.submitOptions_.submitType_ == SubmissionType.LOCAL :
       self.log( "Step is local run, already finished (why are you here?)" )
       return True
-    else:
-      # Probably different ways to check for PBS/SLURM
-      if self.submitOptions_.submitType_ == SubmissionType.PBS :
-        proc = subprocess.Popen(
-                                [ "qstat", str( self.jobid_ ) ],
-                                stdin =subprocess.PIPE,
-                                stdout=subprocess.PIPE,
-                                stderr=subprocess.PIPE
-                                )
-        output, err = proc.communicate()
-        retVal    = proc.returncode
-        ouptut    = output.decode( "utf-8" )
-        if retVal > 0 or output == "" : # How else to tell if something is complete in PBS?
-          self.log( "Job ID {0} no longer in scheduler queue, assumed complete".format( self.jobid_ ) )
-          return True
-        else :
-          return False
-      elif self.submitOptions_.submitType_ == SubmissionType.SLURM :
-        self.log( "Don't know how to process SLURM job completion, assumed complete" )
-        return True
-    
-    self.log( "Unknown completion, assumed true to avoid infinite loop" )
-    return True
-  
+
+    if self.jobid_ is None or self.jobid_ <= 0 :
+      self.log( "Step has no job ID in scheduler queue, assumed complete" )
+      return True
+
+    status = JobStatus.query(
+                              self.submitOptions_.submitType_,
+                              [ self.jobid_ ],
+                              arrayJobids=[ self.jobid_ ] if self.jobArray_ is not None else [],
+                              print=self.log
+                              )[ self.jobid_ ]
+    if status.complete_ :
+      self.setJobStatus( status )
+    return status.complete_
+
+  # Reap the step ourselves to get its resource usage, which covers every
+  # descendant it waited on as well
+  def waitLocal( self, proc ) :
+    if not hasattr( os, "wait4" ) :
+      return proc.wait()
+
+    while True :
+      try :
+        _, status, usage = os.wait4( proc.pid, 0 )
+        break
+      except InterruptedError :
+        continue
+    proc.returncode = os.waitstatus_to_exitcode( status )
+
+    if self.submitOptions_.submitType_ == SubmissionType.LOCAL :
+      self.usage_ = {
+                      "user"   : usage.ru_utime,
+                      "system" : usage.ru_stime,
+                      # Reported in bytes on macOS, kilobytes everywhere else
+                      "maxrss" : usage.ru_maxrss * ( 1 if sys.platform == "darwin" else 1024 )
+                    }
+    return proc.returncode
+
+  def setJobStatus( self, status ) :
+    self.stopTime_    = time.time()
+    self.jobState_    = status.state_
+    self.jobExitCode_ = status.exitCode_
+    if self.jobState_ is not None :
+      self.log( "Job ID {0} finished with state {1}, exit code {2}".format( self.jobid_, self.jobState_, self.jobExitCode_ ) )
+    else :
+      self.log( "Job ID {0} no longer in scheduler queue, assumed complete".format( self.jobid_ ) )
+
   def reportErrs( self, success, lastline ) :
     if not success :
       errMark = "{banner} {msg} {banner}".format( banner="!" * 10, msg=" ".join( ["ERROR"] * 3 ) )
@@ -335,38 +602,32 @@ class Step( SubmitAction ):
     success = False
 
 
+    self.log( "Checking last line for success <KEY PHRASE> of format '{0}'".format( self.globalOpts_.key ) )
     try :
-      f = open( self.logfile_, "rb" )
-      f.close()
-    except : 
+      lastline = SubmitAction.getLastLine( self.logfile_ )
+    except OSError : 
       msg = "Logfile {0} does not exist, did submission fail?".format( self.logfile_ )
       self.log( msg )
+      self.log_pop()
       return success, msg
 
-    try :
-      self.log( "Checking last line for success <KEY PHRASE> of format '{0}'".format( self.globalOpts_.key ) )
-      lastline = SubmitAction.getLastLine( self.logfile_ )
-      findKey = re.match( self.globalOpts_.key, lastline )
-      success = ( findKey is not None )
-      # self.reportErrs( success, lastline )
-      if success :
-        self.log( SubmitAction.SUCCESS_STR )
-      else :
-        self.log( SubmitAction.FAILURE_STR )
+    findKey = re.match( self.globalOpts_.key, lastline )
+    success = ( findKey is not None )
+    # self.reportErrs( success, lastline )
+    if success :
+      self.log( SubmitAction.SUCCESS_STR )
+    else :
+      self.log( SubmitAction.FAILURE_STR )
 
-    except Exception as e :
-      raise e
     self.log_pop()
     return success, lastline
 
   @staticmethod
   def sortDependencies( steps ) :
-    # stepnames = [ step.name_ for step in steps ]
-
     for stepname, step in steps.items() :
       if step.dependencies_ :
         for depStep in step.dependencies_ :
-          if depStep not in steps.keys() :
+          if depStep not in steps :
             err = "Error: No step name '{0}' to set as dependency for step '{1}'".format( depStep, step.name_ )
             print( err )
             raise Exception( err )
@@ -375,10 +636,25 @@ class Step( SubmitAction ):
             step.depSignOff_[ depStep ] = { "jobid" : None, "retval" : None }
             
             # Add step to parent dependency
-            for parentStep in steps.values() :
-              if parentStep.name_ == depStep :
-                parentStep.children_.append( step )
-                break
-            
-
-
+            steps[ depStep ].children_.append( step )
+
+        step.pendingDeps_ = len( step.depSignOff_ )
+
+    # Make sure every step can eventually run, otherwise we would wait forever
+    inDegree = { stepname : step.pendingDeps_ for stepname, step in steps.items() }
+    ready    = [ stepname for stepname, degree in inDegree.items() if degree == 0 ]
+    visited  = 0
+    while ready :
+      stepname = ready.pop()
+      visited += 1
+      for child in steps[ stepname ].children_ :
+        inDegree[ child.name_ ] -= 1
+        if inDegree[ child.name_ ] == 0 :
+          ready.append( child.name_ )
+
+    if visited != len( steps ) :
+      err = "Error: Circular dependency between steps [ {0} ]".format(
+                                                                      ", ".join( [ stepname for stepname, degree in inDegree.items() if degree > 0 ] )
+                                                                      )
+      print( err )
+      raise Exception( err )
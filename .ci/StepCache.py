@@ -0,0 +1,146 @@
+import os
+import glob
+import time
+import hashlib
+import tempfile
+import threading
+
+from LocalResources import LocalResources
+import LogReader
+
+CACHE_HASH_BLOCK_SIZE = 1024 * 1024
+CACHE_ENTRY_SUFFIX    = ".log"
+SECONDS_PER_DAY       = 24 * 60 * 60
+
+# Content-addressed store of successful LOCAL step logfiles, keyed by everything
+# that goes into running the step so an unchanged step can be skipped
+class StepCache( ) :
+
+  CACHE_LOCK = threading.Lock()
+  CACHE      = None
+
+  def __init__( self, directory, maxSize=None, maxAge=None ) :
+    self.directory_ = os.path.abspath( directory )
+    self.maxSize_   = maxSize
+    self.maxAge_    = maxAge
+    os.makedirs( self.directory_, exist_ok=True )
+
+  # One cache per process, shared by every step running in it
+  @staticmethod
+  def instance( globalOpts ) :
+    with StepCache.CACHE_LOCK :
+      if StepCache.CACHE is None or StepCache.CACHE.directory_ != os.path.abspath( globalOpts.cache ) :
+        StepCache.CACHE = StepCache.fromOptions( globalOpts )
+      return StepCache.CACHE
+
+  @staticmethod
+  def fromOptions( globalOpts ) :
+    return StepCache(
+                      globalOpts.cache,
+                      LocalResources.parseMemory( globalOpts.cacheMaxSize ) if globalOpts.cacheMaxSize is not None else None,
+                      globalOpts.cacheMaxAge * SECONDS_PER_DAY if globalOpts.cacheMaxAge is not None else None
+                      )
+
+  @staticmethod
+  def hashFile( hasher, filename ) :
+    with open( filename, "rb" ) as f :
+      for block in iter( lambda : f.read( CACHE_HASH_BLOCK_SIZE ), b"" ) :
+        hasher.update( block )
+
+  # Files matching the input patterns, directories included recursively
+  @staticmethod
+  def inputFiles( inputs, workingDirectory ) :
+    files = set()
+    for pattern in inputs :
+      matches = glob.glob( os.path.join( workingDirectory, pattern ), recursive=True )
+      if not matches :
+        raise Exception( "Step input '{0}' does not match any files".format( pattern ) )
+      for match in matches :
+        if os.path.isdir( match ) :
+          for root, dirs, filenames in os.walk( match ) :
+            files.update( os.path.join( root, filename ) for filename in filenames )
+        else :
+          files.add( match )
+    return sorted( files )
+
+  # Key from the script contents, all items in parts and the contents of input files
+  @staticmethod
+  def key( script, parts, inputs=[], workingDirectory="." ) :
+    hasher = hashlib.sha256()
+    StepCache.hashFile( hasher, script )
+    for part in parts :
+      hasher.update( b"\0" + str( part ).encode() )
+    for filename in StepCache.inputFiles( inputs, workingDirectory ) :
+      hasher.update( b"\0" + os.path.relpath( filename, workingDirectory ).encode() + b"\0" )
+      StepCache.hashFile( hasher, filename )
+    return hasher.hexdigest()
+
+  def entry( self, key ) :
+    return os.path.join( self.directory_, key[:2], key + CACHE_ENTRY_SUFFIX )
+
+  # Copy a cached logfile into place, returns whether there was one
+  def restore( self, key, logfile ) :
+    entry = self.entry( key )
+    try :
+      with open( entry, "rb" ) as cached :
+        StepCache.writeAtomic( cached, logfile )
+      # Recently used entries are the last to be evicted
+      os.utime( entry )
+      return True
+    except FileNotFoundError :
+      return False
+
+  def store( self, key, logfile ) :
+    entry = self.entry( key )
+    os.makedirs( os.path.dirname( entry ), exist_ok=True )
+    # Entries are always uncompressed so they restore the same whatever the logfile compression
+    with LogReader.openLog( logfile, "rb" ) as output :
+      StepCache.writeAtomic( output, entry )
+
+  # Never leave a partially written file behind for anyone else to pick up
+  @staticmethod
+  def writeAtomic( source, destination ) :
+    fd, tmpfile = tempfile.mkstemp( dir=os.path.dirname( destination ), prefix=".tmp" )
+    try :
+      with os.fdopen( fd, "wb" ) as tmp :
+        for block in iter( lambda : source.read( CACHE_HASH_BLOCK_SIZE ), b"" ) :
+          tmp.write( block )
+      os.replace( tmpfile, destination )
+    except BaseException :
+      os.unlink( tmpfile )
+      raise
+
+  # Drop entries past the max age, then least recently used until under the max size
+  def evict( self, print=print ) :
+    entries = []
+    for entry in glob.glob( os.path.join( self.directory_, "*", "*" + CACHE_ENTRY_SUFFIX ) ) :
+      try :
+        stat = os.stat( entry )
+      except FileNotFoundError :
+        continue
+      entries.append( ( stat.st_mtime, stat.st_size, entry ) )
+    entries.sort()
+
+    now       = time.time()
+    totalSize = sum( size for _, size, _ in entries )
+    evicted   = 0
+    for mtime, size, entry in entries :
+      expired  = self.maxAge_  is not None and now - mtime > self.maxAge_
+      overSize = self.maxSize_ is not None and totalSize > self.maxSize_
+      if not expired and not overSize :
+        break
+      try :
+        os.unlink( entry )
+      except FileNotFoundError :
+        pass
+      totalSize -= size
+      evicted   += 1
+
+    print( "Step cache {0} holds {1} entries ({2}), evicted {3}".format(
+                                                                        self.directory_,
+                                                                        len( entries ) - evicted,
+                                                                        LocalResources.formatMemory( totalSize ),
+                                                                        evicted
+                                                                        )
+          )
+    return evicted
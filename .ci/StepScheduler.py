@@ -0,0 +1,94 @@
+import queue
+import heapq
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+# Runs the steps of many tests in one process under a single concurrency limit,
+# rather than a process per test each with its own threadpool
+class StepScheduler( ) :
+
+  def __init__( self, tests, threadpool ) :
+    self.tests_      = tests
+    self.threadpool_ = threadpool
+    self.notifier_   = queue.SimpleQueue() # Steps of all tests report back here when done
+
+  def run( self, testComplete=None ) :
+    owner    = {}
+    priority = {}
+    for testIdx, test in enumerate( self.tests_ ) :
+      test.setNotifier( self.notifier_ )
+      testPriority = test.stepPriorities()
+      for step in test.steps_.values() :
+        owner[ step ] = test
+        # Ties between tests go to the test listed first
+        priority[ step ] = ( testPriority[ step.name_ ], testIdx, step.name_ )
+
+    # One pool for all steps, post-processing may block waiting on HPC jobs so
+    # it gets its own workers to not eat into the step limit
+    stepExecutor = ThreadPoolExecutor( max_workers=self.threadpool_ )
+    postExecutor = ThreadPoolExecutor( max_workers=len( self.tests_ ) )
+    stepsAlreadyRun = OrderedDict()
+    stepsDone       = { test.name_ : 0 for test in self.tests_ }
+    postProcessing  = {}
+
+    # Ready steps wait here until a worker is free, then go in the requested order
+    queued = []
+    def submitSteps( steps, running ) :
+      for step in steps :
+        heapq.heappush( queued, ( priority[ step ], step ) )
+
+      submitted = 0
+      while queued and running + submitted < self.threadpool_ :
+        _, step = heapq.heappop( queued )
+        if step not in stepsAlreadyRun :
+          stepsAlreadyRun[ step ] = stepExecutor.submit( owner[ step ].runStep, step )
+          submitted += 1
+      return submitted
+
+    def finishTest( test ) :
+      # Results are reported in the order steps were submitted
+      stepOrder = [ step.name_ for step in stepsAlreadyRun if owner[ step ] is test ]
+      postProcessing[ postExecutor.submit( test.runRouted, test.finishSteps, stepOrder ) ] = test
+
+    try :
+      readySteps = []
+      for test in self.tests_ :
+        test.runRouted( test.startSteps )
+        if not test.steps_ :
+          finishTest( test )
+        readySteps.extend( [ step for step in test.steps_.values() if step.runnable() ] )
+
+      # Steps only become ready when a parent finishes, so once nothing is
+      # outstanding every step of every test has run
+      outstanding = submitSteps( readySteps, 0 )
+      while outstanding > 0 :
+        doneStep, readySteps = self.notifier_.get()
+
+        # Make sure the step that woke us up was okay
+        stepsAlreadyRun[ doneStep ].result()
+
+        test = owner[ doneStep ]
+        stepsDone[ test.name_ ] += 1
+        outstanding -= 1
+        outstanding += submitSteps( readySteps, outstanding )
+
+        if stepsDone[ test.name_ ] == len( test.steps_ ) :
+          finishTest( test )
+
+      results = OrderedDict()
+      for future in as_completed( postProcessing ) :
+        test = postProcessing[ future ]
+        results[ test.name_ ] = future.result()
+        if testComplete is not None :
+          testComplete( ( results[ test.name_ ], [ test.name_ ], [ test.logfile_ ] ) )
+
+    except Exception as e :
+      # Kill it all and shut down
+      for future in stepsAlreadyRun.values() : future.cancel()
+      stepExecutor.shutdown( wait=True )
+      postExecutor.shutdown( wait=True )
+      raise e
+    stepExecutor.shutdown( wait=True )
+    postExecutor.shutdown( wait=True )
+
+    return results
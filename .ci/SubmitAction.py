@@ -1,7 +1,7 @@
 import os
-import io
-import copy
 from SubmitOptions import SubmitOptions
+from SubmitLogger  import SubmitLogger, LogLevel
+import LogReader
 import SubmitCommon as sc
 
 
@@ -24,27 +24,41 @@ class SubmitAction( ) :
     self.options_       = options
     # Add 8 for [item::] characters
     self.label_            = "{0:<{1}}".format( "[{0}::{1}] ".format( self.scope(), self.ancestry() ), sc.LABEL_LENGTH + 8 )
-    self.submitOptions_ = copy.deepcopy( defaultSubmitOptions )
+    self.submitOptions_ = defaultSubmitOptions.layer()
 
     self.rootDir_          = rootDir
     self.printDir_         = False
+    # Whether to actually change the process directory or only resolve it
+    self.changeDirectory_  = True
+    self.workingDirectory_ = None
 
     self.parse()
   
+  # CLI options are per process, so they are never stored with a parsed action
+  def __getstate__( self ) :
+    state = self.__dict__.copy()
+    state[ "globalOpts_" ] = None
+    return state
+
+  def setGlobalOpts( self, globalOpts ) :
+    self.globalOpts_ = globalOpts
+
   def ancestry( self ) :
     if self.parent_ :
       return "{0}.{1}".format( self.parent_, self.name_ )
     else :
       return self.name_
 
-  def log( self, *args, **kwargs ) :
-    # https://stackoverflow.com/a/39823534
-    output=io.StringIO()
-    print( *args, file=output, end="", **kwargs )
-    contents = output.getvalue()
-    output.close()
-    print( self.label_ + self.labelIndentation_ * self.labelLevel_ + contents, flush=True )
-    return self.label_ + self.labelIndentation_ * self.labelLevel_ + contents
+  def log( self, *args, level=LogLevel.INFO, sep=" " ) :
+    contents = sep.join( map( str, args ) )
+    message  = self.label_ + self.labelIndentation_ * self.labelLevel_ + contents
+    # Written out in the background, the formatted message is still returned right away
+    SubmitLogger.log( message, level=level, scope=self.scope(), name=self.ancestry(), message=contents )
+    return message
+
+  # Tracing such as argument pack selection, only shown at the most verbose level
+  def log_debug( self, *args, **kwargs ) :
+    return self.log( *args, level=LogLevel.DEBUG, **kwargs )
   
   def log_push( self, levels=1 ) :
     self.labelLevel_ += levels
@@ -92,17 +106,26 @@ class SubmitAction( ) :
     # Set directory
     self.log( "Running from root directory {0}".format( self.rootDir_ ) )
 
-    os.chdir( self.rootDir_ )
-    if self.submitOptions_.workingDirectory_ is not None :
-      if self.printDir_ :
-        self.log( "Setting working directory to {0}".format( self.submitOptions_.workingDirectory_ ) )
-      os.chdir( self.submitOptions_.workingDirectory_ )
+    if self.submitOptions_.workingDirectory_ is not None and self.printDir_ :
+      self.log( "Setting working directory to {0}".format( self.submitOptions_.workingDirectory_ ) )
+
+    self.workingDirectory_ = self.resolveWorkingDirectory()
+    if self.changeDirectory_ :
+      os.chdir( self.workingDirectory_ )
     
     if self.printDir_ :
-      self.log( "Current directory : {0}".format( os.getcwd() ) )
+      self.log( "Current directory : {0}".format( self.workingDirectory_ ) )
 
     self.log_pop()
   
+  def resolveWorkingDirectory( self ) :
+    workingDirectory = self.rootDir_
+    if self.submitOptions_.workingDirectory_ is not None :
+      workingDirectory = os.path.join( self.rootDir_, self.submitOptions_.workingDirectory_ )
+
+    # Resolve the same way changing into it would, symlinks included
+    return os.path.realpath( workingDirectory )
+
   def prepExecuteAction( self ) :
     pass
 
@@ -113,15 +136,4 @@ class SubmitAction( ) :
   
   @staticmethod
   def getLastLine( filename ) :
-    lastline = None
-    with open( filename, "rb" ) as f :
-      # https://stackoverflow.com/a/54278929
-      try:  # catch OSError in case of a one line file 
-        f.seek( -2, os.SEEK_END )
-        while f.read(1) != b'\n' :
-          f.seek( -2, os.SEEK_CUR )
-      except OSError:
-          f.seek(0)
-      lastline = f.readline().decode()
-
-    return lastline.rstrip()
+    return LogReader.lastLine( filename )
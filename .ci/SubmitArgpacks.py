@@ -1,4 +1,5 @@
 import re
+import copy
 from collections import OrderedDict
 
 import SubmitCommon as sc
@@ -8,6 +9,12 @@ class SubmitArgpacks( ) :
   ARGUMENTS_ORIGIN_KEY = "arguments_origin"
   REGEX_DELIMETER      = "::"
 
+  # The same argpack keys are copied into every step, so each is only split and
+  # compiled once per process : argpack -> ( compiled scope regex or None, name )
+  ARGPACK_INDEX  = {}
+  # ( argpack keys, ancestry, sorted ) -> argpacks that apply at that ancestry
+  ANCESTRY_INDEX = {}
+
   def __init__( self, arguments, origin=None ) :
     self.arguments_        = arguments
     self.origins_          = {}
@@ -18,12 +25,18 @@ class SubmitArgpacks( ) :
     # Internal control for forcing uniqueness
     self.unique_           = False
 
+    # Whether arguments and origins still belong to the argpacks this was layered from
+    self.shared_           = False
+
     self.parse( origin=origin )
 
   def parse( self, origin=None ):
     if origin is not None :
       self.origins_ = { argKey : origin for argKey in self.arguments_.keys() }
 
+    for argpack in self.arguments_.keys() :
+      SubmitArgpacks.indexArgpack( argpack )
+
     # Now call child parse
     self.parseSpecificOptions( origin )
 
@@ -35,12 +48,40 @@ class SubmitArgpacks( ) :
   def setName( self, name ) :
     self.name_ = name
 
+  # A view of these argpacks for a nested action, sharing arguments until changed
+  def layer( self ) :
+    child = copy.copy( self )
+    child.shared_ = True
+    return child
+
+  # Take our own copy of anything shared before changing it
+  def unshare( self ) :
+    if self.shared_ :
+      self.arguments_ = copy.deepcopy( self.arguments_ )
+      self.origins_   = dict( self.origins_ )
+      self.shared_    = False
+
+  @staticmethod
+  def indexArgpack( argpack ) :
+    if argpack not in SubmitArgpacks.ARGPACK_INDEX :
+      scopeRegex = None
+      if SubmitArgpacks.REGEX_DELIMETER in argpack :
+        # Take everything before :: and treat it as a regex to match ancestry
+        scopeRegex = re.compile( argpack.split( SubmitArgpacks.REGEX_DELIMETER )[0] )
+      SubmitArgpacks.ARGPACK_INDEX[argpack] = ( scopeRegex, argpack.split( SubmitArgpacks.REGEX_DELIMETER )[-1] )
+    return SubmitArgpacks.ARGPACK_INDEX[argpack]
+
+  @staticmethod
+  def argpackName( argpack ) :
+    return SubmitArgpacks.indexArgpack( argpack )[1]
+
   # Updates and overrides current with values from rhs if they exist
   def update( self, rhs, print=print ) :
     # Should be set via the step
     if rhs.name_                is not None : self.name_             = rhs.name_
 
     # This keeps things consistent but should not affect anything
+    self.unshare()
     sc.recursiveUpdate( self.arguments_, rhs.arguments_ )
     sc.recursiveUpdate( self.origins_,   rhs.origins_   )
 
@@ -48,15 +89,13 @@ class SubmitArgpacks( ) :
 
   def keyExists( self, rawkey ) :
     # dictionaries already handle key exist checks, this is for matching regex
-    key = rawkey.split( SubmitArgpacks.REGEX_DELIMETER )[-1]
+    key = SubmitArgpacks.argpackName( rawkey )
     
     exists = False
     occurrences = OrderedDict()
 
     for argpack in self.arguments_.keys() :
-      argpackName = argpack.split( SubmitArgpacks.REGEX_DELIMETER )[-1]
-
-      if key == argpackName :
+      if key == SubmitArgpacks.argpackName( argpack ) :
         exists = True
         if self.origins_ :
           occurrences[argpack] = self.origins_[argpack]
@@ -69,12 +108,14 @@ class SubmitArgpacks( ) :
     if not self.unique_ :
       return
 
+    # Group by name in one pass rather than searching all argpacks for each one
+    allOccurrences = OrderedDict()
     for argpack in self.arguments_.keys() :
-      # of course our key exists, but HOW much
-      _, occurrences = self.keyExists( argpack )
+      occurrences = allOccurrences.setdefault( SubmitArgpacks.argpackName( argpack ), OrderedDict() )
+      occurrences[argpack] = self.origins_[argpack] if self.origins_ else "unknown"
 
+    for argpackName, occurrences in allOccurrences.items() :
       if len( occurrences ) > 1 :
-        argpackName = argpack.split( SubmitArgpacks.REGEX_DELIMETER )[-1]
         err = "Argument pack {root} at {conflict} '{offender}' name conflict with '{argpack}', declared at {origin}".format(
                 root=argpackName,
                 offender=list(occurrences.keys())[1],
@@ -86,34 +127,33 @@ class SubmitArgpacks( ) :
         raise Exception( err )
 
 
+  # Names of all argument packs that match our ancestry, only resolved once for
+  # any set of argpacks and ancestry. Values are always taken from this instance
+  def ancestryArgpacks( self, sortArgpacks=True ) :
+    indexKey = ( tuple( self.arguments_.keys() ), self.name_, sortArgpacks )
+    argpacksToUse = SubmitArgpacks.ANCESTRY_INDEX.get( indexKey )
+
+    if argpacksToUse is None :
+      argpacksToUse = []
+      for argpack in self.arguments_.keys() :
+        scopeRegex, _ = SubmitArgpacks.indexArgpack( argpack )
+        # Generic packs always apply, scope-specific ones must match
+        if scopeRegex is None or scopeRegex.match( self.name_ ) is not None :
+          argpacksToUse.append( argpack )
+
+      if sortArgpacks :
+        argpacksToUse.sort( key=SubmitArgpacks.argpackName )
+      SubmitArgpacks.ANCESTRY_INDEX[indexKey] = argpacksToUse
+
+    return argpacksToUse
+
   def selectAncestrySpecificSubmitArgpacks( self, sortArgpacks=True, print=print ) :
-    # Find all argument packs that match our ancestry
-    argpacksToUse = OrderedDict()
+    argpacksToUse = self.ancestryArgpacks( sortArgpacks )
 
-    for argpack in self.arguments_.keys() :
-      if SubmitArgpacks.REGEX_DELIMETER in argpack :
-        # print( "Checking scope-specific argument pack {0}".format( argpack ) )
-        # Take everything before :: and treat it as a regex to match ancestry
-        scopeRegex = argpack.split( SubmitArgpacks.REGEX_DELIMETER )[0]
-        if re.match( scopeRegex, self.name_ ) is not None :
-          argpacksToUse[argpack] = self.arguments_[argpack]
-      else :
-        # Generic pack, send it off!
-        argpacksToUse[argpack] = self.arguments_[argpack]
-
-    finalArgpacksToUse = argpacksToUse
-    if sortArgpacks : 
-      finalArgpacksToUse = OrderedDict( 
-                                  sorted(
-                                          argpacksToUse.items(),
-                                          key=lambda pack : pack[0].split( SubmitArgpacks.REGEX_DELIMETER )[-1]
-                                          )
-                                  )
-    
-    finalArgpacks = SubmitArgpacks( finalArgpacksToUse )
+    finalArgpacks = SubmitArgpacks( OrderedDict( ( argpack, self.arguments_[argpack] ) for argpack in argpacksToUse ) )
     finalArgpacks.origins_ = { 
                                 key : self.origins_[key]
-                                for key in argpacksToUse.keys()
+                                for key in argpacksToUse
                               }
     
     return finalArgpacks
@@ -1,5 +1,7 @@
 # https://stackoverflow.com/a/3233356
 import collections.abc
+import contextlib
+import contextvars
 from enum import Enum
 LABEL_LENGTH = 32
 
@@ -30,3 +32,38 @@ class SubmitParentParseException( Exception ) :
   def __init__( self, msg ) :
     super( Exception, self ).__init__( msg )
 
+
+
+# Where stdout should go for the current thread/task, None meaning the router default
+STDOUT_ROUTE = contextvars.ContextVar( "STDOUT_ROUTE", default=None )
+
+# A stand-in for sys.stdout that sends output to the stream routed for the current
+# context, allowing many tests to share one process and still have their own stdout
+class StdoutRouter( ) :
+  def __init__( self, default ) :
+    self.default_ = default
+
+  def current( self ) :
+    stream = STDOUT_ROUTE.get()
+    return stream if stream is not None else self.default_
+
+  def write( self, s ) :
+    return self.current().write( s )
+
+  def flush( self ) :
+    return self.current().flush()
+
+  def __getattr__( self, name ) :
+    return getattr( self.current(), name )
+
+# Route stdout for the current context, only effective when sys.stdout is a StdoutRouter
+@contextlib.contextmanager
+def routeStdout( stream ) :
+  if stream is None :
+    yield
+    return
+  token = STDOUT_ROUTE.set( stream )
+  try :
+    yield
+  finally :
+    STDOUT_ROUTE.reset( token )
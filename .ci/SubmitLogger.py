@@ -0,0 +1,157 @@
+import os
+import sys
+import atexit
+import json
+import time
+import queue
+import threading
+from enum import Enum
+
+import SubmitCommon as sc
+
+# Most messages written out in one go before flushing
+LOG_BATCH_SIZE = 1024
+
+class LogLevel( Enum ):
+  DEBUG   = "debug"   # argument pack tracing
+  INFO    = "info"
+  WARNING = "warning"
+  ERROR   = "error"
+
+  def __str__( self ) :
+    return self.value
+
+  def enabled( self, threshold ) :
+    levels = list( LogLevel )
+    return levels.index( self ) >= levels.index( threshold )
+
+# All output of a process goes through one queue to a background writer, so callers
+# never wait on the console or a shared filesystem and output stays in call order
+class SubmitLogger( ) :
+
+  LOGGER_LOCK = threading.Lock()
+  LOGGER      = None
+
+  def __init__( self, level=LogLevel.DEBUG, jsonFile=None ) :
+    self.level_    = level
+    self.jsonFile_ = jsonFile
+    self.json_     = open( jsonFile, "a" ) if jsonFile is not None else None
+    self.queue_    = queue.SimpleQueue()
+    self.writer_   = threading.Thread( target=self.write, name="SubmitLogger", daemon=True )
+    self.writer_.start()
+
+  # One logger per process, configured once from the CLI options
+  @staticmethod
+  def configure( level=LogLevel.DEBUG, jsonFile=None ) :
+    with SubmitLogger.LOGGER_LOCK :
+      logger = SubmitLogger.LOGGER
+      if logger is not None and logger.jsonFile_ == jsonFile :
+        # Processes may run many suites, no need for a new writer each time
+        logger.level_ = level
+        return logger
+      if logger is not None :
+        logger.close()
+      SubmitLogger.LOGGER = SubmitLogger( level, jsonFile )
+    return SubmitLogger.LOGGER
+
+  @staticmethod
+  def instance() :
+    if SubmitLogger.LOGGER is None :
+      SubmitLogger.configure()
+    return SubmitLogger.LOGGER
+
+  # Forked processes start without the writer thread, pending output is the parent's to write
+  @staticmethod
+  def reset() :
+    SubmitLogger.LOGGER_LOCK = threading.Lock()
+    SubmitLogger.LOGGER      = None
+
+  # Where output would go right now if printed, following any stdout routing
+  @staticmethod
+  def stdout() :
+    stream = sys.stdout
+    if isinstance( stream, sc.StdoutRouter ) :
+      stream = stream.current()
+    return stream
+
+  @staticmethod
+  def log( text, level=LogLevel.INFO, scope=None, name=None, message=None ) :
+    logger = SubmitLogger.instance()
+    if not level.enabled( logger.level_ ) :
+      return
+    record = None
+    if logger.json_ is not None :
+      record = { "time" : time.time(), "pid" : os.getpid(), "level" : str( level ), "scope" : scope, "name" : name, "message" : message if message is not None else text }
+    logger.queue_.put( ( SubmitLogger.stdout(), text + "\n", record ) )
+
+  # Raw output, such as step output shown inline, kept in order with everything logged
+  @staticmethod
+  def raw( text ) :
+    SubmitLogger.instance().queue_.put( ( SubmitLogger.stdout(), text, None ) )
+
+  # Wait until everything logged so far has been written out
+  @staticmethod
+  def flush() :
+    logger = SubmitLogger.LOGGER
+    if logger is None or not logger.writer_.is_alive() or threading.current_thread() is logger.writer_ :
+      return
+    done = threading.Event()
+    logger.queue_.put( done )
+    done.wait()
+
+  def close( self ) :
+    SubmitLogger.flush()
+    # Let the writer finish
+    self.queue_.put( None )
+    self.writer_.join()
+    if self.json_ is not None :
+      self.json_.close()
+      self.json_ = None
+
+  def write( self ) :
+    while True :
+      batch = [ self.queue_.get() ]
+      while len( batch ) < LOG_BATCH_SIZE :
+        try :
+          batch.append( self.queue_.get_nowait() )
+        except queue.Empty :
+          break
+
+      streams = []
+      records = []
+      for entry in batch :
+        if entry is None :
+          self.flushStreams( streams, records )
+          return
+        if isinstance( entry, threading.Event ) :
+          self.flushStreams( streams, records )
+          streams, records = [], []
+          entry.set()
+          continue
+
+        stream, text, record = entry
+        try :
+          stream.write( text )
+        except ( ValueError, OSError ) :
+          # Stream was closed under us, nothing left to do with this output
+          continue
+        if stream not in streams :
+          streams.append( stream )
+        if record is not None :
+          records.append( record )
+
+      self.flushStreams( streams, records )
+
+  def flushStreams( self, streams, records ) :
+    for stream in streams :
+      try :
+        stream.flush()
+      except ( ValueError, OSError ) :
+        pass
+    if records and self.json_ is not None :
+      self.json_.write( "".join( json.dumps( record ) + "\n" for record in records ) )
+      self.json_.flush()
+
+atexit.register( SubmitLogger.flush )
+if hasattr( os, "register_at_fork" ) :
+  os.register_at_fork( before=SubmitLogger.flush, after_in_child=SubmitLogger.reset )
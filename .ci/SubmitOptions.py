@@ -1,12 +1,14 @@
 import copy
 import re
+import math
 import heapq
-from collections import OrderedDict
+from collections import OrderedDict, ChainMap
 from datetime import timedelta
 
 import SubmitCommon as sc
 from SubmitArgpacks import SubmitArgpacks
 from HpcArgpacks    import HpcArgpacks
+from LocalResources import LocalResources, HPC_CPU_RESOURCES, HPC_MEMORY_RESOURCES
 
 
 PBS_RESOURCE_REGEX_STR = r"(?P<start>[ ]*-l[ ]+)?(?P<res>\w+)=(?P<amount>.*?)(?=:|[ ]*-l[ ]|$)"
@@ -17,6 +19,15 @@ PBS_TIMELIMIT_REGEX_STR    = r"^(?P<hh>\d+):(?P<mm>\d+):(?P<ss>\d+)$"
 PBS_TIMELIMIT_REGEX        = re.compile( PBS_TIMELIMIT_REGEX_STR )
 PBS_TIMELIMIT_FORMAT_STR   = "{:02}:{:02}:{:02}"
 
+# minutes, minutes:seconds, hours:minutes:seconds, days-hours, days-hours:minutes, days-hours:minutes:seconds
+SLURM_TIMELIMIT_REGEX_STR  = r"^(?:(?P<dd>\d+)-(?P<dh>\d+)(?::(?P<dm>\d+)(?::(?P<ds>\d+))?)?|(?P<t0>\d+)(?::(?P<t1>\d+)(?::(?P<t2>\d+))?)?)$"
+SLURM_TIMELIMIT_REGEX      = re.compile( SLURM_TIMELIMIT_REGEX_STR )
+SLURM_TIMELIMIT_FORMAT_STR = "{}-{:02}:{:02}:{:02}"
+
+# Keys allowed in "local_resources", or this value to reuse "hpc_arguments"
+LOCAL_RESOURCES_KEYS     = [ "cpus", "memory" ]
+LOCAL_RESOURCES_FROM_HPC = "hpc_arguments"
+
 
 
 class SubmitOptions( ) :
@@ -27,6 +38,7 @@ class SubmitOptions( ) :
     self.queue_             = None
     self.timelimit_         = None
     self.wait_              = None
+    self.localResources_    = None
     
     # Should be set at test level 
     self.debug_             = None
@@ -40,6 +52,8 @@ class SubmitOptions( ) :
     self.name_             = None
     self.dependencies_     = None
     self.logfile_          = None
+    # Index range when submitted as a job array, logfile_ is then a prefix per index
+    self.array_            = None
 
     self.hpcArguments_     = HpcArgpacks   ( OrderedDict() )
     self.arguments_        = SubmitArgpacks( OrderedDict() )
@@ -47,6 +61,9 @@ class SubmitOptions( ) :
     # Allow host-specific submit options
     self.isHostSpecific_      = isHostSpecific
     self.hostSpecificOptions_ = {}
+
+    # Whether host-specific options still belong to the options this was layered from
+    self.shared_              = False
     self.parse( origin=origin, print=print )
 
   def parse( self, print=print, origin=None ):
@@ -77,6 +94,19 @@ class SubmitOptions( ) :
       submitKeys.append( key )
       if key in self.submit_ :
         self.hpcArguments_.update( HpcArgpacks( self.submit_[ key ], origin ), print )
+
+      key = "local_resources"
+      submitKeys.append( key )
+      if key in self.submit_ :
+        self.localResources_ = self.submit_[ key ]
+        if self.localResources_ != LOCAL_RESOURCES_FROM_HPC :
+          if not isinstance( self.localResources_, dict ) :
+            raise Exception( "Local resources must be a dict of [ {0} ] or '{1}'".format( ", ".join( LOCAL_RESOURCES_KEYS ), LOCAL_RESOURCES_FROM_HPC ) )
+          for resource, amount in self.localResources_.items() :
+            if resource not in LOCAL_RESOURCES_KEYS :
+              raise Exception( "Unknown local resource '{0}', must be one of [ {1} ]".format( resource, ", ".join( LOCAL_RESOURCES_KEYS ) ) )
+          if "memory" in self.localResources_ and LocalResources.parseMemory( self.localResources_[ "memory" ] ) is None :
+            raise Exception( "Unable to parse local resource memory '{0}'".format( self.localResources_[ "memory" ] ) )
       
       key = "arguments"
       submitKeys.append( key )
@@ -116,6 +146,7 @@ class SubmitOptions( ) :
     if rhs.queue_               is not None : self.queue_             = rhs.queue_
     if rhs.timelimit_           is not None : self.timelimit_         = rhs.timelimit_
     if rhs.wait_                is not None : self.wait_              = rhs.wait_
+    if rhs.localResources_      is not None : self.localResources_    = rhs.localResources_
     
     # Should be set at test level 
     # Never do this so children cannot override parent
@@ -133,16 +164,43 @@ class SubmitOptions( ) :
     if rhs.hpcArguments_.arguments_         : self.hpcArguments_.update( rhs.hpcArguments_, print=print )    
     if rhs.arguments_.arguments_            : self.arguments_   .update( rhs.arguments_, print=print )
 
+    if rhs.hostSpecificOptions_ and self.shared_ :
+      self.hostSpecificOptions_ = dict( self.hostSpecificOptions_ )
+      self.shared_              = False
+
     for rhsHostOpt in rhs.hostSpecificOptions_ :
       if rhsHostOpt in self.hostSpecificOptions_ :
+        self.hostSpecificOptions_[rhsHostOpt] = self.hostSpecificOptions_[rhsHostOpt].layer()
         self.hostSpecificOptions_[rhsHostOpt].update( rhs.hostSpecificOptions_[rhsHostOpt] )
       else :
-        self.hostSpecificOptions_[rhsHostOpt] = copy.deepcopy( rhs.hostSpecificOptions_[rhsHostOpt] )
+        self.hostSpecificOptions_[rhsHostOpt] = rhs.hostSpecificOptions_[rhsHostOpt].layer()
 
 
-    # This keeps things consistent but should not affect anything
-    sc.recursiveUpdate( self.submit_, rhs.submit_ )
+    # This keeps things consistent but should not affect anything, only the
+    # overriding keys are held here and the rest resolve through the parents
+    if isinstance( self.submit_, ChainMap ) :
+      self.submit_ = self.submit_.new_child( rhs.submit_ )
+    else :
+      self.submit_ = ChainMap( rhs.submit_, self.submit_ )
     # self.parse( print=print )
+
+  # A view of these options for a nested action, anything not overridden by the
+  # nested action is shared with us rather than copied
+  def layer( self ) :
+    child = copy.copy( self )
+    child.hpcArguments_ = self.hpcArguments_.layer()
+    child.arguments_    = self.arguments_.layer()
+    child.shared_       = True
+    return child
+
+  # All layers of the raw submit options merged, as one dict
+  def resolvedSubmit( self ) :
+    if not isinstance( self.submit_, ChainMap ) :
+      return self.submit_
+    resolved = {}
+    for submit in reversed( self.submit_.maps ) :
+      sc.recursiveUpdate( resolved, submit )
+    return resolved
   
   # Check non-optional fields
   def validate( self, print=print ) :
@@ -176,20 +234,18 @@ class SubmitOptions( ) :
     self.arguments_.setName( name )
     self.hpcArguments_.setName( name )
 
-    for hostOpt in self.hostSpecificOptions_.values() :
-      hostOpt.setName( name )
-
   def selectHostSpecificSubmitOptions( self, host=None, print=print ) :
 
     # Have to do string matching rather than in dict
     hostSpecificOptKey = next( ( hostOpt for hostOpt in self.hostSpecificOptions_ if hostOpt in host ), None )
 
-    # Quickly generate a stand-in SubmitOptions in spitting image
-    currentSubmitOptions = copy.deepcopy( self )
+    # Host-specifics are a thin layer over the current options
+    currentSubmitOptions = self.layer()
 
     if hostSpecificOptKey is not None :
-      # Update with host-specifics
+      # Update with host-specifics, which are shared by every action and never named
       currentSubmitOptions.update( self.hostSpecificOptions_[ hostSpecificOptKey ], print )
+      currentSubmitOptions.setName( self.name_ )
 
     return currentSubmitOptions
 
@@ -206,14 +262,18 @@ class SubmitOptions( ) :
                         "queue"  : "-q {0}", "account"    : "-A {0}",
                         "output" : "-j oe -o {0}",
                         "time"   : "-l walltime={0}",
-                        "wait"   : "-W block=true" }
+                        "wait"   : "-W block=true",
+                        "array"  : "-J {0}",
+                        "arrayOutput" : "-j oe -o {0}.^array_index^.log" }
     elif self.submitType_ == sc.SubmissionType.SLURM :
-      submitDict    = { "submit" : "sbtach", "arguments"  : "{0}",
+      submitDict    = { "submit" : "sbatch", "arguments"  : "{0}",
                         "name"   : "-J {0}", "dependency" : "-d {0}",
                         "queue"  : "-p {0}", "account"    : "-A {0}",
-                        "output" : "-j -o {0}",
+                        "output" : "-o {0}",
                         "time"   : "-t {0}",
-                        "wait"   : "-W" }
+                        "wait"   : "-W",
+                        "array"  : "--array={0}",
+                        "arrayOutput" : "-o {0}.%a.log" }
     elif self.submitType_ == sc.SubmissionType.LOCAL :
       submitDict    = { "submit" : "",       "arguments"  : "",
                         "name"   : "",       "dependency" : "",
@@ -258,7 +318,10 @@ class SubmitOptions( ) :
       # Set via step
       if self.name_ is not None :
         cmd.extend( submitDict[ "name"   ].format( self.name_ ).split( " " ) )
-        cmd.extend( submitDict[ "output" ].format( self.logfile_ ).split( " " ) )
+        cmd.extend( submitDict[ "output" if self.array_ is None else "arrayOutput" ].format( self.logfile_ ).split( " " ) )
+
+      if self.array_ is not None :
+        cmd.extend( submitDict[ "array" ].format( self.array_ ).split( " " ) )
 
 
       if self.dependencies_ is not None :
@@ -277,6 +340,7 @@ class SubmitOptions( ) :
               "hpc_arguments"     : self.hpcArguments_,
               "timelimit"         : self.timelimit_,
               "wait"              : self.wait_,
+              "local_resources"   : self.localResources_,
               "submitType"        : self.submitType_,
               "lockSubmitType"    : self.lockSubmitType_,
               "debug"             : self.debug_,
@@ -284,17 +348,48 @@ class SubmitOptions( ) :
               "name"              : self.name_,
               "dependencies"      : self.dependencies_,
               "arguments"         : self.arguments_,
-              "union_parse"       : self.submit_ }
+              "union_parse"       : self.resolvedSubmit() }
 
     return str( output )
 
+  # Cpus and memory in bytes a LOCAL run needs on this host, None if never declared
+  def getLocalResources( self ) :
+    if self.localResources_ is None :
+      return None
+
+    cpus   = None
+    memory = None
+    if self.localResources_ == LOCAL_RESOURCES_FROM_HPC :
+      # Whatever a single node of the HPC request would have been given
+      if self.hpcArguments_.arguments_ :
+        hpcArguments = self.hpcArguments_.selectAncestrySpecificSubmitArgpacks( print=lambda *args : None )
+        for nestedArgs in hpcArguments.nestedArguments_.values() :
+          for res, amount in nestedArgs.arguments_.items() :
+            res = res.split( SubmitArgpacks.REGEX_DELIMETER )[-1]
+            if amount == "" :
+              continue
+            if cpus is None and res in HPC_CPU_RESOURCES :
+              cpus = int( amount )
+            elif memory is None and res in HPC_MEMORY_RESOURCES :
+              memory = LocalResources.parseMemory( amount )
+    else :
+      cpus   = self.localResources_.get( "cpus" )
+      memory = self.localResources_.get( "memory" )
+      if memory is not None :
+        memory = LocalResources.parseMemory( memory )
+
+    if cpus is None and memory is None :
+      return None
+    return int( cpus ) if cpus is not None else 0, memory if memory is not None else 0
+
   @staticmethod
   def parseTimelimit( timelimit, submitType ) :
+    if timelimit is None :
+      return None
+
     timeMatch = None
-    if submitType == sc.SubmissionType.PBS :
+    if submitType == sc.SubmissionType.PBS or submitType == sc.SubmissionType.LOCAL :
       timeMatch = PBS_TIMELIMIT_REGEX.match( timelimit )
-    elif submitType == sc.SubmissionType.SLURM :
-      pass
     if timeMatch is not None :
       timeGroups = timeMatch.groupdict()
       return timedelta(
@@ -302,17 +397,39 @@ class SubmitOptions( ) :
                         minutes=int( timeGroups["mm"] ),
                         seconds=int( timeGroups["ss"] )
                       )
-    else :
-      return None
+
+    # LOCAL steps may carry a timelimit written for either scheduler
+    if submitType == sc.SubmissionType.SLURM or submitType == sc.SubmissionType.LOCAL :
+      timeMatch = SLURM_TIMELIMIT_REGEX.match( timelimit )
+    if timeMatch is not None :
+      timeGroups = { k : int( v ) for k, v in timeMatch.groupdict().items() if v is not None }
+      if "dd" in timeGroups :
+        return timedelta(
+                          days   =timeGroups["dd"],
+                          hours  =timeGroups["dh"],
+                          minutes=timeGroups.get( "dm", 0 ),
+                          seconds=timeGroups.get( "ds", 0 )
+                        )
+      elif "t2" in timeGroups :
+        return timedelta( hours=timeGroups["t0"], minutes=timeGroups["t1"], seconds=timeGroups["t2"] )
+      else :
+        return timedelta( minutes=timeGroups["t0"], seconds=timeGroups.get( "t1", 0 ) )
+
+    return None
   
   @staticmethod
   def formatTimelimit( timelimit, submitType ) :
-    totalSeconds = timelimit.total_seconds()
-    if submitType == sc.SubmissionType.PBS :
-      return '{:02}:{:02}:{:02}'.format(
-                                        int(totalSeconds//3600),
-                                        int(totalSeconds%3600//60),
-                                        int(totalSeconds%60)
-                                        )
+    totalSeconds = int( math.ceil( timelimit.total_seconds() ) )
+    if submitType == sc.SubmissionType.PBS or submitType == sc.SubmissionType.LOCAL :
+      return PBS_TIMELIMIT_FORMAT_STR.format(
+                                              totalSeconds//3600,
+                                              totalSeconds%3600//60,
+                                              totalSeconds%60
+                                              )
     elif submitType == sc.SubmissionType.SLURM :
-      return None
+      return SLURM_TIMELIMIT_FORMAT_STR.format(
+                                                totalSeconds//86400,
+                                                totalSeconds%86400//3600,
+                                                totalSeconds%3600//60,
+                                                totalSeconds%60
+                                                )
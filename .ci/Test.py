@@ -2,23 +2,30 @@ import os
 import sys
 import json
 import time
-import copy
+import heapq
 from collections import OrderedDict
 from datetime import timedelta
 import threading
+import queue
 from concurrent.futures import ThreadPoolExecutor
 
-from SubmitCommon  import SubmissionType
+from SubmitCommon  import SubmissionType, routeStdout
 from SubmitAction  import SubmitAction
 from SubmitOptions import SubmitOptions
 from Step          import Step
 from HpcArgpacks   import HpcArgpacks
-
-HPC_DELAY_PERIOD_SECONDS =  60
-HPC_POLL_PERIOD_SECONDS  = 120
+from JobStatus     import JobStatus, PollInterval, HPC_POLL_UNKNOWN_MAX
+from JobArray      import JobArray
+from JobSimulator  import JobSimulator, SimJob
+from RuntimeHistory import RuntimeHistory
+from Profiler      import Profiler
+from SubmitLogger  import LogLevel
 
 class Test( SubmitAction ):
 
+  # Keys a test may define besides "submit_options"
+  OPTION_KEYS = [ "steps" ]
+
   def scope( self ) :
     return "test"
   
@@ -26,14 +33,12 @@ class Test( SubmitAction ):
     self.steps_         = {}
     self.waitResults_    = False
     self.multiStepLock_  = threading.Lock()
-    self.stepNotifier_   = threading.Semaphore( 0 ) # Starts unable to acquire
+    self.stepNotifier_   = queue.SimpleQueue() # Steps report back here when done
+    self.stdout_         = None # Where this test's output goes when sharing a process with other tests
     super().__init__( name, options, defaultSubmitOptions, globalOpts, parent, rootDir )
 
   def parseSpecificOptions( self ) :
-    optionKeys = []
-
     key = "steps"
-    optionKeys.append( key )
     if key in self.options_ :
       if key == "results" :
         msg = "Keyword 'results' not allowed as step name, reason: reserved"
@@ -54,55 +59,130 @@ class Test( SubmitAction ):
     # Now that steps are fully parsed, attempt to organize dependencies
     Step.sortDependencies( self.steps_ )
 
-    return optionKeys
+    return list( Test.OPTION_KEYS )
+
+  # Cheap check of the layout of an unparsed test, returns a list of problems found
+  @staticmethod
+  def checkStructure( name, options ) :
+    if not isinstance( options, dict ) :
+      return [ "Test '{0}' must be an object".format( name ) ]
+
+    errors = [ "Invalid key in test '{0}' : {1}".format( name, key ) for key in options if key not in Test.OPTION_KEYS + [ "submit_options" ] ]
+    steps  = options.get( "steps", {} )
+    if not isinstance( steps, dict ) :
+      return errors + [ "Steps of test '{0}' must be an object".format( name ) ]
+
+    for stepname, stepDict in steps.items() :
+      if not isinstance( stepDict, dict ) :
+        errors.append( "Step '{0}.{1}' must be an object".format( name, stepname ) )
+        continue
+      errors.extend( [ "Invalid key in step '{0}.{1}' : {2}".format( name, stepname, key ) for key in stepDict if key not in Step.OPTION_KEYS + [ "submit_options" ] ] )
+      for depStep in stepDict.get( "dependencies", {} ) :
+        if depStep not in steps :
+          errors.append( "No step name '{0}' to set as dependency for step '{1}.{2}'".format( depStep, name, stepname ) )
+    return errors
+
+  def __getstate__( self ) :
+    state = super().__getstate__()
+    for unpicklable in [ "multiStepLock_", "stepNotifier_", "stdout_" ] :
+      state[ unpicklable ] = None
+    return state
+
+  def __setstate__( self, state ) :
+    self.__dict__.update( state )
+    self.multiStepLock_ = threading.Lock()
+    self.setNotifier( queue.SimpleQueue() )
+    for step in self.steps_.values() :
+      step.lock_ = self.multiStepLock_
+
+  def setGlobalOpts( self, globalOpts ) :
+    super().setGlobalOpts( globalOpts )
+    for step in self.steps_.values() :
+      step.setGlobalOpts( globalOpts )
 
   def validate( self ) :
     for step in self.steps_.values() :
       step.validate()
 
+  def setNotifier( self, notifier ) :
+    self.stepNotifier_ = notifier
+    for step in self.steps_.values() :
+      step.wakeTest_ = notifier
+
+  def runRouted( self, func, *args ) :
+    with routeStdout( self.stdout_ ) :
+      return func( *args )
+
+  def runStep( self, step ) :
+    with Profiler.span( step.name_, "step", test=self.name_ ) :
+      return self.runRouted( step.run )
+
+  # Split version of run() for when steps are scheduled outside of this test
+  def startSteps( self ) :
+    # Other tests are running in this process, so leave the process directory alone
+    self.changeDirectory_ = False
+    self.prepExecuteAction()
+    self.setWorkingDirectory()
+    self.checkWaitResults()
+    self.groupJobArrays()
+
+  def finishSteps( self, stepOrder ) :
+    self.log( "No remaining steps, test submission complete" )
+    return self.postProcessResults( stepOrder )
+
   def executeAction( self ) :
     self.checkWaitResults()
+    self.groupJobArrays()
 
-    stepsAlreadyRun = {}
+    stepsAlreadyRun = OrderedDict()
     # Since this might be the limiting computational factor in terms of how processes run
     # use the more supported ThreadPoolExecutor rather than a simple ThreadPool to enable 
     # any future growth 
     executor = ThreadPoolExecutor( max_workers=self.globalOpts_.threadpool )
-    while len( stepsAlreadyRun ) != len( self.steps_ ) :
-      for step in self.steps_.values() :
-        if step.runnable() and step.name_ not in stepsAlreadyRun :
-          stepsAlreadyRun[ step.name_ ] = submittedStep = executor.submit( step.run )
-
-      # We have submitted all runnable steps for the current phase, and there is no guarantee
-      # that all these steps need to complete at the same time so DO NOT WAIT for all
-      # results, but instead patiently wait for one of the submitted steps to wake us up
-      # and then check if any of our runnable states has changed, obviously if no steps
-      # have completed between our last check and an arbitrary time later then no runnable states
-      # will have changed either (THIS DOES NOT WORK WELL WITH LOCAL SUBMISSION AND "AFTER" ONLY DEPENDENCY)
-      self.stepNotifier_.acquire()
-
-      # Make sure anything that woke us up was okay
+
+    # Only steps without dependencies can start, after that steps become ready
+    # exclusively when the last of their dependencies signs off
+    readySteps = [ step for step in self.steps_.values() if step.runnable() ]
+    # Ready steps wait here until a worker is free so the next one to go is always
+    # picked by the requested order, not just by whichever became ready first
+    priority = self.stepPriorities()
+    queued   = []
+    running  = 0
+    try :
+      while True :
+        for step in readySteps :
+          heapq.heappush( queued, ( priority[ step.name_ ], step.name_ ) )
+
+        while queued and running < self.globalOpts_.threadpool :
+          _, stepname = heapq.heappop( queued )
+          if stepname not in stepsAlreadyRun :
+            stepsAlreadyRun[ stepname ] = executor.submit( self.runStep, self.steps_[ stepname ] )
+            running += 1
+
+        if len( stepsAlreadyRun ) == len( self.steps_ ) :
+          break
+
+        # There is no guarantee that submitted steps complete at the same time so DO NOT WAIT
+        # for all results, but instead patiently wait for one of the submitted steps to
+        # tell us it is done and which of its children it made ready
+        with Profiler.span( "steps wait", "test", test=self.name_ ) :
+          doneStep, readySteps = self.stepNotifier_.get()
+
+        # Make sure the step that woke us up was okay
+        stepsAlreadyRun[ doneStep.name_ ].result()
+        running -= 1
+
+        self.log( "Checking remaining steps..." )
+
+      # Grab anything that we are still waiting for that has already been submitted
       for stepname, futureObj in stepsAlreadyRun.items() :
-        if futureObj.done() :
-          try :
-            futureObj.result()
-          except Exception as e :
-            # Kill it all and shut down
-            for k,v in stepsAlreadyRun.items() : v.cancel() # This is for prior to python 3.9
-            executor.shutdown( wait=True )
-            raise e
-
-      self.log( "Checking remaining steps..." )
-
-    # Grab anything that we are still waiting for that has already been submitted
-    for stepname, futureObj in stepsAlreadyRun.items() :
-      try :
         futureObj.result()
-      except Exception as e :
-        # Kill it all and shut down
-        for k,v in stepsAlreadyRun.items() : v.cancel() # This is for prior to python 3.9
-        executor.shutdown( wait=True )
-        raise e
+
+    except Exception as e :
+      # Kill it all and shut down
+      for k,v in stepsAlreadyRun.items() : v.cancel() # This is for prior to python 3.9
+      executor.shutdown( wait=True )
+      raise e
     executor.shutdown( wait=True )
 
     self.log( "No remaining steps, test submission complete" )
@@ -128,33 +208,111 @@ class Test( SubmitAction ):
 
     self.log_pop()
   
+  def groupJobArrays( self ) :
+    for step in self.steps_.values() :
+      step.jobArray_   = None
+      step.arrayIndex_ = None
+    if not self.globalOpts_.jobArrays :
+      return
+
+    self.log( "Checking for steps to submit as job arrays..." )
+    self.log_push()
+    jobArrays = JobArray.group( self.steps_.values() )
+    for jobArray in jobArrays :
+      self.log( "Steps [ {0} ] will be submitted as job array {1}".format( ", ".join( [ step.name_ for step in jobArray.steps_ ] ), jobArray.name_ ) )
+    if not jobArrays :
+      self.log( "No steps share submit options and dependencies" )
+    self.log_pop()
+
   def waitOnSteps( self, stepOrder ) :
+    pendingSteps = self.pendingHPCSteps( stepOrder )
+    if pendingSteps is None :
+      return
+
+    pollInterval = PollInterval()
+    while pendingSteps :
+      time.sleep( self.nextPoll( pendingSteps, pollInterval ) )
+      self.pollHPCSteps( pendingSteps )
+
+    self.log( "All HPC steps complete" )
+    self.log_pop()
+
+  # Start of waiting on HPC steps, None if there is nothing to wait on at all
+  def pendingHPCSteps( self, stepOrder ) :
     if self.globalOpts_.dryRun :
       self.log( "Doing dry-run, assumed complete" )
-      return
+      return None
 
     self.log( "Waiting for HPC jobs to finish..." )
     self.log_push()
     self.log( "*ATTENTION* : This is a blocking/sync phase to wait for all jobs to complete - BE PATIENT" )
-    time.sleep( HPC_DELAY_PERIOD_SECONDS )
 
     # Filter steps already done
-    completedSteps = [ stepname for stepname in stepOrder if self.steps_[ stepname ].submitOptions_.submitType_ == SubmissionType.LOCAL ]
-
-    while len( completedSteps ) != len( stepOrder ) :
-      # Wait N seconds before checking all steps again
-      time.sleep( HPC_POLL_PERIOD_SECONDS )
-
-      for stepname in stepOrder :
-        if stepname not in completedSteps :
-          self.steps_[ stepname ].log_push()
-          finished = self.steps_[ stepname ].checkJobComplete()
-          self.steps_[ stepname ].log_pop()
-          if finished :
-            completedSteps.append( stepname )
-
-    self.log( "All HPC steps complete" )
-    self.log_pop()
+    pendingSteps = OrderedDict()
+    for stepname in stepOrder :
+      step = self.steps_[ stepname ]
+      if step.submitOptions_.submitType_ == SubmissionType.LOCAL :
+        continue
+      if step.jobid_ is None or step.jobid_ <= 0 :
+        step.log_push()
+        step.log( "Step has no job ID in scheduler queue, assumed complete" )
+        step.log_pop()
+        continue
+      pendingSteps[ stepname ] = step
+    return pendingSteps
+
+  def nextPoll( self, pendingSteps, pollInterval ) :
+    pollInterval.update( [
+                          SubmitOptions.parseTimelimit( step.submitOptions_.timelimit_, step.submitOptions_.submitType_ )
+                            for step in pendingSteps.values() if step.submitOptions_.timelimit_ is not None
+                          ] )
+    return pollInterval.next()
+
+  # Removes steps from pendingSteps as the scheduler reports them complete
+  def pollHPCSteps( self, pendingSteps ) :
+    # One scheduler query per submission type covering every outstanding job
+    for submitType in set( step.submitOptions_.submitType_ for step in pendingSteps.values() ) :
+      # Steps of a job array share its job ID
+      jobs = OrderedDict()
+      for stepname, step in pendingSteps.items() :
+        if step.submitOptions_.submitType_ == submitType :
+          jobs.setdefault( step.jobid_, [] ).append( stepname )
+      arrayJobids = [ jobid for jobid, stepnames in jobs.items() if pendingSteps[ stepnames[0] ].jobArray_ is not None ]
+      statuses = JobStatus.query( submitType, jobs.keys(), arrayJobids=arrayJobids, print=self.log )
+
+      for jobid, status in statuses.items() :
+        if status.unknown_ :
+          status = self.boundUnknownStatus( pendingSteps[ jobs[ jobid ][0] ], status )
+        else :
+          for stepname in jobs[ jobid ] :
+            pendingSteps[ stepname ].unknownPolls_ = 0
+
+        if status.complete_ :
+          for stepname in jobs[ jobid ] :
+            step = pendingSteps.pop( stepname )
+            step.log_push()
+            step.setJobStatus( status )
+            step.log_pop()
+
+  # Nothing known about a job cannot go on forever, e.g. without job accounting
+  # or with the scheduler down. Give up on it after too many polls in a row or
+  # once it could not possibly still be running
+  def boundUnknownStatus( self, step, status ) :
+    step.unknownPolls_ += 1
+    timelimit = None
+    if step.submitOptions_.timelimit_ is not None :
+      timelimit = SubmitOptions.parseTimelimit( step.submitOptions_.timelimit_, step.submitOptions_.submitType_ )
+
+    reason = None
+    if step.unknownPolls_ >= HPC_POLL_UNKNOWN_MAX :
+      reason = "for {0} polls".format( step.unknownPolls_ )
+    elif timelimit is not None and step.startTime_ is not None and time.time() - step.startTime_ > timelimit.total_seconds() :
+      reason = "past its timelimit of {0}".format( timelimit )
+
+    if reason is None :
+      return status
+    step.log( "Status of job ID {0} unknown {1}, assumed complete with state unknown".format( status.jobid_, reason ), level=LogLevel.WARNING )
+    return JobStatus( status.jobid_, complete=True )
 
   def postProcessResults( self, stepOrder ) :
     # Do we need to post-process HPC submission files
@@ -164,7 +322,8 @@ class Test( SubmitAction ):
         self.log( "Post-processing requires waiting for HPC submissions, skipped" )
       elif self.waitResults_ :
         # Wait for grid steps to complete
-        self.waitOnSteps( stepOrder )
+        with Profiler.span( "hpc wait", "test", test=self.name_ ) :
+          self.waitOnSteps( stepOrder )
 
       # All results are ready
       # We go through the steps in the order submitted
@@ -174,11 +333,19 @@ class Test( SubmitAction ):
       stepsLog = OrderedDict()
       for stepname in stepOrder :
         if stepname != "results" :
-          success, err = self.steps_[ stepname ].postProcessResults()
+          with Profiler.span( "post-process", "step", test=self.name_, step=stepname ) :
+            success, err = self.steps_[ stepname ].postProcessResults()
           stepsLog[ stepname ] = {}
           stepsLog[ stepname ][ "logfile" ] = self.steps_[ stepname ].logfile_
           stepsLog[ stepname ][ "success" ] = success
           stepsLog[ stepname ][ "line"    ] = err
+          stepsLog[ stepname ][ "jobid"   ] = self.steps_[ stepname ].jobid_
+          stepsLog[ stepname ][ "start"   ] = self.steps_[ stepname ].startTime_
+          stepsLog[ stepname ][ "stop"    ] = self.steps_[ stepname ].stopTime_
+          if self.steps_[ stepname ].cached_ is not None :
+            stepsLog[ stepname ][ "cached" ] = self.steps_[ stepname ].cached_
+          if self.steps_[ stepname ].usage_ is not None :
+            stepsLog[ stepname ].update( self.steps_[ stepname ].usage_ )
       
       self.log_pop()
 
@@ -215,6 +382,39 @@ class Test( SubmitAction ):
 
     return not success
 
+  # Expected runtime of a step, its timelimit unless it has a recorded history
+  # in which case that is used with the timelimit still as the cap
+  def stepRuntime( self, step, submitType ) :
+    timelimit = SubmitOptions.parseTimelimit( step.submitOptions_.timelimit_, submitType )
+    if self.globalOpts_.runtimePercentile is None :
+      return timelimit
+
+    observed = RuntimeHistory.instance( self.globalOpts_ ).runtime( self.name_, step.name_ )
+    if observed is None :
+      return timelimit
+    return min( observed, timelimit ) if timelimit is not None else observed
+
+  # Snapshot of the steps for simulating how they would run
+  def simJobs( self, submitType=None, withResources=False ) :
+    return [
+            SimJob(
+                    step.name_,
+                    self.stepRuntime( step, submitType if submitType is not None else step.submitOptions_.submitType_ ),
+                    step.submitOptions_.hpcArguments_.selectAncestrySpecificSubmitArgpacks( print=step.log ) if withResources else None,
+                    step.dependencies_.keys()
+                    )
+              for step in self.steps_.values()
+            ]
+
+  # Order to start steps in when more are ready than there are workers
+  def stepPriorities( self ) :
+    return JobSimulator( self.simJobs(), self.globalOpts_.threadpool, self.globalOpts_.joinOrder ).priority_
+
+  # Expected runtime of all steps across the threadpool based on their expected runtimes
+  def estimateRuntime( self ) :
+    runtime, _ = JobSimulator( self.simJobs(), self.globalOpts_.threadpool, self.globalOpts_.joinOrder ).run()
+    return runtime
+
   def getMaxHPCResources( self ) :
     # NOTE NOTE NOTE NOTE NOTE
     # I have made some assumptions about when things can run
@@ -222,127 +422,46 @@ class Test( SubmitAction ):
     # more complex logic. For now, try not to add too many divergent branches of testing
     self.log( "Computing maximum HPC resources per runnable step phase..." )
 
-    # Maybe use one day for complex branch analysis...
-    # deps     = { depType : {} for depType in Step.DependencyType }
-
-    # # Get all variations of dependencies
-    # for step in self.steps_ :
-    #   for stepname, depType in step.dependencies_ :
-    #     deps[ depType ][ stepname ] = None
-
-    maxResources = HpcArgpacks( OrderedDict() )
     maxTimelimit = timedelta()
-    maxResources.setName( HpcArgpacks.HPC_JOIN_NAME + "max" )
     hpcSubmit = [ step.submitOptions_.submitType_ for step in self.steps_.values() if step.submitOptions_.submitType_ != SubmissionType.LOCAL ]
     if not hpcSubmit :
+      maxResources = HpcArgpacks( OrderedDict() )
+      maxResources.setName( HpcArgpacks.HPC_JOIN_NAME + "max" )
       self.log( "No HPC steps in this test" )
       return maxResources, maxTimelimit
 
     longestStep = len( max( [ stepname for stepname in self.steps_.keys() ], key=len ) )
-    phase = 0
     self.log_push()
 
     # We need to break it down by expected runtime of each test by size of pool
-    # as that is the order they will run in. Could we optimize? Yea probably. Will we? Not right now
-    self.log( "Calculating expected runtime of steps across {0} thread workers [threadpool size]".format( self.globalOpts_.threadpool ) )
+    # as that is the order they will run in
+    self.log( "Calculating expected runtime of steps across {0} thread workers [threadpool size] in {1} order".format(
+                                                                                                                      self.globalOpts_.threadpool,
+                                                                                                                      self.globalOpts_.joinOrder
+                                                                                                                      )
+              )
     self.log_push()
-    # Gather set of runnable psuedojobs
-    psuedoJobs = [ step for step in self.steps_.values() if step.runnable() ]
-    # Assume all runnable are in queue to be run, and thus cannot be re-submitted
-    for pj in psuedoJobs :
-      pj.submitted_ = True
-
-    psuedoRunningMap = {}
-    # Continue while we have jobs in queue or running
-    while len( psuedoJobs ) > 0 or len( psuedoRunningMap ) > 0 :
-      # If we have slots in our pool and jobs left, fill in
-      while len( psuedoRunningMap ) < self.globalOpts_.threadpool and len( psuedoJobs ) > 0 :
-        pjStep = psuedoJobs.pop(0)
-        psuedoRunningMap[ pjStep.name_ ] = { "step" : pjStep, "timelimit" : SubmitOptions.parseTimelimit( pjStep.submitOptions_.timelimit_, hpcSubmit[0] ) }
-
-      # Find smallest job
-      runForKey = min( psuedoRunningMap, key= lambda k : psuedoRunningMap[k]["timelimit"] )
-      runFor    = copy.deepcopy( psuedoRunningMap[runForKey]["timelimit"] )
-      maxTimelimit += runFor
-      # "Run" for that amount of time
-      self.log( "Simulating threadpool for {0}".format( psuedoRunningMap[runForKey]["timelimit"] ) )
-      self.log_push()
 
-      for key in psuedoRunningMap.keys() :
-        psuedoRunningMap[ key ][ "timelimit" ] -= runFor
-      
-      ##################################################################################################################
-      # RESOURCE CALCULATIONS
-      # What would our max resource consumption be whilst running this set?
-      # Add all concurrent resources together
-      self.log( "Calculate max instantaneous resources for this phase" )
-      self.log_push()
-      currentResources = HpcArgpacks.joinAll( [ 
-                                                pj[ "step" ].submitOptions_.hpcArguments_.selectAncestrySpecificSubmitArgpacks( print=pj["step"].log )
-                                                  for pj in psuedoRunningMap.values() 
-                                              ],
-                                              hpcSubmit[0],
-                                              lambda rhs,lhs : rhs + lhs,
-                                              print=self.log
-                                            )
-
-      # Get maximum
-      maxResources.join(
-                        currentResources,
-                        hpcSubmit[0],
-                        max,
-                        print=self.log
-                        )
-      self.log_pop()
+    def phaseInfo( phase, steps, currentResources, runFor ) :
       self.log( "[PHASE {phase}] Resources for [ {steps} ] : '{res}', timelimit = {time}".format(
                                                                                                   phase=phase,
                                                                                                   steps=" ".join(
                                                                                                                 "{0:>{1}}".format(
-                                                                                                                                  step, longestStep + ( 1 if len( psuedoRunningMap ) > 1 else 0 ) )
-                                                                                                                                  for step in psuedoRunningMap.keys()
+                                                                                                                                  step, longestStep + ( 1 if len( steps ) > 1 else 0 ) )
+                                                                                                                                  for step in steps
                                                                                                                 ),
                                                                                                   res=currentResources.format( hpcSubmit[0], print=lambda *args : None ),
                                                                                                   time=runFor
                                                                                                   )
                 )
-      phase += 1
-      #
-      ##################################################################################################################
-
-      
-      # Re-evaluate for any jobs that completed
-      completed = []
-      for stepname in psuedoRunningMap :
-        if psuedoRunningMap[ stepname ][ "timelimit" ].total_seconds() <= 0 :
-          completed.append( stepname )
-          psuedoRunningMap[ stepname ][ "step" ].jobid_     = 0
-          psuedoRunningMap[ stepname ][ "step" ].retval_    = 0
-          psuedoRunningMap[ stepname ][ "step" ].notifyChildren( )
-
-      # Remove completed
-      for pj in completed :
-        psuedoRunningMap.pop( pj )
-
-      # Add any new arrivals to the queue
-      for step in self.steps_.values() :
-        if step.runnable() :
-          # as soon as it is in queue, consider it submitted
-          psuedoJobs.append( step )
-          step.submitted_ = True
-
-      self.log( "{0} jobs completed during this runtime".format( len( completed ) ) )
-      self.log_pop()
 
+    simulator = JobSimulator( self.simJobs( hpcSubmit[0], withResources=True ), self.globalOpts_.threadpool, self.globalOpts_.joinOrder )
+    maxTimelimit, maxResources = simulator.run( hpcSubmit[0], phaseInfo=phaseInfo, print=lambda *args : None )
 
-    
     self.log_pop()
     self.log( "All jobs simulated, stopping" )
     self.log_pop()
 
-
-    # Reset the pipeline
-    for step in self.steps_.values() :
-      step.resetRunnable()
     self.log( "Maximum HPC resources required will be '{0}' with timelimit '{1}'".format(
                                                                                           maxResources.format( hpcSubmit[0], print=lambda *args : None ),
                                                                                           SubmitOptions.formatTimelimit(
@@ -352,8 +471,3 @@ class Test( SubmitAction ):
                                                                                         )
               )
     return maxResources, maxTimelimit
-
-
-
-
-
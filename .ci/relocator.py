@@ -3,54 +3,206 @@
 import json
 import sys
 import os
+import re
 import shutil
 import inspect
+import argparse
+from enum import Enum
+from concurrent.futures import ThreadPoolExecutor
 
-def replaceReferences( filename, refs ) :
-  with open( filename, "r" ) as fp :
+import LogReader
+from ResultsDB import ResultsDB
+
+try :
+  import fcntl
+except ImportError :
+  fcntl = None
+
+# ioctl to share the extents of one file with another on copy-on-write filesystems (linux/fs.h)
+FICLONE = 0x40049409
+
+class TransferMode( Enum ):
+  COPY     = "copy"
+  HARDLINK = "hardlink"
+  REFLINK  = "reflink"
+
+  def __str__( self ) :
+    return self.value
+
+# One pass over the contents no matter how many references there are, longest
+# first so a logfile never has a shorter logfile name replaced inside it
+def replaceReferences( source, destination, refs, pattern ) :
+  with open( source, "r" ) as fp :
     contents = fp.read()
-  
-  for ref, rep in refs.items() : 
-    contents = contents.replace( ref, rep )
 
-  with open( filename, "w" ) as fp :
-    fp.write( contents )
+  with open( destination, "w" ) as fp :
+    fp.write( pattern.sub( lambda match : refs[ match.group( 0 ) ], contents ) )
+
+# Whether destination already holds exactly what source would transfer
+def unchanged( source, destination, mode ) :
+  try :
+    if mode == TransferMode.HARDLINK :
+      return os.path.samefile( source, destination )
+    sourceStat      = os.stat( source )
+    destinationStat = os.stat( destination )
+  except FileNotFoundError :
+    return False
+  return sourceStat.st_size == destinationStat.st_size and sourceStat.st_mtime_ns == destinationStat.st_mtime_ns
+
+def reflink( source, destination ) :
+  if fcntl is None :
+    raise OSError( "Reflinks not supported on this platform" )
+  with open( source, "rb" ) as src, open( destination, "wb" ) as dst :
+    fcntl.ioctl( dst.fileno(), FICLONE, src.fileno() )
+  shutil.copystat( source, destination )
+
+# Falls back to a plain copy whenever a link is not possible, i.e. across filesystems
+def transfer( source, destination, mode, incremental ) :
+  if incremental and unchanged( source, destination, mode ) :
+    return False
+
+  # Never write through an earlier transfer, it may be a link to the source or another file
+  if os.path.lexists( destination ) :
+    os.unlink( destination )
+
+  if mode != TransferMode.COPY :
+    try :
+      if mode == TransferMode.HARDLINK :
+        os.link( source, destination )
+      else :
+        reflink( source, destination )
+      return True
+    except OSError :
+      pass
+
+  # Keep the timestamps so an incremental sync can tell the file is unchanged
+  shutil.copy2( source, destination )
+  return True
+
+# Files actually on disk for a logfile, compressed ones carry their uncompressed tail along
+def logFiles( logfile ) :
+  path, compression = LogReader.resolve( logfile )
+  if compression is None :
+    return [ ( path, "" ) ]
+  files = [ ( path, compression.suffix() ) ]
+  if os.path.exists( logfile + LogReader.TAIL_SIDECAR_SUFFIX ) :
+    files.append( ( logfile + LogReader.TAIL_SIDECAR_SUFFIX, LogReader.TAIL_SIDECAR_SUFFIX ) )
+  return files
+
+
+def getOptionsParser():
+  parser = argparse.ArgumentParser(
+                                    description="Copies a master log and all associated logs elsewhere, rewriting references to them",
+                                  )
+
+  parser.add_argument(
+                      "masterLog",
+                      help="Master logfile output from runner.py, or results database with --resultsDB",
+                      type=str
+                      )
+  parser.add_argument(
+                      "relocation",
+                      help="Directory to relocate all logs to",
+                      type=str
+                      )
+  parser.add_argument(
+                      "-db", "--resultsDB",
+                      dest="resultsDB",
+                      help="Read the logs of a run from the database output by runner.py --resultsDB given instead of a master log",
+                      default=False,
+                      const=True,
+                      action='store_const'
+                      )
+  parser.add_argument(
+                      "-ri", "--runId",
+                      dest="runId",
+                      help="Run in the results database to relocate (default : latest)",
+                      type=int,
+                      default=None
+                      )
+  parser.add_argument(
+                      "-m", "--mode",
+                      dest="mode",
+                      help="How logfiles without references are transferred, links fall back to copies when not possible. Hardlinked logfiles change along with the originals if those are rewritten in place (default : %(default)s)",
+                      type=TransferMode,
+                      choices=list( TransferMode ),
+                      default=TransferMode.COPY
+                      )
+  parser.add_argument(
+                      "-t", "--threads",
+                      dest="threads",
+                      help="Number of files to transfer at the same time (default : %(default)s)",
+                      type=int,
+                      default=8
+                      )
+  parser.add_argument(
+                      "-i", "--incremental",
+                      dest="incremental",
+                      help="Skip logfiles already relocated and unchanged since",
+                      default=False,
+                      const=True,
+                      action='store_const'
+                      )
+  return parser
+
+class Options(object):
+  """Empty namespace"""
+  pass
 
+def main() :
+  parser  = getOptionsParser()
+  options = Options()
+  parser.parse_args( namespace=options )
 
-masterLog  = os.path.abspath( sys.argv[1] )
-relocation = os.path.abspath( sys.argv[2] )
+  relocation = os.path.abspath( options.relocation )
 
-fp = open( masterLog )
-logs = json.load( fp )
-fp.close()
+  if options.resultsDB :
+    results = ResultsDB( options.masterLog )
+    masterLog, logs = results.masterLog( options.runId )
+    results.close()
+  else :
+    masterLog = os.path.abspath( options.masterLog )
+    fp = open( masterLog )
+    logs = json.load( fp )
+    fp.close()
 
-metadata = logs.pop( "metadata", None )
+  metadata = logs.pop( "metadata", None )
 
-print( "Copying {0} and all associated logs to {1}...".format( masterLog, relocation ) )
-if not os.path.exists( relocation ):
-  os.makedirs( relocation )
+  print( "Copying {0} and all associated logs to {1}...".format( masterLog, relocation ) )
+  if not os.path.exists( relocation ):
+    os.makedirs( relocation )
 
-oldlocation, mastername  = os.path.split( masterLog )
+  oldlocation, mastername  = os.path.split( masterLog )
 
-files = [ masterLog ]
-for test in logs.values() :
-  files.append( test["logfile"] )
-  files.append( test["stdout"] )
-  # step files are user stdout so  they should not have any changes
-  for step in test["steps"].values() :
-    files.append( step["logfile"] )
+  # Only the master and test logs are ours and reference other logfiles
+  referencing = [ masterLog ]
+  copied      = []
+  for test in logs.values() :
+    referencing.append( test["logfile"] )
+    copied.append( test["stdout"] )
+    # step files are user stdout so  they should not have any changes
+    for step in test["steps"].values() :
+      copied.append( step["logfile"] )
 
-common = os.path.commonpath( files )
-replacements = { logfile : logfile.replace( common, relocation ) for logfile in files }
+  files  = referencing + copied
+  common = os.path.commonpath( files )
+  replacements = { logfile : logfile.replace( common, relocation ) for logfile in files }
+  pattern      = re.compile( "|".join( re.escape( logfile ) for logfile in sorted( replacements, key=len, reverse=True ) ) )
 
-for oldloc, newloc in replacements.items() :
-  # change refs in new location, using copy for safety
-  os.makedirs( os.path.dirname( newloc ), exist_ok=True )
-  newlocation = shutil.copy( oldloc, newloc )
-  replaceReferences( newlocation, replacements )
-  
-  
- 
+  for newloc in set( os.path.dirname( newloc ) for newloc in replacements.values() ) :
+    os.makedirs( newloc, exist_ok=True )
 
+  with ThreadPoolExecutor( max_workers=options.threads ) as executor :
+    rewrites  = [ executor.submit( replaceReferences, logfile, replacements[ logfile ], replacements, pattern ) for logfile in referencing ]
+    transfers = [
+                  executor.submit( transfer, source, replacements[ logfile ] + suffix, options.mode, options.incremental )
+                  for logfile in dict.fromkeys( copied ) for source, suffix in logFiles( logfile )
+                  ]
+    for rewrite in rewrites :
+      rewrite.result()
+    transferred = sum( 1 for transferred in transfers if transferred.result() )
 
+  print( "Rewrote {0} logs, transferred {1} of {2} logfiles by {3}".format( len( rewrites ), transferred, len( transfers ), options.mode ) )
 
+if __name__ == '__main__' :
+  main()
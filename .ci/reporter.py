@@ -5,8 +5,13 @@ import sys
 import os
 import inspect
 import argparse
+import re
+import collections
 from enum import Enum
 
+import LogReader
+from ResultsDB import ResultsDB
+
 class OutputType( Enum ):
   STANDARD   = "STANDARD"
   GITHUB     = "GITHUB"
@@ -15,21 +20,131 @@ class OutputType( Enum ):
     return self.value
 
 
-def dumpFile( filename, errorLabel, success=False, bannerMsg="", banner="!" * 80 ) :
+# Lines shown of a logfile that may be far too large to hold in memory or print
+# whole. With no windows set every line is shown, otherwise only the first
+# headLines, the last tailLines, and contextLines around any line matching one
+# of the patterns. The last line is always shown as it holds the failure reason
+class LogWindow( ) :
+  def __init__( self, headLines=None, tailLines=None, patterns=[], contextLines=0 ) :
+    self.headLines_    = headLines
+    self.tailLines_    = tailLines
+    self.patterns_     = [ re.compile( pattern ) for pattern in patterns ]
+    self.contextLines_ = contextLines if self.patterns_ else 0
+    self.windowed_     = headLines is not None or tailLines is not None or len( self.patterns_ ) > 0
+
+  def describe( self ) :
+    if not self.windowed_ :
+      return None
+    windows = []
+    if self.headLines_ is not None :
+      windows.append( "first {0}".format( self.headLines_ ) )
+    if self.tailLines_ is not None :
+      windows.append( "last {0}".format( self.tailLines_ ) )
+    if self.patterns_ :
+      windows.append( "{0} around errors".format( self.contextLines_ ) )
+    return "[Showing lines : {0}]".format( ", ".join( windows ) )
+
+  def matches( self, line ) :
+    return any( pattern.search( line ) for pattern in self.patterns_ )
+
+  # Only the end of the file is wanted, which never needs reading the rest
+  def tailOnly( self ) :
+    return self.tailLines_ is not None and self.headLines_ is None and not self.patterns_
+
+  # Reads backwards from the end of the file however large it is, so how many
+  # lines came before and were elided is not known. Returns the last line, not
+  # yet printed, and None for the lines elided
+  def tail( self, filename, print=print ) :
+    count = max( self.tailLines_, 1 )
+    # One more than shown tells whether anything came before them
+    lines = LogReader.lastLines( filename, count + 1 )
+    if not lines :
+      return None, None
+    if len( lines ) > count :
+      print( "[... earlier lines elided ...]" )
+    for line in lines[-count:-1] :
+      print( line )
+    return lines[-1], None
+
+  # Streams the file through print, holding back only as many recent lines as
+  # the tail or context windows may still need to decide whether to show them.
+  # Returns the last line, not yet printed, and the number of lines elided
+  def stream( self, f, print=print ) :
+    holdLines  = max( self.tailLines_ or 0, self.contextLines_ )
+    recent     = collections.deque()
+    lastShown  = -1
+    afterMatch = 0
+    elided     = 0
+
+    def show( index, line ) :
+      nonlocal lastShown, elided
+      if index > lastShown + 1 :
+        print( "[... {0} lines elided ...]".format( index - lastShown - 1 ) )
+        elided += index - lastShown - 1
+      print( line, end="" )
+      lastShown = index
+
+    # Lines leave in order once no window can reach back to them anymore
+    def hold( index, line, shown ) :
+      recent.append( [ index, line, shown ] )
+      while len( recent ) > holdLines :
+        index, line, shown = recent.popleft()
+        if shown :
+          show( index, line )
+
+    index   = -1
+    current = None
+    # Each line is only handled once the next is read, so the last is never shown here
+    for line in f :
+      if current is not None :
+        if not self.windowed_ :
+          hold( index, current, True )
+        elif self.matches( current ) :
+          for before in recent :
+            if before[0] >= index - self.contextLines_ :
+              before[2] = True
+          hold( index, current, True )
+          afterMatch = self.contextLines_
+        else :
+          inHead     = self.headLines_ is not None and index < self.headLines_
+          hold( index, current, inHead or afterMatch > 0 )
+          afterMatch = max( afterMatch - 1, 0 )
+      index  += 1
+      current = line
+
+    if current is None :
+      return None, 0
+
+    for before in recent :
+      # The last line counts towards the tail too
+      if before[2] or ( self.tailLines_ is not None and before[0] > index - self.tailLines_ ) :
+        show( before[0], before[1] )
+    if index > lastShown + 1 :
+      print( "[... {0} lines elided ...]".format( index - lastShown - 1 ) )
+      elided += index - lastShown - 1
+    return current, elided
+
+
+def dumpFile( filename, errorLabel, success=False, bannerMsg="", banner="!" * 80, window=LogWindow() ) :
   print( "\nOpening logfile {0}".format( filename ) )
   print( "{msg}\n{banner}".format( msg=bannerMsg, banner=banner ) )
-  with open( filename, 'r') as f:
-    current = next( f, None )
-    last    = None
-    for line in f.readlines() :
-      print( current, end="" )
-      current = line
-    # last line
-    if current is not None and not success :
-      print( errorLabel.format( title=filename, message=current )  )
-    else :
-      print( current )
-      
+  description = window.describe()
+  if description is not None :
+    print( description )
+  if window.tailOnly() :
+    current, elided = window.tail( filename )
+  else :
+    # Step logfiles may have been compressed as they were written
+    with LogReader.openLog( filename, "r" ) as f:
+      current, elided = window.stream( f )
+  # last line
+  if current is not None and not success :
+    print( errorLabel.format( title=filename, message=current )  )
+  else :
+    print( current )
+  if elided :
+    print( "[{0} lines elided in total]".format( elided ) )
+
   print( banner )
   print( "\nClosing logfile {0}".format( filename ) )
 
@@ -76,7 +191,7 @@ def getOptionsParser():
 
   parser.add_argument( 
                       "masterLog",
-                      help="Master logfile output from runner.py",
+                      help="Master logfile output from runner.py, or results database with --resultsDB",
                       type=str,
                       default=""
                       )
@@ -142,6 +257,50 @@ def getOptionsParser():
                       const=True,
                       action='store_const'
                       )
+  parser.add_argument(
+                      "-db", "--resultsDB",
+                      dest="resultsDB",
+                      help="Read results from the database output by runner.py --resultsDB given instead of a master log",
+                      default=False,
+                      const=True,
+                      action='store_const'
+                      )
+  parser.add_argument(
+                      "-ri", "--runId",
+                      dest="runId",
+                      help="Run in the results database to report on (default : latest)",
+                      type=int,
+                      default=None
+                      )
+  parser.add_argument(
+                      "-hl", "--headLines",
+                      dest="headLines",
+                      help="Output the first N lines of each logfile, eliding the rest unless in another window",
+                      type=int,
+                      default=None
+                      )
+  parser.add_argument(
+                      "-tl", "--tailLines",
+                      dest="tailLines",
+                      help="Output the last N lines of each logfile, eliding the rest unless in another window",
+                      type=int,
+                      default=None
+                      )
+  parser.add_argument(
+                      "-ep", "--errorPatterns",
+                      dest="errorPatterns",
+                      help="Output lines of each logfile matching any of these regexes with context, eliding the rest unless in another window",
+                      type=str,
+                      nargs="+",
+                      default=[]
+                      )
+  parser.add_argument(
+                      "-cl", "--contextLines",
+                      dest="contextLines",
+                      help="Lines before and after each line matching --errorPatterns to output",
+                      type=int,
+                      default=3
+                      )
   return parser
 
 class Options(object):
@@ -153,13 +312,19 @@ def main() :
   options = Options()
   parser.parse_args( namespace=options )
 
-  fp = open( options.masterLog )
-  logs = json.load( fp )
+  if options.resultsDB :
+    results = ResultsDB( options.masterLog )
+    options.masterLog, logs = results.masterLog( options.runId )
+    results.close()
+  else :
+    fp = open( options.masterLog )
+    logs = json.load( fp )
 
   metadata = logs.pop( "metadata", None )
   metadata["rel_exec"]   = options.exec 
   metadata["rel_prefix"] = options.prefix 
   failure = False
+  window  = LogWindow( options.headLines, options.tailLines, options.errorPatterns, options.contextLines )
 
   startGroup  = None
   stopGroup   = None
@@ -183,7 +348,19 @@ def main() :
     testErrorLabel = "{{message}}"
   else :
     testErrorLabel = errorLabel
-  
+
+  # Executive summary first so failures are visible before any long logs
+  print( startGroup.format( title="Summary" ) )
+  print( getSummaryPrintedStr( logs, metadata ) )
+
+  note = inspect.cleandoc(
+                          """
+                              Note: HPC users should use '-s LOCAL' in reproduce command with caution
+                                    as it will run directly where you are, consider using an interactive node
+                          """
+                          )
+  print( note )
+  print( stopGroup, flush=True )
 
   if not options.summaryOnly :
     print( "Finding tests that failed..." )
@@ -194,7 +371,7 @@ def main() :
         print( startGroup.format( title=testTitle ) )
         print( "\n".join([( "#" * 80 )]*3 ) )
         print( "Test {test} failed, printing stdout".format( test=test ) )
-        dumpFile( testlog["stdout"], testErrorLabel.format( title=test ), bannerMsg=testTitle, banner="\n".join([( "!#!#" * 20 )]*2 ) )
+        dumpFile( testlog["stdout"], testErrorLabel.format( title=test ), bannerMsg=testTitle, banner="\n".join([( "!#!#" * 20 )]*2 ), window=window )
 
         print( "Finding logs for steps that failed..." )
         print( stopGroup )
@@ -212,14 +389,14 @@ def main() :
             else :
               print( startGroup.format( title=stepTitle ) )
 
-            dumpFile( steplog["logfile"], errorLabel.format( title=stepAncestry ), steplog["success"], bannerMsg=stepTitle )
+            dumpFile( steplog["logfile"], errorLabel.format( title=stepAncestry ), steplog["success"], bannerMsg=stepTitle, window=window )
             print( stopGroup )
 
         
 
     print( "\n", flush=True, end="" )
 
-    print( startGroup.format( title="Summary" ) )
+    print( startGroup.format( title="Log references" ) )
   
     hereThereBeLogs = "^^ !!! ALL LOG FILES ARE PRINTED TO SCREEN ABOVE FOR REFERENCE !!! ^^"
     refLogs  = getLogsPrintedStr( logs, os.path.abspath( options.masterLog ) )
@@ -243,7 +420,7 @@ def main() :
                       They are labeled as TEST|STEP then <test> or <test>.<step>, respectively.
                       Click on the above section to expand or collapse it.
 
-                      Sections with the errors summarized below are labelled above.
+                      Sections with the errors summarized at the start are labelled above.
 
                       If logs are too long and/or truncated, please download the logfiles via the artifacts
                       found via the summary page if available, otherwise download normally
@@ -256,19 +433,6 @@ def main() :
                                                                                                     ),
       flush=True )
 
-  if options.summaryOnly :
-    print( startGroup.format( title="Summary" ) )
-    
-  # Now do executive summary
-  print( getSummaryPrintedStr( logs, metadata ) )
-
-  note = inspect.cleandoc(
-                          """
-                              Note: HPC users should use '-s LOCAL' in reproduce command with caution
-                                    as it will run directly where you are, consider using an interactive node
-                          """
-                          )
-  print( note )
   # Force wait for stdout to be finished
   try:
     os.fsync( sys.stdout.fileno() )
@@ -10,7 +10,6 @@ import socket
 from collections import OrderedDict
 from multiprocessing import Pool
 from contextlib import redirect_stdout
-from datetime import timedelta
 
 import JSONCDecoder
 import SubmitCommon as sc
@@ -21,6 +20,16 @@ from SubmitArgpacks import SubmitArgpacks
 from Test           import Test
 from Step           import Step
 from HpcArgpacks    import HpcArgpacks
+from StepScheduler  import StepScheduler
+from AsyncScheduler import AsyncScheduler, Engine
+from JobSimulator   import JobSimulator, JobOrder, SimJob
+from StepCache      import StepCache
+from LocalResources import LocalResources
+from ParseCache     import ParseCache
+from SubmitLogger   import SubmitLogger, LogLevel
+from LogReader      import LogCompression
+from ResultsDB      import ResultsDB
+from Profiler       import Profiler
 
 
 
@@ -35,8 +44,12 @@ class Suite( SubmitAction ) :
     return "file"
 
   def __init__( self, name, options, defaultSubmitOptions, globalOpts, parent = "", rootDir = "./" ) :
-    self.tests_       = {}
+    self.tests_       = {} # only tests that have been needed so far
+    self.testNames_   = []
     self.testsStatus_ = {}
+    self.testsStdout_ = {}
+    self.results_     = None # results database of this run, if any
+    self.resultsRun_  = None
 
     super().__init__( name, options, defaultSubmitOptions, globalOpts, parent, rootDir )
 
@@ -49,12 +62,44 @@ class Suite( SubmitAction ) :
 
 
   def parseSpecificOptions( self ) :
-    for test, testDict in self.options_.items() :
-      if test != "submit_options" :
-        self.tests_[ test ] = Test( test, testDict, self.submitOptions_, self.globalOpts_, parent=self.ancestry(), rootDir=self.rootDir_ )
+    # Tests are constructed on first use, most runs only select a few
+    self.testNames_ = [ test for test in self.options_ if test != "submit_options" ]
 
     return [] # all keys are valid
 
+  def test( self, test ) :
+    if test not in self.tests_ :
+      if test not in self.testNames_ :
+        msg = "Error: no test named '{0}'".format( test )
+        self.log( msg )
+        raise Exception( msg )
+      self.tests_[ test ] = Test( test, self.options_[ test ], self.submitOptions_, self.globalOpts_, parent=self.ancestry(), rootDir=self.rootDir_ )
+    return self.tests_[ test ]
+
+  # Fully parse and validate every test, or only check the layout of those not being run
+  def validateTests( self, tests ) :
+    if self.globalOpts_.validateAll :
+      self.log( "Validating all {0} tests".format( len( self.testNames_ ) ) )
+      for test in self.testNames_ :
+        self.test( test ).validate()
+      return
+
+    errors = []
+    for test in self.testNames_ :
+      if test not in tests :
+        errors.extend( Test.checkStructure( test, self.options_[ test ] ) )
+    if errors :
+      for error in errors :
+        self.log( error )
+      msg = "Error: {0} structural errors found in unselected tests".format( len( errors ) )
+      self.log( msg )
+      raise Exception( msg )
+
+  def setGlobalOpts( self, globalOpts ) :
+    super().setGlobalOpts( globalOpts )
+    for test in self.tests_.values() :
+      test.setGlobalOpts( globalOpts )
+
   # Take immediate test return and output what happened
   def reportErrs( self, test, testLog ) :
     if testLog["success"] :
@@ -72,9 +117,51 @@ class Suite( SubmitAction ) :
     self.testsStatus_[ status[1][0] ][ "logfile" ] = status[2][0]
     self.reportErrs( status[1][0], self.testsStatus_[ status[1][0] ] )
 
+    # Record as soon as each test is done, the run may never finish
+    if self.results_ is not None and not self.globalOpts_.nopost :
+      try :
+        self.results_.addTest( self.resultsRun_, status[1][0], self.testLog( status[1][0] ) )
+      except Exception as e :
+        # This may be on the pool result thread, never let it die
+        self.log( "Could not record test {0} in results database : {1}".format( status[1][0], e ) )
+
+  # Master log entry of a completed test, its logs are only read once
+  def testLog( self, test ) :
+    testLog = self.testsStatus_[ test ]
+    if "steps" not in testLog :
+      # Everything logged must have reached the test stdout before reading from it
+      SubmitLogger.flush()
+      testLog[ "stdout" ] = self.testsStdout_[ test ]
+      testLog[ "line"   ] = SubmitAction.getLastLine( testLog[ "stdout" ] )
+      with open( testLog[ "logfile" ], "r" ) as stepsLogfile :
+        testLog[ "steps" ] = json.load( stepsLogfile, object_pairs_hook=OrderedDict )
+    return testLog
+
+  def openResults( self ) :
+    if self.globalOpts_.resultsDB is None :
+      return
+    self.results_    = ResultsDB( self.globalOpts_.resultsDB )
+    self.resultsRun_ = self.results_.startRun( self.globalOpts_.testsConfig, self.globalOpts_.forceFQDN, self.logfile_, self.metadata_ )
+    self.log( "Recording results in database {0} as run {1}".format( self.results_.filename_, self.resultsRun_ ) )
+
+  def closeResults( self, success ) :
+    if self.results_ is None :
+      return
+    self.results_.finishRun( self.resultsRun_, success )
+    self.results_.close()
+    self.results_ = None
+
+  # Summarize step cache use from the per-step "cached" flags of test logs
+  def reportCache( self, stepsLogs ) :
+    if self.globalOpts_.cache is None :
+      return
+    cached = [ stepLog[ "cached" ] for stepsLog in stepsLogs for stepLog in stepsLog.values() if "cached" in stepLog ]
+    self.log( "Step cache : {0} hits, {1} misses".format( cached.count( True ), cached.count( False ) ) )
+
   # Something happened, unsure if this is even recoverable, my guess is not
   def testError( self, e ) :
     self.log( "{fail} : Unknown test failed with exception '{err}'".format( fail=SubmitAction.FAILURE_STR, err=str(e) ) )
+    SubmitLogger.flush()
     print( e )
     exit( 1 )
   
@@ -91,7 +178,7 @@ class Suite( SubmitAction ) :
 
     self.log( "Computing maximum HPC resources of tests..." )
     # All steps must have the same submission type
-    hpcSubmit = [ step.submitOptions_.submitType_ for test in tests for step in self.tests_[ test ].steps_.values() if step.submitOptions_.submitType_ != sc.SubmissionType.LOCAL ]
+    hpcSubmit = [ step.submitOptions_.submitType_ for test in tests for step in self.test( test ).steps_.values() if step.submitOptions_.submitType_ != sc.SubmissionType.LOCAL ]
     allEqual  = ( not hpcSubmit or hpcSubmit.count( hpcSubmit[0] ) == len( hpcSubmit ) )
 
     if not allEqual :
@@ -108,87 +195,40 @@ class Suite( SubmitAction ) :
     maxResourcesPerTest = {}
     maxTimePerTest      = {}
     for test in tests :
-      self.tests_[ test ].log_push()
-      maxResourcesPerTest[ test ], maxTimePerTest[ test ] = self.tests_[ test ].getMaxHPCResources()
-      self.tests_[ test ].log_pop()
+      self.test( test ).log_push()
+      with Profiler.span( "join simulation", "suite", test=test ) :
+        maxResourcesPerTest[ test ], maxTimePerTest[ test ] = self.test( test ).getMaxHPCResources()
+      self.test( test ).log_pop()
     
     self.log_pop()
 
     
     longestTest = len( max( tests, key=len ) )
-    phase = 0
 
     # We need to break it down by expected runtime of each test by size of pool
-    # as that is the order they will run in. Could we optimize? Yea probably. Will we? Not right now
-    self.log( "Calculating expected runtime of tests across {0} workers [pool size]".format( self.globalOpts_.pool ) )
+    # as that is the order they will run in
+    self.log( "Calculating expected runtime of tests across {0} workers [pool size] in {1} order".format( self.globalOpts_.pool, self.globalOpts_.joinOrder ) )
     self.log_push()
-    
 
-    psuedoJobs = [ testname for testname in tests ]
-    psuedoRunningMap = {}
-
-    maxResources   = HpcArgpacks( OrderedDict() )
-    maxResources.setName( "maxlimit" )
-    maxTimelimit   = timedelta()
-    # Continue while we have jobs in queue or running
-    while len( psuedoJobs ) > 0 or len( psuedoRunningMap ) > 0 :
-      # If we have slots in our pool and jobs left, fill in
-      while len( psuedoRunningMap ) < self.globalOpts_.pool and len( psuedoJobs ) > 0 :
-        pjTest = psuedoJobs.pop( 0 )
-        psuedoRunningMap[ pjTest ] = { "hpc_arguments" : maxResourcesPerTest[pjTest], "timelimit" : maxTimePerTest[pjTest] }
-
-      # Find smallest job
-      runForKey = min( psuedoRunningMap, key= lambda k : psuedoRunningMap[k]["timelimit"] )
-      runFor    = copy.deepcopy( psuedoRunningMap[runForKey]["timelimit"] )
-      maxTimelimit += runFor
-      # "Run" for that amount of time
-      self.log( "Simulating threadpool for {0}".format( psuedoRunningMap[runForKey]["timelimit"] ) )
-      self.log_push()
-
-      for key in psuedoRunningMap.keys() :
-        psuedoRunningMap[ key ][ "timelimit" ] -= runFor
-
-      ##################################################################################################################
-      # RESOURCE CALCULATIONS
-      # What would our max resource consumption be whilst running this set?
-      # Add all concurrent resources together
-      currentResources = HpcArgpacks.joinAll( [ pj["hpc_arguments"] for pj in psuedoRunningMap.values() ], hpcSubmit[0], lambda rhs,lhs : rhs + lhs, print=self.log  )
-
-      # Get maximum
-      maxResources.join(
-                        currentResources,
-                        hpcSubmit[0],
-                        max,
-                        print=self.log
-                        )
+    def phaseInfo( phase, phaseTests, currentResources, runFor ) :
       self.log( "[PHASE {phase}] Resources for [ {tests} ] : '{res}', timelimit = {time}".format(
                                                                                                   phase=phase,
                                                                                                   tests=",".join(
                                                                                                                 "{0:>{1}}".format(
-                                                                                                                                  step, longestTest + ( 1 if len( psuedoRunningMap ) > 1 else 0 ) )
-                                                                                                                                  for step in psuedoRunningMap.keys()
+                                                                                                                                  test, longestTest + ( 1 if len( phaseTests ) > 1 else 0 ) )
+                                                                                                                                  for test in phaseTests
                                                                                                                 ),
                                                                                                   res=currentResources.format( hpcSubmit[0], print=lambda *args : None ),
                                                                                                   time=runFor
                                                                                                   )
                 )
-      phase += 1
-      #
-      ##################################################################################################################
-    
 
-      # Re-evaluate for any jobs that completed
-      completed = []
-      for testname in psuedoRunningMap :
-        if psuedoRunningMap[ testname ][ "timelimit" ].total_seconds() <= 0 :
-          completed.append( testname )
-
-      # Remove completed
-      for pj in completed :
-        psuedoRunningMap.pop( pj )
-
-      self.log( "{0} jobs completed during this runtime".format( len( completed ) ) )
-      self.log_pop()
+    simulator = JobSimulator(
+                              [ SimJob( test, maxTimePerTest[ test ], maxResourcesPerTest[ test ] ) for test in tests ],
+                              self.globalOpts_.pool,
+                              self.globalOpts_.joinOrder
+                              )
+    maxTimelimit, maxResources = simulator.run( hpcSubmit[0], phaseInfo=phaseInfo, print=lambda *args : None )
 
     # end of simulated runs
     self.log_pop()
@@ -296,7 +336,7 @@ class Suite( SubmitAction ) :
         testSuiteOutput = hpcJoinTest.steps_["submit"].logfile_
         self.log( "Joined HPC test output is : " )
         self.log( "*" *42 )
-        print( open( testSuiteOutput, "r" ).read() )
+        SubmitLogger.raw( open( testSuiteOutput, "r" ).read() + "\n" )
         self.log( "*" *42 )
 
         testSuiteLogs = {}
@@ -316,7 +356,7 @@ class Suite( SubmitAction ) :
             self.log_push()
             self.log( testLog[ "stdout" ] )
             self.log_pop()
-            self.tests_[ test ].reportErrs( testLog[ "steps" ], simple=True )
+            self.test( test ).reportErrs( testLog[ "steps" ], simple=True )
 
         return success, [ testLog["logfile"] for testLog in testSuiteLogs.values() ]
 
@@ -336,6 +376,22 @@ class Suite( SubmitAction ) :
   def runMultitest( self, tests ) :
     self.log( "Preparing to run multiple tests" )
     self.log_push()
+    # Tests are picked up by the pool in the order they are launched
+    launchOrder = tests
+    if self.globalOpts_.joinOrder != JobOrder.FIFO :
+      with Profiler.span( "launch order", "suite" ) :
+        estimates = { test : self.test( test ).estimateRuntime() for test in tests }
+        simulator = JobSimulator(
+                                  [ SimJob( test, estimates[ test ] ) for test in tests ],
+                                  self.globalOpts_.pool,
+                                  self.globalOpts_.joinOrder
+                                  )
+        launchOrder = simulator.sort( tests )
+      self.log( "Launching tests in {0} order : [ {1} ]".format( self.globalOpts_.joinOrder, ", ".join( launchOrder ) ) )
+      self.log_push()
+      for test in launchOrder :
+        self.log( "Estimated runtime of test {0} : {1}".format( test, estimates[ test ] ) )
+      self.log_pop()
     # Generate all options for tests
     # First deep copy
     individualTestOpts = [ copy.deepcopy( self.globalOpts_ ) for i in range( len( tests ) ) ]
@@ -344,6 +400,7 @@ class Suite( SubmitAction ) :
       opt.tests       = [tests[testIdx]]
       opt.redirect    = Suite.AUTO_REDIRECT_TEMPLATE.format( root=self.rootDir_, test=tests[testIdx] )
       opt.forceSingle = True
+      self.testsStdout_[ opt.tests[0] ] = opt.redirect
       self.log( "Automatically redirecting {0} to {1}".format(  opt.tests[0], opt.redirect ) )
 
 
@@ -369,28 +426,43 @@ class Suite( SubmitAction ) :
 
     self.log_pop()
 
-    self.log( "Spawning process pool of size {0} to perform {1} tests".format( self.globalOpts_.pool, len(tests) ) )
-    self.log_push()
-    results = {}
-    with Pool( processes=self.globalOpts_.pool ) as pool :
-      for individualTest in individualTestOpts :
-        self.log( "Launching test {0}".format( individualTest.tests[0] ) )
-        results[individualTest.tests[0]] = pool.apply_async(
-                                                            runSuite,
-                                                            ( individualTest, ),
-                                                            callback=self.testComplete
-                                                            )
-      
-      self.log( "Waiting for tests to complete - BE PATIENT" )
+    if self.globalOpts_.globalScheduler and self.globalOpts_.altdirs is not None :
+      self.log( "Global step scheduling cannot run tests from alternate directories, using process pool" )
 
-      # When using an error_callback, it hangs, this instead will force quit
-      for testname, res in results.items() :
-        res.get()
+    # Host resources are accounted for per process, every test process would think it has the whole host
+    if self.globalOpts_.pool > 1 and self.declaresLocalResources( tests ) :
+      if self.globalOpts_.altdirs is not None :
+        self.log( "Steps declare \"local_resources\", but tests in alternate directories each account for the whole host", level=LogLevel.WARNING )
+      elif not self.globalOpts_.globalScheduler :
+        self.log( "Steps declare \"local_resources\", but a process pool of tests cannot share host resources - forcing global step scheduling", level=LogLevel.WARNING )
+        self.globalOpts_.globalScheduler = True
 
-      pool.close()
-      pool.join()
+    if self.globalOpts_.globalScheduler and self.globalOpts_.altdirs is None :
+      self.runGlobalScheduler( tests, individualTestOpts )
+    else :
+      self.log( "Spawning process pool of size {0} to perform {1} tests".format( self.globalOpts_.pool, len(tests) ) )
+      self.log_push()
+      results = {}
+      with Pool( processes=self.globalOpts_.pool ) as pool :
+        for test in launchOrder :
+          individualTest = individualTestOpts[ tests.index( test ) ]
+          self.log( "Launching test {0}".format( individualTest.tests[0] ) )
+          results[individualTest.tests[0]] = pool.apply_async(
+                                                              runSuite,
+                                                              ( individualTest, ),
+                                                              callback=self.testComplete
+                                                              )
+        
+        self.log( "Waiting for tests to complete - BE PATIENT" )
 
-    self.log_pop()
+        # When using an error_callback, it hangs, this instead will force quit
+        for testname, res in results.items() :
+          res.get()
+
+        pool.close()
+        pool.join()
+
+      self.log_pop()
 
     if self.globalOpts_.nopost :
       self.log( "No results post-processing requested, testing complete" )
@@ -403,27 +475,18 @@ class Suite( SubmitAction ) :
       # Get all test logs
       testSuiteLogs = { "metadata" : self.metadata_ }
       failedTests   = []
-      for testIdx, test in enumerate( tests ) :
-        testSuiteLogs[ test ] = {}
-        testSuiteLogs[ test ][ "success" ] = self.testsStatus_[ test ][ "success" ]
-        testSuiteLogs[ test ][ "logfile" ] = self.testsStatus_[ test ][ "logfile" ]
-        # This isn't in the testStatus_ since it doesn't make sense to output that per-test
-        testSuiteLogs[ test ][ "stdout"  ] = individualTestOpts[testIdx].redirect
-        testSuiteLogs[ test ][ "line"    ] = SubmitAction.getLastLine( individualTestOpts[testIdx].redirect )
+      for test in tests :
+        testSuiteLogs[ test ] = self.testLog( test )
 
         if not self.testsStatus_[ test ][ "success" ] :
           failedTests.append( test )
 
-        stepsLog = None
-        with open( testSuiteLogs[ test ]["logfile"], "r" ) as stepsLogfile :
-          stepsLog = json.load( stepsLogfile, object_pairs_hook=OrderedDict )
-        testSuiteLogs[ test ][ "steps" ] = stepsLog
-
       with open( self.logfile_, "w" ) as testSuiteLogfile :
         json.dump( testSuiteLogs, testSuiteLogfile, indent=2 )
       
       # Now dump metadata so we can do list comprehension
       testSuiteLogs.pop( "metadata" )
+      self.reportCache( [ testLog[ "steps" ] for testLog in testSuiteLogs.values() ] )
       if failedTests :
         self.log( "{fail} : Tests [ {tests} ] failed".format( fail=SubmitAction.FAILURE_STR, tests=", ".join( failedTests ) ) )
       else :
@@ -432,7 +495,46 @@ class Suite( SubmitAction ) :
       return not ( False in [ testLog[ "success"] for testLog in testSuiteLogs.values() ] ), [ testSuiteLogs[ test ][ "logfile" ] for test in tests ]
 
     # Unsure where all logs will be, maybe probably
-    return True, [ self.tests_[ test ].logfile_ for test in tests ]
+    return True, [ self.test( test ).logfile_ for test in tests ]
+
+  def declaresLocalResources( self, tests ) :
+    return any(
+                step.submitOptions_.submitType_ == sc.SubmissionType.LOCAL and step.submitOptions_.getLocalResources() is not None
+                for test in tests for step in self.test( test ).steps_.values()
+                )
+
+  ##############################################################################
+  #
+  # Run the steps of all tests from this process with one scheduler, so the
+  # threadpool limit applies across every test instead of per test process.
+  # Each test still gets its own stdout file, same as the process pool
+  #
+  ##############################################################################
+  def runGlobalScheduler( self, tests, individualTestOpts ) :
+    self.log( "Spawning global step scheduler of size {0} to perform {1} tests".format( self.globalOpts_.threadpool, len(tests) ) )
+    self.log_push()
+
+    # Output from each test is routed to its own file based on who is printing
+    stdout = sys.stdout
+    sys.stdout = sc.StdoutRouter( stdout )
+    redirects = []
+    try :
+      for testIdx, test in enumerate( tests ) :
+        redirects.append( open( individualTestOpts[testIdx].redirect, "w" ) )
+        self.test( test ).stdout_ = redirects[-1]
+
+      self.log( "Waiting for tests to complete - BE PATIENT" )
+      schedulerType = AsyncScheduler if self.globalOpts_.engine == Engine.ASYNCIO else StepScheduler
+      scheduler = schedulerType( [ self.test( test ) for test in tests ], self.globalOpts_.threadpool )
+      scheduler.run( testComplete=self.testComplete )
+    finally :
+      # Everything logged must reach the test files before they close
+      SubmitLogger.flush()
+      sys.stdout = stdout
+      for redirect in redirects :
+        redirect.close()
+
+    self.log_pop()
 
   # main entry point for testing
   def run( self, tests ) :
@@ -441,12 +543,11 @@ class Suite( SubmitAction ) :
     self.log( "  Will return to this directory at the end of testing" )
 
     for test in tests :
-      if test not in self.tests_.keys() :
-        msg = "Error: no test named '{0}'".format( test )
-        self.log( msg )
-        raise Exception( msg )
-      
-      self.tests_[test].validate()
+      self.test( test ).validate()
+
+    # Test processes of a multitest were already checked by the parent
+    if not self.globalOpts_.forceSingle :
+      self.validateTests( tests )
 
     self.setWorkingDirectory()
 
@@ -457,21 +558,68 @@ class Suite( SubmitAction ) :
       success = True
       logs    = []
       for test in tests :
-        success = success and self.tests_[ test ].run()
-        logs.append( self.tests_[ test ].logfile_ )
+        with Profiler.span( test, "test" ) :
+          if self.globalOpts_.engine == Engine.ASYNCIO :
+            success = success and AsyncScheduler( [ self.test( test ) ], self.globalOpts_.threadpool ).run()[ self.test( test ).name_ ]
+          else :
+            success = success and self.test( test ).run()
+        logs.append( self.test( test ).logfile_ )
+      self.reportCache( [ { stepname : { "cached" : step.cached_ } for stepname, step in self.test( test ).steps_.items() if step.cached_ is not None } for test in tests ] )
     else :
       if hasattr( self.globalOpts_, 'joinHPC' ) :
         success, logs = self.runHPCJoin( tests )
       else :
-        success, logs = self.runMultitest( tests )
+        self.openResults()
+        success = False
+        try :
+          success, logs = self.runMultitest( tests )
+        finally :
+          self.closeResults( success )
     
     # Popping back to old cwd
     os.chdir( currentDir )
     return success, logs
 
+# Construct the suite, reusing a previously parsed one if a parse cache is in use
+def parseSuite( options, basename, opts, root ) :
+  parseCache = None
+  if options.parseCache is not None :
+    parseCache = ParseCache( options.parseCache )
+    prefix = ParseCache.prefix( options.testsConfig, options.forceFQDN )
+    # Everything that changes how the config is parsed and resolved for this host
+    key    = ParseCache.key(
+                            options.testsConfig,
+                            [ options.forceFQDN, root, options.globalPrefix, options.labelLength, opts.submitType_, opts.lockSubmitType_, opts.account_ ]
+                            )
+    testSuite = parseCache.load( prefix, key )
+    if testSuite is not None :
+      testSuite.setGlobalOpts( options )
+      testSuite.log( "Loaded parsed test suite from cache {0}".format( parseCache.entry( prefix, key ) ) )
+      return testSuite
+
+  with open( options.testsConfig, "r" ) as fp :
+    testSuite = Suite( 
+                      basename,
+                      json.load( fp, cls=JSONCDecoder.JSONCDecoder ),
+                      opts,
+                      options,
+                      parent=options.globalPrefix,
+                      rootDir=root
+                      )
+
+  if parseCache is not None :
+    # Store the tests this run needs so every process after us can skip parsing them
+    for test in options.tests :
+      testSuite.test( test )
+    parseCache.store( prefix, key, testSuite )
+    testSuite.log( "Stored parsed test suite in cache {0}".format( parseCache.entry( prefix, key ) ) )
+  return testSuite
+
 # A separated helper function to wrap this in a callable format
 def runSuite( options ) :
   sc.LABEL_LENGTH = options.labelLength
+  SubmitLogger.configure( options.logLevel, options.logJson )
+  Profiler.configure( options.profile )
 
   opts = SubmitOptions()
   opts.account_    = options.account
@@ -490,6 +638,21 @@ def runSuite( options ) :
     print( err )
     raise Exception( err )
 
+  if options.runtimePercentile is not None :
+    if options.resultsDB is None or not 0 < options.runtimePercentile <= 100 :
+      err = "Error: Runtime percentile must be in (0, 100] and requires a results database"
+      print( err )
+      raise Exception( err )
+
+  if options.localMemory is not None and LocalResources.parseMemory( options.localMemory ) is None :
+    err = "Error: Unable to parse local memory '{0}'".format( options.localMemory )
+    print( err )
+    raise Exception( err )
+
+  if options.compressLogs is not None and not options.compressLogs.available() :
+    print( "Compression {0} for logfiles requested, but not available - falling back to {1}".format( options.compressLogs, LogCompression.GZIP ) )
+    options.compressLogs = LogCompression.GZIP
+
   if options.inlineLocal and options.threadpool > 1 :
     print( "Inline stdout for steps requested, but steps' threadpool is greater than 1 - forcing threadpool to size 1 (serial)" )
     options.threadpool = 1
@@ -497,7 +660,6 @@ def runSuite( options ) :
   # Quickly convert to abs path
   options.testsConfig = os.path.abspath( options.testsConfig )
 
-  fp    = open( options.testsConfig, 'r' )
   # Go up one to get repo root - change this if you change the location of this script
   testDir = os.path.dirname( options.testsConfig )
   root  = os.path.abspath( ( testDir if testDir else "." )  + "/" + options.dirOffset )
@@ -510,33 +672,34 @@ def runSuite( options ) :
     # Use fqdn as the default host selection
     options.forceFQDN = socket.getfqdn() 
 
+  # Test processes of a multitest show up under their test
+  processName = options.tests[0] if options.forceSingle and len( options.tests ) == 1 else basename
+
   success = False
   logs    = []
   # Done at the highest level
   if options.redirect is not None :
     with open( options.redirect, "w" ) as redirect :
       with redirect_stdout( redirect ) :
-        testSuite = Suite( 
-                          basename,
-                          json.load( fp, cls=JSONCDecoder.JSONCDecoder ),
-                          opts,
-                          options,
-                          parent=options.globalPrefix,
-                          rootDir=root
-                          )
-        success, logs = testSuite.run( options.tests )
+        try :
+          with Profiler.span( "parse", "suite", config=options.testsConfig ) :
+            testSuite = parseSuite( options, basename, opts, root )
+          with Profiler.span( "suite", "suite", tests=options.tests ) :
+            success, logs = testSuite.run( options.tests )
+        finally :
+          SubmitLogger.flush()
+          Profiler.write( processName )
         # if success and options.message :
         #   print( options.message )
   else :
-    testSuite = Suite( 
-                      basename,
-                      json.load( fp, cls=JSONCDecoder.JSONCDecoder ),
-                      opts,
-                      options,
-                      parent=options.globalPrefix,
-                      rootDir=root
-                      )
-    success, logs = testSuite.run( options.tests )
+    try :
+      with Profiler.span( "parse", "suite", config=options.testsConfig ) :
+        testSuite = parseSuite( options, basename, opts, root )
+      with Profiler.span( "suite", "suite", tests=options.tests ) :
+        success, logs = testSuite.run( options.tests )
+    finally :
+      SubmitLogger.flush()
+      Profiler.write( processName )
     # if success and options.message :
     #   print( options.message ) 
 
@@ -686,7 +849,7 @@ def getOptionsParser():
   parser.add_argument(
                       "-tp", "--threadpool",
                       dest="threadpool",
-                      help="Threadpool size when running multiple steps, if serial step runs are desired set to 1",
+                      help="Threadpool size when running multiple steps, if serial step runs are desired set to 1. With --globalScheduler this limits steps across all tests",
                       default=4,
                       type=int
                       )
@@ -721,6 +884,132 @@ def getOptionsParser():
                       const=True,
                       action='store_const'
                       )
+  parser.add_argument(
+                      "-lc", "--localCpus",
+                      dest="localCpus",
+                      help="Cpus available to LOCAL steps declaring \"local_resources\", default is detected from host affinity and cgroup limits. Multiple tests declaring them share these through --globalScheduler",
+                      default=None,
+                      type=int
+                      )
+  parser.add_argument(
+                      "-lm", "--localMemory",
+                      dest="localMemory",
+                      help="Memory available to LOCAL steps declaring \"local_resources\", e.g. 64gb, default is detected from host and cgroup limits",
+                      default=None,
+                      type=str
+                      )
+  parser.add_argument(
+                      "-jo", "--joinOrder",
+                      dest="joinOrder",
+                      help="Order to start ready steps and tests in, also used when computing joined HPC resources : fifo (config order), lpt (longest timelimit first), cpf (longest chain of dependent timelimits first)",
+                      type=JobOrder,
+                      choices=list( JobOrder ),
+                      default=JobOrder.FIFO
+                      )
+  parser.add_argument(
+                      "-c", "--cache",
+                      dest="cache",
+                      help="Directory of step result cache, LOCAL steps with unchanged script, arguments, options and \"inputs\" files restore their previous successful logfile instead of running",
+                      default=None,
+                      type=str
+                      )
+  parser.add_argument(
+                      "-cms", "--cacheMaxSize",
+                      dest="cacheMaxSize",
+                      help="Size step result cache is trimmed to after running, least recently used first (default : %(default)s)",
+                      default="2gb",
+                      type=str
+                      )
+  parser.add_argument(
+                      "-cma", "--cacheMaxAge",
+                      dest="cacheMaxAge",
+                      help="Age in days after which unused step cache results are removed (default : %(default)s)",
+                      default=30,
+                      type=float
+                      )
+  parser.add_argument(
+                      "-gs", "--globalScheduler",
+                      dest="globalScheduler",
+                      help="Run steps of all tests from a single scheduler limited by --threadpool instead of a process pool of tests",
+                      default=False,
+                      const=True,
+                      action='store_const'
+                      )
+  parser.add_argument(
+                      "-ja", "--jobArrays",
+                      dest="jobArrays",
+                      help="Submit HPC steps of a test that share submit options and dependencies as one job array instead of a job each",
+                      default=False,
+                      const=True,
+                      action='store_const'
+                      )
+  parser.add_argument(
+                      "-e", "--engine",
+                      dest="engine",
+                      help="How steps are run : threads (a worker thread per running step) or asyncio (every step on one event loop, for many lightweight steps) (default : %(default)s)",
+                      type=Engine,
+                      choices=list( Engine ),
+                      default=Engine.THREADS
+                      )
+  parser.add_argument(
+                      "-va", "--validateAll",
+                      dest="validateAll",
+                      help="Fully parse and validate every test in the config, not only those selected to run",
+                      default=False,
+                      const=True,
+                      action='store_const'
+                      )
+  parser.add_argument(
+                      "-ll", "--logLevel",
+                      dest="logLevel",
+                      help="Least severe messages to output, debug includes argument pack tracing (default : %(default)s)",
+                      type=LogLevel,
+                      choices=list( LogLevel ),
+                      default=LogLevel.DEBUG
+                      )
+  parser.add_argument(
+                      "-lj", "--logJson",
+                      dest="logJson",
+                      help="Also append every message as a JSON line to this file, shared by all test processes",
+                      default=None,
+                      type=str
+                      )
+  parser.add_argument(
+                      "-pc", "--parseCache",
+                      dest="parseCache",
+                      help="Directory of parsed test suite cache, reused while the config, host, parsing options and framework are unchanged",
+                      default=None,
+                      type=str
+                      )
+  parser.add_argument(
+                      "-db", "--resultsDB",
+                      dest="resultsDB",
+                      help="SQLite database to also record results of every test and step in as they complete, shared across runs",
+                      default=None,
+                      type=str
+                      )
+  parser.add_argument(
+                      "-rp", "--runtimePercentile",
+                      dest="runtimePercentile",
+                      help="Estimate step runtimes when joining and ordering from this percentile of their past uncached LOCAL runtimes on this host in --resultsDB, capped by their timelimits",
+                      default=None,
+                      type=float
+                      )
+  parser.add_argument(
+                      "-z", "--compressLogs",
+                      dest="compressLogs",
+                      help="Compress LOCAL step logfiles as they are written, zstd falls back to gzip if not available",
+                      type=LogCompression,
+                      choices=list( LogCompression ),
+                      default=None
+                      )
+  parser.add_argument(
+                      "-pr", "--profile",
+                      dest="profile",
+                      help="Write a Chrome trace of where the framework spent its time across all test processes to this file, viewable in Perfetto",
+                      default=None,
+                      type=str
+                      )
   return parser
 
 class Options(object):
@@ -736,6 +1025,12 @@ def main() :
 
   success, tests, logs = runSuite( options )
 
+  if options.profile is not None :
+    print( "Wrote {0} profiling events to {1}".format( Profiler.merge(), options.profile ) )
+
+  if options.cache is not None :
+    StepCache.fromOptions( options ).evict()
+
   if not success :
     exit( 1 )
 
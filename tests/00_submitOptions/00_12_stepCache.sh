@@ -0,0 +1,94 @@
+#!/bin/sh
+# https://stackoverflow.com/a/29835459
+CURRENT_SOURCE_DIR=$( CDPATH= cd -- "$(dirname -- "$0")" && pwd )
+
+. $CURRENT_SOURCE_DIR/../scripts/helpers.sh
+. $CURRENT_SOURCE_DIR/../scripts/checkers.sh
+
+echo "Tests for $( basename $0 )"
+echo "Purpose:"
+echo "  Check that with a step cache, unchanged passing steps restore their results instead of running and failures are never cached"
+
+# Run twice against the same cache, the second run should be served from the cache
+redirect=$( mktemp $CURRENT_SOURCE_DIR/test_XXXX )
+cache=$( mktemp -d $CURRENT_SOURCE_DIR/cache_XXXX )
+suite=00_submitOptions
+suite_relfile=$suite.json
+suite_reloffset=""
+suiteStdout=$redirect
+$CURRENT_SOURCE_DIR/../../.ci/runner.py $CURRENT_SOURCE_DIR/$suite.json -t basic basic-fail-multistep -c $cache > /dev/null 2>&1
+$CURRENT_SOURCE_DIR/../../.ci/runner.py $CURRENT_SOURCE_DIR/$suite.json -t basic basic-fail-multistep -c $cache > $redirect 2>&1
+shouldFail=$?
+
+test0=basic
+test0_step0=step
+
+test1=basic-fail-multistep
+test1_step0=step-pass
+test1_step1=step-fail
+
+justify "<" "*" 100 "-->[SUITE FAILS OK] "
+reportTest                                                                      \
+  SUITE_FAILURE                                                                 \
+  "Suite should still report failure when a step fails with a cache"            \
+  1 0 $shouldFail
+result=$?
+
+justify "^" "*" 100 "->[CHECK LOGS EXIST]<-"
+$CURRENT_SOURCE_DIR/../scripts/helper_logs_generated.sh \
+  $result                                                 \
+  $CURRENT_SOURCE_DIR                                     \
+  $suite                                                  \
+  "$test0=[$test0_step0] $test1=[$test1_step0,$test1_step1]" \
+  "$suite_relfile"                                        \
+  "$suite_reloffset"                                      \
+  $suiteStdout
+result=$?
+
+justify "^" "*" 100 "->[CHECK CACHED TEST]<-"
+$CURRENT_SOURCE_DIR/../scripts/helper_masterlog_report.sh \
+  $result $CURRENT_SOURCE_DIR $suite                        \
+  $test0 true "$test0_step0=true"
+result=$?
+
+$CURRENT_SOURCE_DIR/../scripts/helper_step_stdout.sh $result $CURRENT_SOURCE_DIR $suite $test0 $test0_step0 "arg0 arg1" true
+result=$?
+
+masterlog=$( format $masterlog_fmt logdir=$CURRENT_SOURCE_DIR suite=$suite )
+justify "<" "*" 100 "-->[MASTERLOG CACHE] "
+for step in "$test0.$test0_step0=True" "$test1.$test1_step0=True" "$test1.$test1_step1=False"; do
+  stepTest=$( echo $step | awk -F '[.=]' '{print $1}' )
+  stepName=$( echo $step | awk -F '[.=]' '{print $2}' )
+  stepCached=$( echo $step | awk -F '[.=]' '{print $3}' )
+  checkTestJson                                                                 \
+    MASTERLOG_STEP_CACHED                                                       \
+    "Masterlog reports step [$stepTest.$stepName] cached as $stepCached"        \
+    0 $result                                                                   \
+    $masterlog                                                                  \
+    "['$stepTest']['steps']['$stepName']['cached']"                             \
+    $stepCached
+  result=$?
+done
+
+checkTest                                                                       \
+  MAIN_STDOUT_CACHE_REPORT                                                      \
+  "Main stdout reports cache hits and misses"                                   \
+  0 $result                                                                     \
+  $suiteStdout                                                                  \
+  "Step cache : 2 hits, 1 misses"
+result=$?
+
+checkTest                                                                       \
+  MAIN_STDOUT_CACHE_EVICT                                                       \
+  "Main stdout reports cache contents after trimming"                           \
+  0 $result                                                                     \
+  $suiteStdout                                                                  \
+  "Step cache .* holds 1 entries"
+result=$?
+
+# Cleanup run
+rm $redirect
+rm -r $cache
+rm $CURRENT_SOURCE_DIR/*.log
+
+exit $result
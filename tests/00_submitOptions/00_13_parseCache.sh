@@ -0,0 +1,95 @@
+#!/bin/sh
+# https://stackoverflow.com/a/29835459
+CURRENT_SOURCE_DIR=$( CDPATH= cd -- "$(dirname -- "$0")" && pwd )
+
+. $CURRENT_SOURCE_DIR/../scripts/helpers.sh
+. $CURRENT_SOURCE_DIR/../scripts/checkers.sh
+
+echo "Tests for $( basename $0 )"
+echo "Purpose:"
+echo "  Check that a parsed test suite is stored once and reused by the suite and every test process while the config is unchanged"
+
+# First run parses and stores, second run reuses everywhere
+redirect=$( mktemp $CURRENT_SOURCE_DIR/test_XXXX )
+cache=$( mktemp -d $CURRENT_SOURCE_DIR/cache_XXXX )
+suite=00_submitOptions
+suite_relfile=$suite.json
+suite_reloffset=""
+suiteStdout=$redirect
+$CURRENT_SOURCE_DIR/../../.ci/runner.py $CURRENT_SOURCE_DIR/$suite.json -t basic basic-fail-multistep -pc $cache > $redirect 2>&1
+firstStdout=$( mktemp $CURRENT_SOURCE_DIR/test_XXXX )
+mv $redirect $firstStdout
+$CURRENT_SOURCE_DIR/../../.ci/runner.py $CURRENT_SOURCE_DIR/$suite.json -t basic basic-fail-multistep -pc $cache > $redirect 2>&1
+shouldFail=$?
+
+test0=basic
+test0_step0=step
+
+test1=basic-fail-multistep
+test1_step0=step-pass
+test1_step1=step-fail
+
+justify "<" "*" 100 "-->[SUITE FAILS OK] "
+reportTest                                                                      \
+  SUITE_FAILURE                                                                 \
+  "Suite should still report failure when loaded from the parse cache"          \
+  1 0 $shouldFail
+result=$?
+
+justify "^" "*" 100 "->[CHECK LOGS EXIST]<-"
+$CURRENT_SOURCE_DIR/../scripts/helper_logs_generated.sh \
+  $result                                                 \
+  $CURRENT_SOURCE_DIR                                     \
+  $suite                                                  \
+  "$test0=[$test0_step0] $test1=[$test1_step0,$test1_step1]" \
+  "$suite_relfile"                                        \
+  "$suite_reloffset"                                      \
+  $suiteStdout
+result=$?
+
+justify "^" "*" 100 "->[CHECK CACHED SUITE REPORT]<-"
+$CURRENT_SOURCE_DIR/../scripts/helper_masterlog_report.sh \
+  $result $CURRENT_SOURCE_DIR $suite                        \
+  $test1 false "$test1_step0=true" "$test1_step1=false"
+result=$?
+
+justify "<" "*" 100 "-->[PARSE CACHE USE] "
+checkTest                                                                       \
+  MAIN_STDOUT_PARSE_CACHE_STORED                                                \
+  "First run stores parsed suite"                                               \
+  0 $result                                                                     \
+  $firstStdout                                                                  \
+  "Stored parsed test suite in cache $cache/"
+result=$?
+
+checkTest                                                                       \
+  MAIN_STDOUT_PARSE_CACHE_LOADED                                                \
+  "Second run loads parsed suite"                                               \
+  0 $result                                                                     \
+  $suiteStdout                                                                  \
+  "Loaded parsed test suite from cache $cache/"
+result=$?
+
+for test in $test0 $test1; do
+  checkTest                                                                     \
+    TEST_STDOUT_PARSE_CACHE_LOADED                                              \
+    "Test [$test] process loads parsed suite"                                   \
+    0 $result                                                                   \
+    $CURRENT_SOURCE_DIR/${test}_stdout.log                                      \
+    "Loaded parsed test suite from cache $cache/"
+  result=$?
+done
+
+test "$( ls $cache | wc -l )" -eq 1
+reportTest                                                                      \
+  PARSE_CACHE_SINGLE_ENTRY                                                      \
+  "Parse cache holds one entry for this config and host"                        \
+  0 $result $?
+result=$?
+
+# Cleanup run
+rm $redirect $firstStdout
+rm -r $cache
+rm $CURRENT_SOURCE_DIR/*.log
+
+exit $result
@@ -0,0 +1,93 @@
+#!/bin/sh
+# https://stackoverflow.com/a/29835459
+CURRENT_SOURCE_DIR=$( CDPATH= cd -- "$(dirname -- "$0")" && pwd )
+
+. $CURRENT_SOURCE_DIR/../scripts/helpers.sh
+. $CURRENT_SOURCE_DIR/../scripts/checkers.sh
+
+echo "Tests for $( basename $0 )"
+echo "Purpose:"
+echo "  Check that a less verbose log level drops argument pack tracing but not results, and that all processes write JSON log lines"
+
+redirect=$( mktemp $CURRENT_SOURCE_DIR/test_XXXX )
+jsonLog=$( mktemp $CURRENT_SOURCE_DIR/test_XXXX )
+suite=00_submitOptions
+suite_relfile=$suite.json
+suite_reloffset=""
+suiteStdout=$redirect
+$CURRENT_SOURCE_DIR/../../.ci/runner.py $CURRENT_SOURCE_DIR/$suite.json -t basic basic-regex -ll info -lj $jsonLog > $redirect 2>&1
+shouldPass=$?
+
+test0=basic
+test0_step0=step
+
+test1=basic-regex
+test1_step0=step
+
+justify "<" "*" 100 "-->[SUITE PASSES OK] "
+reportTest                                                                      \
+  SUITE_SUCCESS                                                                 \
+  "Suite should pass with less verbose logging"                                 \
+  0 0 $shouldPass
+result=$?
+
+justify "^" "*" 100 "->[CHECK LOGS EXIST]<-"
+$CURRENT_SOURCE_DIR/../scripts/helper_logs_generated.sh \
+  $result                                                 \
+  $CURRENT_SOURCE_DIR                                     \
+  $suite                                                  \
+  "$test0=[$test0_step0] $test1=[$test1_step0]"           \
+  "$suite_relfile"                                        \
+  "$suite_reloffset"                                      \
+  $suiteStdout
+result=$?
+
+justify "^" "*" 100 "->[CHECK TEST REPORT]<-"
+$CURRENT_SOURCE_DIR/../scripts/helper_masterlog_report.sh \
+  $result $CURRENT_SOURCE_DIR $suite                        \
+  $test1 true "$test1_step0=true"
+result=$?
+
+$CURRENT_SOURCE_DIR/../scripts/helper_step_stdout.sh $result $CURRENT_SOURCE_DIR $suite $test1 $test1_step0 "arg0 arg1 argRegex" true
+result=$?
+
+justify "<" "*" 100 "-->[LOG LEVEL] "
+checkTest                                                                       \
+  TEST_STDOUT_NO_ARGPACK_TRACE                                                  \
+  "Test stdout does not trace argument packs at info level"                     \
+  1 $result                                                                     \
+  $CURRENT_SOURCE_DIR/${test1}_stdout.log                                       \
+  "adding arguments pack"
+result=$?
+
+checkTest                                                                       \
+  TEST_STDOUT_RESULTS                                                           \
+  "Test stdout still reports step results at info level"                        \
+  0 $result                                                                     \
+  $CURRENT_SOURCE_DIR/${test1}_stdout.log                                       \
+  "\[step::$suite.$test1.$test1_step0\][ ]*\[SUCCESS\]"
+result=$?
+
+for test in $test0 $test1; do
+  checkTest                                                                     \
+    JSON_LOG_TEST_RECORDS                                                       \
+    "JSON log contains records from test [$test] process"                       \
+    0 $result                                                                   \
+    $jsonLog                                                                    \
+    "\"level\": \"info\", \"scope\": \"test\", \"name\": \"$suite.$test\""
+  result=$?
+done
+
+checkTest                                                                       \
+  JSON_LOG_SUITE_RECORDS                                                        \
+  "JSON log contains records from main process"                                 \
+  0 $result                                                                     \
+  $jsonLog                                                                      \
+  "\"scope\": \"file\", \"name\": \"$suite\", \"message\": \"\[SUCCESS\] : All tests passed\""
+result=$?
+
+# Cleanup run
+rm $redirect $jsonLog
+rm $CURRENT_SOURCE_DIR/*.log
+
+exit $result
@@ -0,0 +1,80 @@
+#!/bin/sh
+# https://stackoverflow.com/a/29835459
+CURRENT_SOURCE_DIR=$( CDPATH= cd -- "$(dirname -- "$0")" && pwd )
+
+. $CURRENT_SOURCE_DIR/../scripts/helpers.sh
+. $CURRENT_SOURCE_DIR/../scripts/checkers.sh
+
+echo "Tests for $( basename $0 )"
+echo "Purpose:"
+echo "  Check that compressed step logfiles are written with an uncompressed tail and still report the correct last lines"
+
+redirect=$( mktemp $CURRENT_SOURCE_DIR/test_XXXX )
+suite=00_submitOptions
+$CURRENT_SOURCE_DIR/../../.ci/runner.py $CURRENT_SOURCE_DIR/$suite.json -t basic basic-fail-multistep -z gzip > $redirect 2>&1
+shouldFail=$?
+
+justify "<" "*" 100 "-->[SUITE FAILS OK] "
+reportTest                                                                      \
+  SUITE_FAILURE                                                                 \
+  "Suite should still report failure when a step fails with compressed logs"    \
+  1 0 $shouldFail
+result=$?
+
+masterlog=$( format $masterlog_fmt logdir=$CURRENT_SOURCE_DIR suite=$suite )
+justify "<" "*" 100 "-->[COMPRESSED STEP LOGS] "
+for step in "basic|step|True|TEST echo_normal.sh PASS" "basic-fail-multistep|step-pass|True|TEST echo_normal.sh PASS" "basic-fail-multistep|step-fail|False|arg0 arg1"; do
+  stepTest=$( echo "$step" | awk -F '|' '{print $1}' )
+  stepName=$( echo "$step" | awk -F '|' '{print $2}' )
+  stepPass=$( echo "$step" | awk -F '|' '{print $3}' )
+  stepLine=$( echo "$step" | awk -F '|' '{print $4}' )
+  stepLog=$( format $stepStdout_fmt logdir=$CURRENT_SOURCE_DIR suite=$suite testname=$stepTest step=$stepName )
+
+  [ ! -f $stepLog ] && [ -f $stepLog.gz ] && [ -f $stepLog.tail ]
+  reportTest                                                                    \
+    STEP_LOG_COMPRESSED                                                         \
+    "Step [$stepTest.$stepName] logfile is only written compressed with a tail" \
+    0 $result $?
+  result=$?
+
+  [ "$( gzip -dc $stepLog.gz | tail -n 1 )" = "$stepLine" ] && [ "$( tail -n 1 $stepLog.tail )" = "$stepLine" ]
+  reportTest                                                                    \
+    STEP_LOG_CONTENTS                                                           \
+    "Step [$stepTest.$stepName] compressed logfile and tail end with '$stepLine'" \
+    0 $result $?
+  result=$?
+
+  checkTestJson                                                                 \
+    MASTERLOG_REPORT_STEP                                                       \
+    "Masterlog reports step [$stepTest.$stepName] success as $stepPass"         \
+    0 $result                                                                   \
+    $masterlog                                                                  \
+    "['$stepTest']['steps']['$stepName']['success']"                            \
+    $stepPass
+  result=$?
+
+  checkTestJson                                                                 \
+    MASTERLOG_REPORT_STEP_LASTLINE                                              \
+    "Masterlog contains last line from step [$stepTest.$stepName] tail"         \
+    0 $result                                                                   \
+    $masterlog                                                                  \
+    "['$stepTest']['steps']['$stepName']['line']"                               \
+    "$stepLine"
+  result=$?
+done
+
+# Reporter reads compressed logfiles transparently
+$CURRENT_SOURCE_DIR/../../.ci/reporter.py $masterlog -n > $redirect 2>&1
+checkTest                                                                       \
+  REPORTER_COMPRESSED                                                           \
+  "Reporter outputs compressed step logfile contents"                           \
+  0 $result                                                                     \
+  $redirect                                                                     \
+  "^TEST echo_normal.sh PASS"
+result=$?
+
+# Cleanup run
+rm $redirect
+rm $CURRENT_SOURCE_DIR/*.log $CURRENT_SOURCE_DIR/*.log.gz $CURRENT_SOURCE_DIR/*.log.tail
+
+exit $result
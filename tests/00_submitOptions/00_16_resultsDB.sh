@@ -0,0 +1,66 @@
+#!/bin/sh
+# https://stackoverflow.com/a/29835459
+CURRENT_SOURCE_DIR=$( CDPATH= cd -- "$(dirname -- "$0")" && pwd )
+
+. $CURRENT_SOURCE_DIR/../scripts/helpers.sh
+. $CURRENT_SOURCE_DIR/../scripts/checkers.sh
+
+echo "Tests for $( basename $0 )"
+echo "Purpose:"
+echo "  Check that a results database records every run and reads back the same as the master log"
+
+# Run twice into the same database, once with each scheduling mode
+redirect=$( mktemp $CURRENT_SOURCE_DIR/test_XXXX )
+resultsDB=$( mktemp -u $CURRENT_SOURCE_DIR/results_XXXX ).db
+suite=00_submitOptions
+$CURRENT_SOURCE_DIR/../../.ci/runner.py $CURRENT_SOURCE_DIR/$suite.json -t basic basic-fail-multistep -db $resultsDB > /dev/null 2>&1
+$CURRENT_SOURCE_DIR/../../.ci/runner.py $CURRENT_SOURCE_DIR/$suite.json -t basic basic-fail-multistep -db $resultsDB -gs > $redirect 2>&1
+shouldFail=$?
+
+justify "<" "*" 100 "-->[SUITE FAILS OK] "
+reportTest                                                                      \
+  SUITE_FAILURE                                                                 \
+  "Suite should still report failure when a step fails with a results database" \
+  1 0 $shouldFail
+result=$?
+
+checkTest                                                                       \
+  MAIN_STDOUT_RESULTS_RUN                                                       \
+  "Main stdout reports the run recorded in the results database"                \
+  0 $result                                                                     \
+  $redirect                                                                     \
+  "Recording results in database .* as run 2"
+result=$?
+
+masterlog=$( format $masterlog_fmt logdir=$CURRENT_SOURCE_DIR suite=$suite )
+justify "<" "*" 100 "-->[RESULTS DATABASE] "
+python3 -c "import sys, json; sys.path.insert( 0, '$CURRENT_SOURCE_DIR/../../.ci' ); from ResultsDB import ResultsDB; exit( ResultsDB( '$resultsDB' ).masterLog()[1] != json.load( open( '$masterlog' ) ) )"
+reportTest                                                                      \
+  RESULTS_MASTERLOG                                                             \
+  "Results database latest run reads back identical to the master log"          \
+  0 $result $?
+result=$?
+
+$CURRENT_SOURCE_DIR/../../.ci/ResultsDB.py $resultsDB -f basic-fail-multistep > $redirect 2>&1
+[ $( grep -c "Steps \[ step-fail \] failed" $redirect ) -eq 2 ]
+reportTest                                                                      \
+  RESULTS_FAILURES                                                              \
+  "Results database has the failures of both runs"                              \
+  0 $result $?
+result=$?
+
+$CURRENT_SOURCE_DIR/../../.ci/reporter.py $resultsDB -db -ri 1 -s -n > $redirect 2>&1
+checkTest                                                                       \
+  REPORTER_RESULTS_RUN                                                          \
+  "Reporter outputs summary of a run from the results database"                 \
+  0 $result                                                                     \
+  $redirect                                                                     \
+  "step-fail *arg0 arg1"
+result=$?
+
+# Cleanup run
+rm $redirect
+rm -f $resultsDB $resultsDB-wal $resultsDB-shm
+rm $CURRENT_SOURCE_DIR/*.log
+
+exit $result
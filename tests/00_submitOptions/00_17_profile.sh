@@ -0,0 +1,60 @@
+#!/bin/sh
+# https://stackoverflow.com/a/29835459
+CURRENT_SOURCE_DIR=$( CDPATH= cd -- "$(dirname -- "$0")" && pwd )
+
+. $CURRENT_SOURCE_DIR/../scripts/helpers.sh
+. $CURRENT_SOURCE_DIR/../scripts/checkers.sh
+
+echo "Tests for $( basename $0 )"
+echo "Purpose:"
+echo "  Check that profiling merges spans of every test process into one Chrome trace"
+
+redirect=$( mktemp $CURRENT_SOURCE_DIR/test_XXXX )
+profile=$( mktemp -u $CURRENT_SOURCE_DIR/profile_XXXX ).json
+suite=00_submitOptions
+$CURRENT_SOURCE_DIR/../../.ci/runner.py $CURRENT_SOURCE_DIR/$suite.json -t basic basic-fail-multistep -pr $profile > $redirect 2>&1
+shouldFail=$?
+
+justify "<" "*" 100 "-->[SUITE FAILS OK] "
+reportTest                                                                      \
+  SUITE_FAILURE                                                                 \
+  "Suite should still report failure when a step fails while profiling"         \
+  1 0 $shouldFail
+result=$?
+
+checkTest                                                                       \
+  MAIN_STDOUT_PROFILE                                                           \
+  "Main stdout reports where the profile was written"                           \
+  0 $result                                                                     \
+  $redirect                                                                     \
+  "Wrote [0-9]* profiling events to $profile"
+result=$?
+
+justify "<" "*" 100 "-->[PROFILE] "
+python3 -c "import json; events = json.load( open( '$profile' ) )[ 'traceEvents' ]; exit( len( set( event[ 'pid' ] for event in events ) ) < 2 )"
+reportTest                                                                      \
+  PROFILE_PROCESSES                                                             \
+  "Profile holds the runner and test processes"                                 \
+  0 $result $?
+result=$?
+
+python3 -c "import json; events = json.load( open( '$profile' ) )[ 'traceEvents' ]; exit( [ event[ 'name' ] for event in events ].count( 'lock wait' ) != 3 )"
+reportTest                                                                      \
+  PROFILE_STEPS                                                                 \
+  "Profile has the lock wait of every step"                                     \
+  0 $result $?
+result=$?
+
+[ -z "$( ls $profile.*.part 2>/dev/null )" ]
+reportTest                                                                      \
+  PROFILE_PARTS                                                                 \
+  "Profile parts of test processes are removed once merged"                     \
+  0 $result $?
+result=$?
+
+# Cleanup run
+rm $redirect
+rm -f $profile
+rm $CURRENT_SOURCE_DIR/*.log
+
+exit $result
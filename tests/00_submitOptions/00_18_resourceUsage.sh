@@ -0,0 +1,85 @@
+#!/bin/sh
+# https://stackoverflow.com/a/29835459
+CURRENT_SOURCE_DIR=$( CDPATH= cd -- "$(dirname -- "$0")" && pwd )
+
+. $CURRENT_SOURCE_DIR/../scripts/helpers.sh
+. $CURRENT_SOURCE_DIR/../scripts/checkers.sh
+
+echo "Tests for $( basename $0 )"
+echo "Purpose:"
+echo "  Check that resource usage of LOCAL steps is logged and recorded, even in a results database from an older runner"
+
+# Results database as made before resource usage was recorded
+redirect=$( mktemp $CURRENT_SOURCE_DIR/test_XXXX )
+resultsDB=$( mktemp -u $CURRENT_SOURCE_DIR/results_XXXX ).db
+python3 -c "import sys, sqlite3; sys.path.insert( 0, '$CURRENT_SOURCE_DIR/../../.ci' ); from ResultsDB import RESULTS_SCHEMA; sqlite3.connect( '$resultsDB' ).executescript( RESULTS_SCHEMA.replace( '  user    REAL,\n  system  REAL,\n  maxrss  INTEGER,\n', '' ) )"
+
+suite=00_submitOptions
+test0=basic
+test0_step0=step
+$CURRENT_SOURCE_DIR/../../.ci/runner.py $CURRENT_SOURCE_DIR/$suite.json -t $test0 -db $resultsDB > $redirect 2>&1
+result=$?
+
+justify "<" "*" 100 "-->[SUITE RUNS OK] "
+reportTest                                                                      \
+  SUITE_SUCCESS                                                                 \
+  "Suite should report success when everything passes"                          \
+  0 0 $result
+result=$?
+
+checkTest                                                                       \
+  MAIN_STDOUT_RESULTS_RECORDED                                                  \
+  "Main stdout should not report failing to record the test"                    \
+  1 $result                                                                     \
+  $redirect                                                                     \
+  "Could not record test"
+result=$?
+
+masterlog=$( format $masterlog_fmt logdir=$CURRENT_SOURCE_DIR suite=$suite )
+testlog=$( format $testlog_fmt logdir=$CURRENT_SOURCE_DIR suite=$suite testname=$test0 )
+
+justify "<" "*" 100 "-->[RESOURCE USAGE LOGGED] "
+for field in user system maxrss; do
+  checkJson $testlog "['$test0_step0']['$field'] is not None" "True"
+  reportTest                                                                    \
+    TESTLOG_STEP_USAGE                                                          \
+    "Test log has [$field] of step [$test0_step0]"                              \
+    0 $result $?
+  result=$?
+
+  checkJson $masterlog "['$test0']['steps']['$test0_step0']['$field'] is not None" "True"
+  reportTest                                                                    \
+    MASTERLOG_STEP_USAGE                                                        \
+    "Master log has [$field] of step [$test0_step0]"                            \
+    0 $result $?
+  result=$?
+done
+
+checkJson $masterlog "['$test0']['steps']['$test0_step0']['maxrss'] > 0" "True"
+reportTest                                                                      \
+  MASTERLOG_STEP_MAXRSS                                                         \
+  "Master log has nonzero peak RSS of step [$test0_step0]"                      \
+  0 $result $?
+result=$?
+
+justify "<" "*" 100 "-->[RESULTS DATABASE UPGRADED] "
+python3 -c "import sys; sys.path.insert( 0, '$CURRENT_SOURCE_DIR/../../.ci' ); from ResultsDB import ResultsDB, RESULTS_VERSION; db = ResultsDB( '$resultsDB' ); exit( db.db_.execute( 'PRAGMA user_version' ).fetchone()[0] != RESULTS_VERSION )"
+reportTest                                                                      \
+  RESULTS_VERSION                                                               \
+  "Results database is upgraded to the current schema version"                  \
+  0 $result $?
+result=$?
+
+python3 -c "import sys, json; sys.path.insert( 0, '$CURRENT_SOURCE_DIR/../../.ci' ); from ResultsDB import ResultsDB; exit( ResultsDB( '$resultsDB' ).masterLog()[1] != json.load( open( '$masterlog' ) ) )"
+reportTest                                                                      \
+  RESULTS_MASTERLOG                                                             \
+  "Results database run with resource usage reads back identical to the master log" \
+  0 $result $?
+result=$?
+
+# Cleanup run
+rm $redirect
+rm -f $resultsDB $resultsDB-wal $resultsDB-shm
+rm $CURRENT_SOURCE_DIR/*.log
+
+exit $result
@@ -0,0 +1,159 @@
+#!/bin/sh
+# https://stackoverflow.com/a/29835459
+CURRENT_SOURCE_DIR=$( CDPATH= cd -- "$(dirname -- "$0")" && pwd )
+
+. $CURRENT_SOURCE_DIR/../scripts/helpers.sh
+. $CURRENT_SOURCE_DIR/../scripts/checkers.sh
+
+echo "Tests for $( basename $0 )"
+echo "Purpose:"
+echo "  Check that the reporter only outputs the head, tail and error windows of logfiles asked for"
+
+# A failed test whose step logged 100 lines, an error halfway and the failure reason last
+redirect=$( mktemp $CURRENT_SOURCE_DIR/test_XXXX )
+dump=$( mktemp $CURRENT_SOURCE_DIR/test_XXXX )
+suite=00_submitOptions
+test0=windows
+test0_step0=step
+masterlog=$( format $masterlog_fmt logdir=$CURRENT_SOURCE_DIR suite=$suite )
+testStdout=$( format $testStdout_fmt logdir=$CURRENT_SOURCE_DIR suite=$suite testname=$test0 )
+stepStdout=$( format $stepStdout_fmt logdir=$CURRENT_SOURCE_DIR suite=$suite testname=$test0 step=$test0_step0 )
+
+writeStepLog()
+{
+  i=1
+  while [ $i -lt 100 ]; do
+    if [ $i -eq 50 ]; then
+      echo "ERROR at line $i"
+    else
+      echo "logline $i"
+    fi
+    i=$(( i + 1 ))
+  done
+  echo "step failed reason"
+}
+
+echo "TEST $test0 FAILED" > $testStdout
+writeStepLog > $stepStdout
+
+cat << EOF > $masterlog
+{
+  "metadata" : { "rel_file" : "$suite.json", "rel_offset" : "" },
+  "$test0" :
+  {
+    "success" : false, "logfile" : "", "stdout" : "$testStdout", "line" : "TEST $test0 FAILED",
+    "steps" : { "$test0_step0" : { "logfile" : "$stepStdout", "success" : false, "line" : "step failed reason" } }
+  }
+}
+EOF
+
+# Only what the reporter output for the step logfile
+reportStep()
+{
+  $CURRENT_SOURCE_DIR/../../.ci/reporter.py $masterlog -n $* > $redirect 2>&1
+  awk '/^Opening logfile .*'$test0.$test0_step0'.log/,/^Closing logfile/' $redirect > $dump
+}
+
+# Which step lines were output, in order
+shownLines()
+{
+  grep -Eo "^(logline [0-9]+|ERROR at line [0-9]+|step failed reason)$" $dump | awk '{print $NF}' | tr '\n' ' '
+}
+
+checkShown()
+{
+  func_testname="$1"
+  func_testdesc="$2"
+  func_previousResult=$3
+  func_expect="$4"
+  func_shown=$( shownLines )
+  test "$func_shown" = "$func_expect"
+  reportTest $func_testname "$func_testdesc [$func_shown]" 0 $func_previousResult $?
+  return $?
+}
+
+result=0
+
+justify "<" "*" 100 "-->[TAIL LINES] "
+reportStep -tl 5
+checkShown                                                                      \
+  REPORTER_TAIL                                                                 \
+  "Last 5 lines of step are output"                                             \
+  $result "96 97 98 99 reason "
+result=$?
+
+checkTest                                                                       \
+  REPORTER_TAIL_ELIDED                                                          \
+  "Earlier lines of step are marked as elided"                                  \
+  0 $result                                                                     \
+  $dump                                                                         \
+  "^\[\.\.\. earlier lines elided \.\.\.\]"
+result=$?
+
+# Compressed with a sidecar, reading from the end never decompresses the log
+rm $stepStdout
+writeStepLog | python3 -c "import sys; sys.path.insert( 0, '$CURRENT_SOURCE_DIR/../../.ci' ); import LogReader; f = LogReader.LogWriter( '$stepStdout', LogReader.LogCompression.GZIP ); f.write( sys.stdin.buffer.read() ); f.close()"
+echo "not gzip" > $stepStdout.gz
+reportStep -tl 5
+checkShown                                                                      \
+  REPORTER_TAIL_SIDECAR                                                         \
+  "Last 5 lines of compressed step are output from its sidecar"                 \
+  $result "96 97 98 99 reason "
+result=$?
+rm $stepStdout.gz $stepStdout.tail
+
+writeStepLog > $stepStdout
+
+justify "<" "*" 100 "-->[HEAD LINES] "
+reportStep -hl 3
+checkShown                                                                      \
+  REPORTER_HEAD                                                                 \
+  "First 3 lines and the last line of step are output"                          \
+  $result "1 2 3 reason "
+result=$?
+
+checkTest                                                                       \
+  REPORTER_HEAD_ELIDED                                                          \
+  "Lines between are marked as elided"                                          \
+  0 $result                                                                     \
+  $dump                                                                         \
+  "^\[96 lines elided in total\]"
+result=$?
+
+justify "<" "*" 100 "-->[HEAD AND TAIL LINES] "
+reportStep -hl 2 -tl 3
+checkShown                                                                      \
+  REPORTER_HEAD_TAIL                                                            \
+  "First 2 and last 3 lines of step are output"                                 \
+  $result "1 2 98 99 reason "
+result=$?
+
+justify "<" "*" 100 "-->[ERROR PATTERNS] "
+reportStep -ep "^ERROR" -cl 2
+checkShown                                                                      \
+  REPORTER_ERROR_CONTEXT                                                        \
+  "Error line with 2 lines of context and the last line of step are output"     \
+  $result "48 49 50 51 52 reason "
+result=$?
+
+reportStep -ep "^ERROR" -cl 0 -tl 2
+checkShown                                                                      \
+  REPORTER_ERROR_TAIL                                                           \
+  "Error line and last 2 lines of step are output"                              \
+  $result "50 99 reason "
+result=$?
+
+justify "<" "*" 100 "-->[NO WINDOWS] "
+reportStep
+[ $( shownLines | wc -w ) -eq 100 ]
+reportTest                                                                      \
+  REPORTER_WHOLE                                                                \
+  "Every line of step is output"                                                \
+  0 $result $?
+result=$?
+
+# Cleanup run
+rm $redirect $dump
+rm $CURRENT_SOURCE_DIR/*.log
+
+exit $result
@@ -0,0 +1,101 @@
+#!/bin/sh
+# https://stackoverflow.com/a/29835459
+CURRENT_SOURCE_DIR=$( CDPATH= cd -- "$(dirname -- "$0")" && pwd )
+
+. $CURRENT_SOURCE_DIR/../scripts/helpers.sh
+. $CURRENT_SOURCE_DIR/../scripts/checkers.sh
+
+echo "Tests for $( basename $0 )"
+echo "Purpose:"
+echo "  Check that tests not selected are only checked for layout, unless all tests are validated with --validateAll"
+
+# An unselected test whose layout is fine but that fails to fully parse
+redirect=$( mktemp $CURRENT_SOURCE_DIR/test_XXXX )
+suite=$( mktemp $CURRENT_SOURCE_DIR/validate_XXXX )
+test0=good
+test1=badDependency
+cat << EOF > $suite.json
+{
+  "submit_options" : { "working_directory" : "../../", "submission" : "LOCAL" },
+  "$test0" : { "steps" : { "step" : { "command" : "./tests/scripts/echo_normal.sh" } } },
+  "$test1" :
+  {
+    "steps" :
+    {
+      "stepA" : { "command" : "./tests/scripts/echo_normal.sh" },
+      "stepB" : { "command" : "./tests/scripts/echo_normal.sh", "dependencies" : { "stepA" : "afterfoo" } }
+    }
+  }
+}
+EOF
+
+$CURRENT_SOURCE_DIR/../../.ci/runner.py $suite.json -t $test0 > $redirect 2>&1
+result=$?
+
+justify "<" "*" 100 "-->[UNSELECTED NOT PARSED] "
+reportTest                                                                      \
+  SUITE_SUCCESS                                                                 \
+  "Suite should report success when only the unselected test is invalid"        \
+  0 0 $result
+result=$?
+
+checkTest                                                                       \
+  MAIN_STDOUT_NOT_VALIDATED                                                     \
+  "Main stdout should not report the invalid dependency of [$test1]"            \
+  1 $result                                                                     \
+  $redirect                                                                     \
+  "afterfoo"
+result=$?
+
+$CURRENT_SOURCE_DIR/../../.ci/runner.py $suite.json -t $test0 -va > $redirect 2>&1
+shouldFail=$?
+
+justify "<" "*" 100 "-->[VALIDATE ALL] "
+reportTest                                                                      \
+  SUITE_FAILURE                                                                 \
+  "Suite should report failure validating all tests"                            \
+  1 $result $shouldFail
+result=$?
+
+checkTest                                                                       \
+  MAIN_STDOUT_VALIDATE_ALL                                                      \
+  "Main stdout reports validating every test"                                   \
+  0 $result                                                                     \
+  $redirect                                                                     \
+  "Validating all 2 tests"
+result=$?
+
+checkTest                                                                       \
+  MAIN_STDOUT_VALIDATED                                                         \
+  "Main stdout reports the invalid dependency of [$test1]"                      \
+  0 $result                                                                     \
+  $redirect                                                                     \
+  "'afterfoo' is not a valid"
+result=$?
+
+# Layout errors of unselected tests are still found without parsing them
+sed -i "s/\"command\" : \"\.\/tests\/scripts\/echo_normal.sh\", \"dependencies\"/\"comand\" : \".\/tests\/scripts\/echo_normal.sh\", \"dependencies\"/" $suite.json
+$CURRENT_SOURCE_DIR/../../.ci/runner.py $suite.json -t $test0 > $redirect 2>&1
+shouldFail=$?
+
+justify "<" "*" 100 "-->[UNSELECTED LAYOUT CHECKED] "
+reportTest                                                                      \
+  SUITE_FAILURE                                                                 \
+  "Suite should report failure when the unselected test has an invalid key"     \
+  1 $result $shouldFail
+result=$?
+
+checkTest                                                                       \
+  MAIN_STDOUT_STRUCTURE                                                         \
+  "Main stdout reports the invalid key of [$test1]"                             \
+  0 $result                                                                     \
+  $redirect                                                                     \
+  "Invalid key in step '$test1.stepB' : comand"
+result=$?
+
+# Cleanup run
+rm $redirect
+rm $suite $suite.json
+rm -f $CURRENT_SOURCE_DIR/*.log
+
+exit $result
@@ -0,0 +1,139 @@
+#!/bin/sh
+# https://stackoverflow.com/a/29835459
+CURRENT_SOURCE_DIR=$( CDPATH= cd -- "$(dirname -- "$0")" && pwd )
+
+. $CURRENT_SOURCE_DIR/../scripts/helpers.sh
+. $CURRENT_SOURCE_DIR/../scripts/checkers.sh
+
+echo "Tests for $( basename $0 )"
+echo "Purpose:"
+echo "  Check that relocating a run rewrites references to its logs and transfers step logs untouched, incrementally if asked"
+
+# Compressed step logs come with an uncompressed tail that must move along with them
+redirect=$( mktemp $CURRENT_SOURCE_DIR/test_XXXX )
+suite=00_submitOptions
+test0=basic
+test0_step0=step
+test1=basic-fail-multistep
+test1_step0=step-pass
+test1_step1=step-fail
+$CURRENT_SOURCE_DIR/../../.ci/runner.py $CURRENT_SOURCE_DIR/$suite.json -t $test0 $test1 -z gzip > $redirect 2>&1
+
+masterlog=$( format $masterlog_fmt logdir=$CURRENT_SOURCE_DIR suite=$suite )
+result=0
+
+for mode in hardlink reflink; do
+  # Next to the run so hardlinks are possible
+  relocation=$( mktemp -d $CURRENT_SOURCE_DIR/relocated_XXXX )
+  $CURRENT_SOURCE_DIR/../../.ci/relocator.py $masterlog $relocation -m $mode > $redirect 2>&1
+  relocateResult=$?
+
+  justify "<" "*" 100 "-->[RELOCATE BY $mode] "
+  reportTest                                                                    \
+    RELOCATE_SUCCESS                                                            \
+    "Relocating by $mode should succeed"                                        \
+    0 $result $relocateResult
+  result=$?
+
+  # Step logs are compressed with a tail, test stdout is not
+  checkTest                                                                     \
+    RELOCATE_TRANSFERRED                                                        \
+    "All step logfiles and tails and test stdouts are transferred"              \
+    0 $result                                                                   \
+    $redirect                                                                   \
+    "Rewrote 3 logs, transferred 8 of 8 logfiles by $mode"
+  result=$?
+
+  relocatedMasterlog=$( format $masterlog_fmt logdir=$relocation suite=$suite )
+  for log in $relocatedMasterlog $( format $testlog_fmt logdir=$relocation suite=$suite testname=$test0 ) $( format $testlog_fmt logdir=$relocation suite=$suite testname=$test1 ); do
+    # Original logs sit directly in the source directory, the relocated ones below it
+    [ -f $log ] && ! grep -Eq "\"$CURRENT_SOURCE_DIR/[^/\"]+\"" $log && grep -q "\"$relocation/" $log
+    reportTest                                                                  \
+      RELOCATE_REFERENCES                                                       \
+      "References in $( basename $log ) point to the relocated logs"            \
+      0 $result $?
+    result=$?
+  done
+
+  checkJson $relocatedMasterlog "['$test1']['steps']['$test1_step1']['logfile']" "$( format $stepStdout_fmt logdir=$relocation suite=$suite testname=$test1 step=$test1_step1 )"
+  reportTest                                                                    \
+    RELOCATE_MASTERLOG_STEP                                                     \
+    "Master log step logfile is the relocated one"                              \
+    0 $result $?
+  result=$?
+
+  for step in $test0=$test0_step0 $test1=$test1_step0 $test1=$test1_step1; do
+    stepTest=$( echo $step | awk -F '=' '{print $1}' )
+    stepName=$( echo $step | awk -F '=' '{print $2}' )
+    stepLog=$( format $stepStdout_fmt logdir=$CURRENT_SOURCE_DIR suite=$suite testname=$stepTest step=$stepName )
+    relocatedStepLog=$( format $stepStdout_fmt logdir=$relocation suite=$suite testname=$stepTest step=$stepName )
+    cmp -s $stepLog.gz $relocatedStepLog.gz && cmp -s $stepLog.tail $relocatedStepLog.tail
+    reportTest                                                                  \
+      RELOCATE_STEP_IDENTICAL                                                   \
+      "Step [$stepTest.$stepName] compressed logfile and tail are byte-identical" \
+      0 $result $?
+    result=$?
+
+    if [ "$mode" = "hardlink" ]; then
+      [ $stepLog.gz -ef $relocatedStepLog.gz ] && [ $stepLog.tail -ef $relocatedStepLog.tail ]
+      reportTest                                                                \
+        RELOCATE_STEP_HARDLINK                                                  \
+        "Step [$stepTest.$stepName] compressed logfile and tail are hardlinked" \
+        0 $result $?
+      result=$?
+    fi
+  done
+
+  # Nothing changed since, so nothing to transfer again
+  $CURRENT_SOURCE_DIR/../../.ci/relocator.py $masterlog $relocation -m $mode -i > $redirect 2>&1
+  relocateResult=$?
+
+  justify "<" "*" 100 "-->[RELOCATE INCREMENTAL BY $mode] "
+  reportTest                                                                    \
+    RELOCATE_SUCCESS                                                            \
+    "Relocating again incrementally by $mode should succeed"                    \
+    0 $result $relocateResult
+  result=$?
+
+  checkTest                                                                     \
+    RELOCATE_INCREMENTAL                                                        \
+    "Unchanged logfiles are not transferred again"                              \
+    0 $result                                                                   \
+    $redirect                                                                   \
+    "Rewrote 3 logs, transferred 0 of 8 logfiles by $mode"
+  result=$?
+
+  if [ "$mode" = "hardlink" ]; then
+    # Copies replace the links rather than copying onto the files linked to
+    $CURRENT_SOURCE_DIR/../../.ci/relocator.py $masterlog $relocation -m copy > $redirect 2>&1
+    relocateResult=$?
+
+    justify "<" "*" 100 "-->[RELOCATE BY copy OVER $mode] "
+    reportTest                                                                  \
+      RELOCATE_SUCCESS                                                          \
+      "Relocating by copy over logs relocated by $mode should succeed"          \
+      0 $result $relocateResult
+    result=$?
+
+    for step in $test0=$test0_step0 $test1=$test1_step0 $test1=$test1_step1; do
+      stepTest=$( echo $step | awk -F '=' '{print $1}' )
+      stepName=$( echo $step | awk -F '=' '{print $2}' )
+      stepLog=$( format $stepStdout_fmt logdir=$CURRENT_SOURCE_DIR suite=$suite testname=$stepTest step=$stepName )
+      relocatedStepLog=$( format $stepStdout_fmt logdir=$relocation suite=$suite testname=$stepTest step=$stepName )
+      cmp -s $stepLog.gz $relocatedStepLog.gz && [ ! $stepLog.gz -ef $relocatedStepLog.gz ] && [ ! $stepLog.tail -ef $relocatedStepLog.tail ]
+      reportTest                                                                \
+        RELOCATE_STEP_COPIED                                                    \
+        "Step [$stepTest.$stepName] compressed logfile and tail are copies"     \
+        0 $result $?
+      result=$?
+    done
+  fi
+
+  rm -rf $relocation
+done
+
+# Cleanup run
+rm $redirect
+rm $CURRENT_SOURCE_DIR/*.log $CURRENT_SOURCE_DIR/*.log.gz $CURRENT_SOURCE_DIR/*.log.tail
+
+exit $result
@@ -0,0 +1,150 @@
+#!/bin/sh
+# https://stackoverflow.com/a/29835459
+CURRENT_SOURCE_DIR=$( CDPATH= cd -- "$(dirname -- "$0")" && pwd )
+
+. $CURRENT_SOURCE_DIR/../scripts/helpers.sh
+. $CURRENT_SOURCE_DIR/../scripts/checkers.sh
+
+echo "Tests for $( basename $0 )"
+echo "Purpose:"
+echo "  Check that LOCAL steps declaring local resources only run when they fit in host capacity, regardless of threadpool"
+
+# 
+redirect=$( mktemp $CURRENT_SOURCE_DIR/test_XXXX )
+suite=02_multiAction
+suite_relfile=$suite.json
+suite_reloffset=""
+suiteStdout=$redirect
+
+test0=localResources
+test0_step0=stepA
+test0_step1=stepB
+test0_step2=stepC
+test0_step3=stepD
+# Each step needs 2 cpus, so only two of the four fit at a time
+$CURRENT_SOURCE_DIR/../../.ci/runner.py $CURRENT_SOURCE_DIR/$suite.json -t $test0 -tp 4 -lc 4 -lm 1gb > $redirect 2>&1
+result=$?
+
+
+justify "<" "*" 100 "-->[SUITE RUNS OK] "
+reportTest                                                                      \
+  SUITE_SUCCESS                                                                 \
+  "Suite should report success when everything passes"                       \
+  0 0 $result
+result=$?
+
+
+justify "^" "*" 100 "->[CHECK LOGS EXIST]<-"
+$CURRENT_SOURCE_DIR/../scripts/helper_logs_generated.sh \
+  $result                                                 \
+  $CURRENT_SOURCE_DIR                                     \
+  $suite                                                  \
+  "$test0=[$test0_step0,$test0_step1,$test0_step2,$test0_step3]" \
+  "$suite_relfile"                                        \
+  "$suite_reloffset"                                      \
+  $suiteStdout
+result=$?
+
+justify "^" "*" 100 "->[CHECK PASSED TEST]<-"
+$CURRENT_SOURCE_DIR/../scripts/helper_masterlog_report.sh \
+  $result $CURRENT_SOURCE_DIR $suite                        \
+  $test0 true                                              \
+  "$test0_step0=true $test0_step1=true $test0_step2=true $test0_step3=true"
+result=$?
+
+testStdout=$( format $testStdout_fmt logdir=$CURRENT_SOURCE_DIR suite=$suite testname=$test0 )
+
+justify "<" "*" 100 "-->[TEST [$test0] STDOUT LOCAL RESOURCES] "
+for step in $test0_step0 $test0_step1; do
+  checkTest                                                                     \
+    TEST_STDOUT_STEP_NO_WAIT                                                    \
+    "Step [$step] fits in host capacity and should not wait"                    \
+    1 $result                                                                   \
+    $testStdout                                                                 \
+    "\[step::$suite.$test0.$step\][ ]*Waiting for 2 cpus"
+  result=$?
+done
+
+for step in $test0_step2 $test0_step3; do
+  checkTest                                                                     \
+    TEST_STDOUT_STEP_WAIT                                                       \
+    "Step [$step] should wait for host capacity"                                \
+    0 $result                                                                   \
+    $testStdout                                                                 \
+    "\[step::$suite.$test0.$step\][ ]*Waiting for 2 cpus and 64.0mb memory to be free on host"
+  result=$?
+
+  stepStartLine=$( getLine $testStdout "\[step::$suite.$test0.$step\][ ]*Submitting step $step" | awk -F ':' '{print $1}' )
+  firstEndLine=$( getLine $testStdout "\[step::$suite.$test0.($test0_step0|$test0_step1)\].*STOP" | head -n 1 | awk -F ':' '{print $1}' )
+  test $stepStartLine -gt $firstEndLine
+  reportTest                                                                    \
+    TEST_STDOUT_STEP_WAIT_ORDER                                                 \
+    "Step [$step] should only start once a running step finishes"               \
+    0 $result $?
+  result=$?
+done
+
+# Cleanup run
+rm $redirect
+rm $CURRENT_SOURCE_DIR/*.log
+
+
+# Test processes cannot share host capacity, so all tests run from one scheduler
+test1=localResourcesOther
+redirect=$( mktemp $CURRENT_SOURCE_DIR/test_XXXX )
+$CURRENT_SOURCE_DIR/../../.ci/runner.py $CURRENT_SOURCE_DIR/$suite.json -t $test0 $test1 -tp 4 -lc 4 -lm 1gb > $redirect 2>&1
+suiteResult=$?
+
+justify "<" "*" 100 "-->[MULTIPLE TESTS SHARE HOST] "
+reportTest                                                                      \
+  SUITE_SUCCESS                                                                 \
+  "Suite should report success when multiple tests declare local resources"     \
+  0 $result $suiteResult
+result=$?
+
+checkTest                                                                       \
+  MAIN_STDOUT_FORCE_GLOBAL                                                      \
+  "Main stdout reports forcing global step scheduling"                          \
+  0 $result                                                                     \
+  $redirect                                                                     \
+  "Steps declare \"local_resources\", but a process pool of tests cannot share host resources - forcing global step scheduling"
+result=$?
+
+checkTest                                                                       \
+  MAIN_STDOUT_GLOBAL_SCHEDULER                                                  \
+  "Tests run from the global step scheduler"                                    \
+  0 $result                                                                     \
+  $redirect                                                                     \
+  "Spawning global step scheduler of size 4 to perform 2 tests"
+result=$?
+
+# Cleanup run
+rm $redirect
+rm $CURRENT_SOURCE_DIR/*.log
+
+
+justify "^" "*" 100 "->[NEGATIVE TESTS]<-"
+redirect=$( mktemp $CURRENT_SOURCE_DIR/test_XXXX )
+$CURRENT_SOURCE_DIR/../../.ci/runner.py $CURRENT_SOURCE_DIR/$suite.json -t $test0 -lc 4 -lm lots > $redirect 2>&1
+shouldFail=$?
+
+justify "<" "*" 100 "-->[SUITE FAILS OK] "
+reportTest                                                                      \
+  SUITE_FAILURE                                                                 \
+  "Suite should report failure when local memory cannot be parsed"              \
+  1 $result $shouldFail
+result=$?
+
+checkTest                                                                       \
+  MAIN_STDOUT_LOCAL_MEMORY                                                      \
+  "Main stdout reports the unparsable local memory"                             \
+  0 $result                                                                     \
+  $redirect                                                                     \
+  "Error: Unable to parse local memory 'lots'"
+result=$?
+
+# Cleanup run
+rm $redirect
+rm -f $CURRENT_SOURCE_DIR/*.log
+
+exit $result
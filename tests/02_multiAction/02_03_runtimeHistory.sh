@@ -0,0 +1,90 @@
+#!/bin/sh
+# https://stackoverflow.com/a/29835459
+CURRENT_SOURCE_DIR=$( CDPATH= cd -- "$(dirname -- "$0")" && pwd )
+
+. $CURRENT_SOURCE_DIR/../scripts/helpers.sh
+. $CURRENT_SOURCE_DIR/../scripts/checkers.sh
+
+echo "Tests for $( basename $0 )"
+echo "Purpose:"
+echo "  Check that recorded step runtimes replace padded timelimits when estimating test runtimes"
+
+redirect=$( mktemp $CURRENT_SOURCE_DIR/test_XXXX )
+resultsDB=$( mktemp -u $CURRENT_SOURCE_DIR/results_XXXX ).db
+cache=$( mktemp -d )
+suite=02_multiAction
+test0=basicParallel
+test1=complexParallel
+
+# No history yet, estimates come from the timelimits
+$CURRENT_SOURCE_DIR/../../.ci/runner.py $CURRENT_SOURCE_DIR/$suite.json -t $test0 $test1 -db $resultsDB -jo lpt -rp 90 > $redirect 2>&1
+result=$?
+
+justify "<" "*" 100 "-->[NO HISTORY] "
+reportTest                                                                      \
+  SUITE_SUCCESS                                                                 \
+  "Suite should report success recording runtimes"                              \
+  0 0 $result
+result=$?
+
+checkTest                                                                       \
+  MAIN_STDOUT_ESTIMATE_TIMELIMIT                                                \
+  "Without history test [$test1] is estimated from step timelimits"             \
+  0 $result                                                                     \
+  $redirect                                                                     \
+  "Estimated runtime of test $test1 : 4:00:00$"
+result=$?
+
+# Now with the runtimes recorded above
+$CURRENT_SOURCE_DIR/../../.ci/runner.py $CURRENT_SOURCE_DIR/$suite.json -t $test0 $test1 -db $resultsDB -jo lpt -rp 90 > $redirect 2>&1
+suiteResult=$?
+
+justify "<" "*" 100 "-->[WITH HISTORY] "
+reportTest                                                                      \
+  SUITE_SUCCESS                                                                 \
+  "Suite should report success estimating from recorded runtimes"               \
+  0 $result $suiteResult
+result=$?
+
+for test in $test0 $test1; do
+  checkTest                                                                     \
+    MAIN_STDOUT_ESTIMATE_HISTORY                                                \
+    "With history test [$test] is estimated from recorded step runtimes"        \
+    0 $result                                                                   \
+    $redirect                                                                   \
+    "Estimated runtime of test $test : 0:00:[0-9][0-9]"
+  result=$?
+done
+
+# Steps restored from the cache are recorded as if they took no time at all,
+# by the second run every step is
+for run in 0 1; do
+  $CURRENT_SOURCE_DIR/../../.ci/runner.py $CURRENT_SOURCE_DIR/$suite.json -t $test0 $test1 -db $resultsDB -c $cache > /dev/null 2>&1
+done
+$CURRENT_SOURCE_DIR/../../.ci/runner.py $CURRENT_SOURCE_DIR/$suite.json -t $test0 $test1 -db $resultsDB -jo lpt -rp 10 > $redirect 2>&1
+suiteResult=$?
+
+justify "<" "*" 100 "-->[CACHED HISTORY] "
+reportTest                                                                      \
+  SUITE_SUCCESS                                                                 \
+  "Suite should report success estimating after cached runs"                    \
+  0 $result $suiteResult
+result=$?
+
+for test in $test0 $test1; do
+  checkTest                                                                     \
+    MAIN_STDOUT_ESTIMATE_NOT_CACHED                                             \
+    "Test [$test] is not estimated from runtimes of cached steps"               \
+    1 $result                                                                   \
+    $redirect                                                                   \
+    "Estimated runtime of test $test : 0:00:00"
+  result=$?
+done
+
+# Cleanup run
+rm $redirect
+rm -f $resultsDB $resultsDB-wal $resultsDB-shm
+rm -rf $cache
+rm $CURRENT_SOURCE_DIR/*.log
+
+exit $result
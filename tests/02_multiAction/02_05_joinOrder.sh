@@ -0,0 +1,74 @@
+#!/bin/sh
+# https://stackoverflow.com/a/29835459
+CURRENT_SOURCE_DIR=$( CDPATH= cd -- "$(dirname -- "$0")" && pwd )
+
+. $CURRENT_SOURCE_DIR/../scripts/helpers.sh
+. $CURRENT_SOURCE_DIR/../scripts/checkers.sh
+
+echo "Tests for $( basename $0 )"
+echo "Purpose:"
+echo "  Check that with a single worker steps start in the order requested by --joinOrder, even for very deep graphs"
+
+#
+redirect=$( mktemp $CURRENT_SOURCE_DIR/test_XXXX )
+suite=02_multiAction
+test0=joinOrder
+result=0
+
+testStdout=$( format $testStdout_fmt logdir=$CURRENT_SOURCE_DIR suite=$suite testname=$test0 )
+
+# stepA 10 minutes, stepB 10 seconds leading into stepD 20 minutes, stepC 15 minutes
+for orderFirst in fifo=stepA lpt=stepC cpf=stepB; do
+  order=$( echo $orderFirst | awk -F '=' '{print $1}' )
+  first=$( echo $orderFirst | awk -F '=' '{print $2}' )
+  $CURRENT_SOURCE_DIR/../../.ci/runner.py $CURRENT_SOURCE_DIR/$suite.json -t $test0 -tp 1 -jo $order > $redirect 2>&1
+  suiteResult=$?
+
+  justify "<" "*" 100 "-->[JOIN ORDER $order] "
+  reportTest                                                                    \
+    SUITE_SUCCESS                                                               \
+    "Suite should report success joining steps in $order order"                 \
+    0 $result $suiteResult
+  result=$?
+
+  firstStep=$( grep -Eo "Submitting step step[A-D]" $testStdout | head -n 1 | awk '{print $3}' )
+  test "$firstStep" = "$first"
+  reportTest                                                                    \
+    TEST_STDOUT_FIRST_STEP                                                      \
+    "Joining in $order order step [$first] should start first"                  \
+    0 $result $?
+  result=$?
+done
+
+# A dependency chain deeper than the python recursion limit
+deepSuite=$( mktemp $CURRENT_SOURCE_DIR/deep_XXXX )
+deepTest=deepChain
+deepSteps=1500
+{
+  echo "{ \"submit_options\" : { \"working_directory\" : \"../../\", \"submission\" : \"LOCAL\", \"timelimit\" : \"00:01:00\" },"
+  echo "  \"$deepTest\" : { \"steps\" : {"
+  echo "    \"step0\" : { \"command\" : \"./tests/scripts/echo_normal.sh\" }"
+  i=1
+  while [ $i -lt $deepSteps ]; do
+    echo "    , \"step$i\" : { \"command\" : \"./tests/scripts/echo_normal.sh\", \"dependencies\" : { \"step$(( i - 1 ))\" : \"afterok\" } }"
+    i=$(( i + 1 ))
+  done
+  echo "  } } }"
+} > $deepSuite.json
+
+$CURRENT_SOURCE_DIR/../../.ci/runner.py $deepSuite.json -t $deepTest -tp 1 -jo cpf -dry > $redirect 2>&1
+suiteResult=$?
+
+justify "<" "*" 100 "-->[DEEP CHAIN] "
+reportTest                                                                      \
+  SUITE_SUCCESS                                                                 \
+  "Suite should report success joining a $deepSteps step chain in cpf order"    \
+  0 $result $suiteResult
+result=$?
+
+# Cleanup run
+rm $redirect
+rm $deepSuite $deepSuite.json
+rm $CURRENT_SOURCE_DIR/*.log
+
+exit $result
@@ -0,0 +1,220 @@
+#!/bin/sh
+# https://stackoverflow.com/a/29835459
+CURRENT_SOURCE_DIR=$( CDPATH= cd -- "$(dirname -- "$0")" && pwd )
+
+. $CURRENT_SOURCE_DIR/../scripts/helpers.sh
+. $CURRENT_SOURCE_DIR/../scripts/checkers.sh
+
+echo "Tests for $( basename $0 )"
+echo "Purpose:"
+echo "  Check that SLURM submissions are waited on and their final state and exit code are reported"
+
+# Use the local scheduler stand-in
+export PATH=$CURRENT_SOURCE_DIR/../emulator/bin:$PATH
+export HPCEMU_DIR=$( mktemp -d )
+
+redirect=$( mktemp $CURRENT_SOURCE_DIR/test_XXXX )
+suite=03_hpcSubmission
+suite_relfile=$suite.json
+suite_reloffset=""
+suiteStdout=$redirect
+$CURRENT_SOURCE_DIR/../../.ci/runner.py $CURRENT_SOURCE_DIR/$suite.json -t slurm -a emulator > $redirect 2>&1
+result=$?
+
+test0=slurm
+test0_step0=step
+
+justify "^" "*" 100 "->[POSITIVE TESTS]<-"
+justify "<" "*" 100 "-->[SUITE RUN OK] "
+reportTest                                                                      \
+  SUITE_SUCCESS                                                                 \
+  "Suite should report success when everything passes"                          \
+  0 0 $result
+result=$?
+
+justify "^" "*" 100 "->[CHECK LOGS EXIST]<-"
+$CURRENT_SOURCE_DIR/../scripts/helper_logs_generated.sh \
+  $result $CURRENT_SOURCE_DIR $suite                      \
+  "$test0=[$test0_step0]"                                 \
+  "$suite_relfile"                                        \
+  "$suite_reloffset"                                      \
+  $suiteStdout
+result=$?
+
+justify "^" "*" 100 "->[CHECK PASS TEST]<-"
+$CURRENT_SOURCE_DIR/../scripts/helper_masterlog_report.sh \
+  $result $CURRENT_SOURCE_DIR $suite                        \
+  $test0 true "$test0_step0=true"
+result=$?
+
+test0_stdout=$( format $testStdout_fmt logdir=$CURRENT_SOURCE_DIR suite=$suite testname=$test0 )
+justify "<" "*" 100 "-->[TEST [$test0] STDOUT JOB STATUS] "
+checkTest                                                                       \
+  TEST_STDOUT_SUBMITTED                                                         \
+  "Step submitted through sbatch"                                               \
+  0 $result                                                                     \
+  $test0_stdout                                                                 \
+  "Finding job ID in \"Submitted batch job [0-9]+\""
+result=$?
+
+checkTest                                                                       \
+  TEST_STDOUT_JOB_COMPLETED                                                     \
+  "Step job reports final state and exit code"                                  \
+  0 $result                                                                     \
+  $test0_stdout                                                                 \
+  "\[step::$suite.$test0.$test0_step0\][ ]*Job ID [0-9]+ finished with state COMPLETED, exit code 0"
+result=$?
+
+$CURRENT_SOURCE_DIR/../scripts/helper_step_stdout.sh $result $CURRENT_SOURCE_DIR $suite $test0 $test0_step0 "arg0 arg1" true
+result=$?
+
+# Cleanup run
+rm $redirect
+rm $CURRENT_SOURCE_DIR/*.log
+
+
+justify "^" "*" 100 "->[NEGATIVE TESTS]<-"
+redirect=$( mktemp $CURRENT_SOURCE_DIR/test_XXXX )
+suiteStdout=$redirect
+$CURRENT_SOURCE_DIR/../../.ci/runner.py $CURRENT_SOURCE_DIR/$suite.json -t slurm-fail -a emulator > $redirect 2>&1
+shouldFail=$?
+
+test0=slurm-fail
+test0_step0=step
+
+justify "<" "*" 100 "-->[SUITE FAILS OK] "
+reportTest                                                                      \
+  SUITE_FAILURE                                                                 \
+  "Suite should report failure when step job fails"                             \
+  1 $result $shouldFail
+result=$?
+
+justify "^" "*" 100 "->[CHECK FAIL TEST]<-"
+$CURRENT_SOURCE_DIR/../scripts/helper_masterlog_report.sh \
+  $result $CURRENT_SOURCE_DIR $suite                        \
+  $test0 false "$test0_step0=false"
+result=$?
+
+test0_stdout=$( format $testStdout_fmt logdir=$CURRENT_SOURCE_DIR suite=$suite testname=$test0 )
+justify "<" "*" 100 "-->[TEST [$test0] STDOUT JOB STATUS] "
+checkTest                                                                       \
+  TEST_STDOUT_JOB_FAILED                                                        \
+  "Step job reports failed state and exit code"                                 \
+  0 $result                                                                     \
+  $test0_stdout                                                                 \
+  "\[step::$suite.$test0.$test0_step0\][ ]*Job ID [0-9]+ finished with state FAILED, exit code 1"
+result=$?
+
+# Cleanup run
+rm $redirect
+rm $CURRENT_SOURCE_DIR/*.log
+
+
+justify "^" "*" 100 "->[SCHEDULER QUERY FAILURES]<-"
+# The first squeue and sacct queries fail as a busy scheduler might
+failingBin=$( mktemp -d )
+for cmd in squeue sacct; do
+  cat << EOF > $failingBin/$cmd
+#!/bin/sh
+if [ ! -f $HPCEMU_DIR/$cmd.failed ]; then
+  touch $HPCEMU_DIR/$cmd.failed
+  echo "$cmd: error: Socket timed out on send/recv operation" >&2
+  exit 1
+fi
+exec $CURRENT_SOURCE_DIR/../emulator/bin/$cmd "\$@"
+EOF
+  chmod +x $failingBin/$cmd
+done
+
+redirect=$( mktemp $CURRENT_SOURCE_DIR/test_XXXX )
+PATH=$failingBin:$PATH $CURRENT_SOURCE_DIR/../../.ci/runner.py $CURRENT_SOURCE_DIR/$suite.json -t slurm -a emulator > $redirect 2>&1
+result=$?
+
+test0=slurm
+test0_step0=step
+
+justify "<" "*" 100 "-->[SUITE RUN OK] "
+reportTest                                                                      \
+  SUITE_SUCCESS                                                                 \
+  "Suite should report success when scheduler queries fail only for a while"   \
+  0 0 $result
+result=$?
+
+test0_stdout=$( format $testStdout_fmt logdir=$CURRENT_SOURCE_DIR suite=$suite testname=$test0 )
+justify "<" "*" 100 "-->[TEST [$test0] STDOUT JOB STATUS] "
+checkTest                                                                       \
+  TEST_STDOUT_SQUEUE_FAILED                                                     \
+  "Step job is still waited on when squeue fails"                               \
+  0 $result                                                                     \
+  $test0_stdout                                                                 \
+  "Job status unavailable, jobs \[ [0-9]+ \] assumed still active"
+result=$?
+
+checkTest                                                                       \
+  TEST_STDOUT_SACCT_FAILED                                                      \
+  "Step job is still waited on when sacct fails"                                \
+  0 $result                                                                     \
+  $test0_stdout                                                                 \
+  "Job accounting unavailable, final state of jobs \[ [0-9]+ \] unknown, assumed still active"
+result=$?
+
+checkTest                                                                       \
+  TEST_STDOUT_JOB_COMPLETED                                                     \
+  "Step job reports final state and exit code once queries succeed"            \
+  0 $result                                                                     \
+  $test0_stdout                                                                 \
+  "\[step::$suite.$test0.$test0_step0\][ ]*Job ID [0-9]+ finished with state COMPLETED, exit code 0"
+result=$?
+
+# Cleanup run
+rm $redirect
+rm $CURRENT_SOURCE_DIR/*.log
+
+
+justify "^" "*" 100 "->[NO JOB ACCOUNTING]<-"
+# sacct never answers, as on a cluster without accounting
+cat << EOF > $failingBin/sacct
+#!/bin/sh
+echo "sacct: error: Problem talking to the database: Connection refused" >&2
+exit 1
+EOF
+
+redirect=$( mktemp $CURRENT_SOURCE_DIR/test_XXXX )
+# Bounded so a runner that never stops waiting fails rather than hangs
+PATH=$failingBin:$PATH timeout 600 $CURRENT_SOURCE_DIR/../../.ci/runner.py $CURRENT_SOURCE_DIR/$suite.json -t slurm-short -a emulator > $redirect 2>&1
+result=$?
+
+test0=slurm-short
+test0_step0=step
+
+justify "<" "*" 100 "-->[SUITE RUN OK] "
+reportTest                                                                      \
+  SUITE_SUCCESS                                                                 \
+  "Suite should finish and report success without job accounting"              \
+  0 0 $result
+result=$?
+
+test0_stdout=$( format $testStdout_fmt logdir=$CURRENT_SOURCE_DIR suite=$suite testname=$test0 )
+justify "<" "*" 100 "-->[TEST [$test0] STDOUT JOB STATUS] "
+checkTest                                                                       \
+  TEST_STDOUT_JOB_UNKNOWN                                                       \
+  "Step job is given up on once past its timelimit"                             \
+  0 $result                                                                     \
+  $test0_stdout                                                                 \
+  "\[step::$suite.$test0.$test0_step0\][ ]*Status of job ID [0-9]+ unknown past its timelimit of 0:00:30, assumed complete with state unknown"
+result=$?
+
+checkTest                                                                       \
+  TEST_STDOUT_JOB_ASSUMED_COMPLETE                                              \
+  "Step job is assumed complete"                                                \
+  0 $result                                                                     \
+  $test0_stdout                                                                 \
+  "\[step::$suite.$test0.$test0_step0\][ ]*Job ID [0-9]+ no longer in scheduler queue, assumed complete"
+result=$?
+
+# Cleanup run
+rm $redirect
+rm $CURRENT_SOURCE_DIR/*.log
+rm -rf $HPCEMU_DIR $failingBin
+
+exit $result
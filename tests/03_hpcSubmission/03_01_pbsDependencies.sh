@@ -0,0 +1,203 @@
+#!/bin/sh
+# https://stackoverflow.com/a/29835459
+CURRENT_SOURCE_DIR=$( CDPATH= cd -- "$(dirname -- "$0")" && pwd )
+
+. $CURRENT_SOURCE_DIR/../scripts/helpers.sh
+. $CURRENT_SOURCE_DIR/../scripts/checkers.sh
+
+echo "Tests for $( basename $0 )"
+echo "Purpose:"
+echo "  Check that PBS submissions honor dependencies between jobs and can be joined"
+
+# Use the local scheduler stand-in, one job at a time
+export PATH=$CURRENT_SOURCE_DIR/../emulator/bin:$PATH
+export HPCEMU_DIR=$( mktemp -d )
+export HPCEMU_SLOTS=1
+
+redirect=$( mktemp $CURRENT_SOURCE_DIR/test_XXXX )
+suite=03_hpcSubmission
+suite_relfile=$suite.json
+suite_reloffset=""
+suiteStdout=$redirect
+$CURRENT_SOURCE_DIR/../../.ci/runner.py $CURRENT_SOURCE_DIR/$suite.json -t pbs -a emulator > $redirect 2>&1
+result=$?
+
+test0=pbs
+test0_step0=step
+test0_step1=step-dep
+
+justify "^" "*" 100 "->[POSITIVE TESTS]<-"
+justify "<" "*" 100 "-->[SUITE RUN OK] "
+reportTest                                                                      \
+  SUITE_SUCCESS                                                                 \
+  "Suite should report success when everything passes"                          \
+  0 0 $result
+result=$?
+
+justify "^" "*" 100 "->[CHECK LOGS EXIST]<-"
+$CURRENT_SOURCE_DIR/../scripts/helper_logs_generated.sh \
+  $result $CURRENT_SOURCE_DIR $suite                      \
+  "$test0=[$test0_step0,$test0_step1]"                    \
+  "$suite_relfile"                                        \
+  "$suite_reloffset"                                      \
+  $suiteStdout
+result=$?
+
+justify "^" "*" 100 "->[CHECK PASS TEST]<-"
+$CURRENT_SOURCE_DIR/../scripts/helper_masterlog_report.sh \
+  $result $CURRENT_SOURCE_DIR $suite                        \
+  $test0 true "$test0_step0=true $test0_step1=true"
+result=$?
+
+test0_stdout=$( format $testStdout_fmt logdir=$CURRENT_SOURCE_DIR suite=$suite testname=$test0 )
+justify "<" "*" 100 "-->[TEST [$test0] STDOUT JOB STATUS] "
+checkTest                                                                       \
+  TEST_STDOUT_SUBMITTED                                                         \
+  "Step submitted through qsub"                                                 \
+  0 $result                                                                     \
+  $test0_stdout                                                                 \
+  "Finding job ID in \"[0-9]+[.]hpcemu\""
+result=$?
+
+checkTest                                                                       \
+  TEST_STDOUT_DEPENDENCY                                                        \
+  "Dependent step submitted depending on its parent job"                        \
+  0 $result                                                                     \
+  $test0_stdout                                                                 \
+  "qsub .* -W depend=afterok:[0-9]+ -- "
+result=$?
+
+checkTest                                                                       \
+  TEST_STDOUT_JOB_COMPLETED                                                     \
+  "Dependent step job reports final state and exit code"                        \
+  0 $result                                                                     \
+  $test0_stdout                                                                 \
+  "\[step::$suite.$test0.$test0_step1\][ ]*Job ID [0-9]+ finished with state F, exit code 0"
+result=$?
+
+$CURRENT_SOURCE_DIR/../scripts/helper_step_stdout.sh $result $CURRENT_SOURCE_DIR $suite $test0 $test0_step1 "arg0 arg1" true
+result=$?
+
+# Cleanup run
+rm $redirect
+rm $CURRENT_SOURCE_DIR/*.log
+
+
+justify "<" "*" 100 "-->[JOINED RUN OK] "
+redirect=$( mktemp $CURRENT_SOURCE_DIR/test_XXXX )
+$CURRENT_SOURCE_DIR/../../.ci/runner.py $CURRENT_SOURCE_DIR/$suite.json -t pbs -a emulator -j > $redirect 2>&1
+reportTest                                                                      \
+  SUITE_JOIN_SUCCESS                                                            \
+  "Suite should report success when joined into one job"                        \
+  0 $result $?
+result=$?
+
+checkTest                                                                       \
+  MAIN_STDOUT_JOIN                                                              \
+  "Joined job runs the test locally and passes"                                 \
+  0 $result                                                                     \
+  $redirect                                                                     \
+  "\[SUCCESS\] : Test $test0 reported success"
+result=$?
+
+# Cleanup run
+rm $redirect
+rm $CURRENT_SOURCE_DIR/*.log
+
+
+justify "^" "*" 100 "->[NEGATIVE TESTS]<-"
+redirect=$( mktemp $CURRENT_SOURCE_DIR/test_XXXX )
+$CURRENT_SOURCE_DIR/../../.ci/runner.py $CURRENT_SOURCE_DIR/$suite.json -t pbs-fail -a emulator > $redirect 2>&1
+shouldFail=$?
+
+test0=pbs-fail
+
+justify "<" "*" 100 "-->[SUITE FAILS OK] "
+reportTest                                                                      \
+  SUITE_FAILURE                                                                 \
+  "Suite should report failure when step job fails"                             \
+  1 $result $shouldFail
+result=$?
+
+justify "^" "*" 100 "->[CHECK FAIL TEST]<-"
+$CURRENT_SOURCE_DIR/../scripts/helper_masterlog_report.sh \
+  $result $CURRENT_SOURCE_DIR $suite                        \
+  $test0 false "$test0_step0=false $test0_step1=false"
+result=$?
+
+test0_stdout=$( format $testStdout_fmt logdir=$CURRENT_SOURCE_DIR suite=$suite testname=$test0 )
+justify "<" "*" 100 "-->[TEST [$test0] STDOUT JOB STATUS] "
+checkTest                                                                       \
+  TEST_STDOUT_DEPENDENCY_NEVER_RUN                                              \
+  "Dependent step job of a failed job never runs"                               \
+  0 $result                                                                     \
+  $test0_stdout                                                                 \
+  "\[step::$suite.$test0.$test0_step1\][ ]*Job ID [0-9]+ finished with state F, exit code None"
+result=$?
+
+# Cleanup run
+rm $redirect
+rm $CURRENT_SOURCE_DIR/*.log
+
+
+justify "^" "*" 100 "->[SCHEDULER QUERY FAILURES]<-"
+# The first poll cannot reach the server, neither the JSON nor the plain query
+failingBin=$( mktemp -d )
+cat << EOF > $failingBin/qstat
+#!/bin/sh
+failed=\$( cat $HPCEMU_DIR/qstat.failed 2>/dev/null || echo 0 )
+if [ \$failed -lt 2 ]; then
+  echo \$(( failed + 1 )) > $HPCEMU_DIR/qstat.failed
+  echo "Connection refused" >&2
+  echo "qstat: cannot connect to server hpcemu (errno=111)" >&2
+  exit 1
+fi
+exec $CURRENT_SOURCE_DIR/../emulator/bin/qstat "\$@"
+EOF
+chmod +x $failingBin/qstat
+
+redirect=$( mktemp $CURRENT_SOURCE_DIR/test_XXXX )
+PATH=$failingBin:$PATH $CURRENT_SOURCE_DIR/../../.ci/runner.py $CURRENT_SOURCE_DIR/$suite.json -t pbs -a emulator > $redirect 2>&1
+suiteResult=$?
+
+test0=pbs
+
+justify "<" "*" 100 "-->[SUITE RUN OK] "
+reportTest                                                                      \
+  SUITE_SUCCESS                                                                 \
+  "Suite should report success when scheduler queries fail only for a while"   \
+  0 $result $suiteResult
+result=$?
+
+test0_stdout=$( format $testStdout_fmt logdir=$CURRENT_SOURCE_DIR suite=$suite testname=$test0 )
+justify "<" "*" 100 "-->[TEST [$test0] STDOUT JOB STATUS] "
+checkTest                                                                       \
+  TEST_STDOUT_QSTAT_FAILED                                                      \
+  "Step jobs are still waited on when qstat fails"                              \
+  0 $result                                                                     \
+  $test0_stdout                                                                 \
+  "Job status unavailable, jobs \[ [0-9]+,[0-9]+ \] assumed still active"
+result=$?
+
+checkTest                                                                       \
+  TEST_STDOUT_QSTAT_NO_FALLBACK                                                 \
+  "Failing qstat is not mistaken for missing JSON support"                      \
+  1 $result                                                                     \
+  $test0_stdout                                                                 \
+  "Scheduler does not provide JSON job status"
+result=$?
+
+checkTest                                                                       \
+  TEST_STDOUT_JOB_COMPLETED                                                     \
+  "Dependent step job reports final state and exit code once queries succeed"  \
+  0 $result                                                                     \
+  $test0_stdout                                                                 \
+  "\[step::$suite.$test0.$test0_step1\][ ]*Job ID [0-9]+ finished with state F, exit code 0"
+result=$?
+
+# Cleanup run
+rm $redirect
+rm $CURRENT_SOURCE_DIR/*.log
+rm -rf $HPCEMU_DIR $failingBin
+
+exit $result
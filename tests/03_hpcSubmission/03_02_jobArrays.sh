@@ -0,0 +1,144 @@
+#!/bin/sh
+# https://stackoverflow.com/a/29835459
+CURRENT_SOURCE_DIR=$( CDPATH= cd -- "$(dirname -- "$0")" && pwd )
+
+. $CURRENT_SOURCE_DIR/../scripts/helpers.sh
+. $CURRENT_SOURCE_DIR/../scripts/checkers.sh
+
+echo "Tests for $( basename $0 )"
+echo "Purpose:"
+echo "  Check that steps only differing in arguments are submitted as one job array"
+
+# Use the local scheduler stand-in
+export PATH=$CURRENT_SOURCE_DIR/../emulator/bin:$PATH
+export HPCEMU_DIR=$( mktemp -d )
+
+redirect=$( mktemp $CURRENT_SOURCE_DIR/test_XXXX )
+suite=03_hpcSubmission
+suite_relfile=$suite.json
+suite_reloffset=""
+suiteStdout=$redirect
+$CURRENT_SOURCE_DIR/../../.ci/runner.py $CURRENT_SOURCE_DIR/$suite.json -t pbs-array -a emulator -ja > $redirect 2>&1
+result=$?
+
+test0=pbs-array
+test0_step0=setup
+test0_step1=case0
+test0_step2=case1
+test0_step3=case2
+test0_step4=gather
+
+justify "^" "*" 100 "->[POSITIVE TESTS]<-"
+justify "<" "*" 100 "-->[SUITE RUN OK] "
+reportTest                                                                      \
+  SUITE_SUCCESS                                                                 \
+  "Suite should report success when everything passes"                          \
+  0 0 $result
+result=$?
+
+justify "^" "*" 100 "->[CHECK LOGS EXIST]<-"
+$CURRENT_SOURCE_DIR/../scripts/helper_logs_generated.sh \
+  $result $CURRENT_SOURCE_DIR $suite                      \
+  "$test0=[$test0_step0,$test0_step1,$test0_step2,$test0_step3,$test0_step4]" \
+  "$suite_relfile"                                        \
+  "$suite_reloffset"                                      \
+  $suiteStdout
+result=$?
+
+justify "^" "*" 100 "->[CHECK PASS TEST]<-"
+$CURRENT_SOURCE_DIR/../scripts/helper_masterlog_report.sh \
+  $result $CURRENT_SOURCE_DIR $suite                        \
+  $test0 true "$test0_step0=true $test0_step1=true $test0_step2=true $test0_step3=true $test0_step4=true"
+result=$?
+
+test0_stdout=$( format $testStdout_fmt logdir=$CURRENT_SOURCE_DIR suite=$suite testname=$test0 )
+justify "<" "*" 100 "-->[TEST [$test0] STDOUT JOB ARRAY] "
+checkTest                                                                       \
+  TEST_STDOUT_ARRAY_GROUPED                                                     \
+  "Steps sharing submit options and dependencies are grouped"                   \
+  0 $result                                                                     \
+  $test0_stdout                                                                 \
+  "Steps \[ $test0_step1, $test0_step2, $test0_step3 \] will be submitted as job array"
+result=$?
+
+checkTest                                                                       \
+  TEST_STDOUT_ARRAY_SUBMITTED                                                   \
+  "Job array submitted once through qsub for all its steps"                     \
+  0 $result                                                                     \
+  $test0_stdout                                                                 \
+  "qsub .* -J 0-2 -W depend=afterok:[0-9]+ -- "
+result=$?
+
+checkTest                                                                       \
+  TEST_STDOUT_ARRAY_DEPENDENCY                                                  \
+  "Dependent step depends on the whole job array"                               \
+  0 $result                                                                     \
+  $test0_stdout                                                                 \
+  "qsub .* -W depend=afterok:[0-9]+\[\] -- "
+result=$?
+
+checkTest                                                                       \
+  TEST_STDOUT_ARRAY_COMPLETED                                                   \
+  "Steps of the job array report its final state"                               \
+  0 $result                                                                     \
+  $test0_stdout                                                                 \
+  "\[step::$suite.$test0.$test0_step3\][ ]*Job ID [0-9]+ finished with state F, exit code 0"
+result=$?
+
+$CURRENT_SOURCE_DIR/../scripts/helper_step_stdout.sh $result $CURRENT_SOURCE_DIR $suite $test0 $test0_step1 "case0 arg0 arg1" true
+result=$?
+
+$CURRENT_SOURCE_DIR/../scripts/helper_step_stdout.sh $result $CURRENT_SOURCE_DIR $suite $test0 $test0_step3 "case2 arg0 arg1" true
+result=$?
+
+# Cleanup run
+rm $redirect
+rm $CURRENT_SOURCE_DIR/*.log $CURRENT_SOURCE_DIR/*.tasks.json
+
+
+justify "^" "*" 100 "->[NEGATIVE TESTS]<-"
+redirect=$( mktemp $CURRENT_SOURCE_DIR/test_XXXX )
+$CURRENT_SOURCE_DIR/../../.ci/runner.py $CURRENT_SOURCE_DIR/$suite.json -t slurm-array -a emulator -ja > $redirect 2>&1
+shouldFail=$?
+
+test0=slurm-array
+test0_step0=case0
+test0_step1=case1
+
+justify "<" "*" 100 "-->[SUITE FAILS OK] "
+reportTest                                                                      \
+  SUITE_FAILURE                                                                 \
+  "Suite should report failure when an index of the job array fails"            \
+  1 $result $shouldFail
+result=$?
+
+justify "^" "*" 100 "->[CHECK FAIL TEST]<-"
+$CURRENT_SOURCE_DIR/../scripts/helper_masterlog_report.sh \
+  $result $CURRENT_SOURCE_DIR $suite                        \
+  $test0 false "$test0_step0=true $test0_step1=false"
+result=$?
+
+test0_stdout=$( format $testStdout_fmt logdir=$CURRENT_SOURCE_DIR suite=$suite testname=$test0 )
+justify "<" "*" 100 "-->[TEST [$test0] STDOUT JOB ARRAY] "
+checkTest                                                                       \
+  TEST_STDOUT_ARRAY_SUBMITTED                                                   \
+  "Job array submitted once through sbatch for all its steps"                   \
+  0 $result                                                                     \
+  $test0_stdout                                                                 \
+  "sbatch .* --array=0-1 "
+result=$?
+
+checkTest                                                                       \
+  TEST_STDOUT_ARRAY_FAILED                                                      \
+  "Steps of the job array report the failed index as its final state"           \
+  0 $result                                                                     \
+  $test0_stdout                                                                 \
+  "\[step::$suite.$test0.$test0_step0\][ ]*Job ID [0-9]+ finished with state FAILED, exit code 1"
+result=$?
+
+# Cleanup run
+rm $redirect
+rm $CURRENT_SOURCE_DIR/*.log $CURRENT_SOURCE_DIR/*.tasks.json
+rm -rf $HPCEMU_DIR
+
+exit $result
@@ -0,0 +1,428 @@
+#!/usr/bin/env python3
+# Measures the overhead of the runner itself on generated test configs, from
+# parsing through scheduling to post-processing. Results are written as JSON
+# so runs on different commits can be compared with --compare
+import sys
+import os
+import json
+import time
+import random
+import shutil
+import socket
+import argparse
+import tempfile
+import platform
+import statistics
+import subprocess
+from collections import OrderedDict
+
+CI_DIR = os.path.realpath( os.path.join( os.path.dirname( os.path.realpath( __file__ ) ), "..", "..", ".ci" ) )
+sys.path.insert( 0, CI_DIR )
+
+import runner
+import SubmitCommon as sc
+from SubmitOptions import SubmitOptions
+from SubmitLogger  import SubmitLogger, LogLevel
+
+BENCH_SUITE  = "benchmark"
+BENCH_HOST   = "bench-host-{0:04d}"
+BENCH_SHAPES = [ "wide", "deep", "dag" ]
+# Phases slower than this ratio of the baseline are reported as regressions
+BENCH_THRESHOLD = 1.25
+# Options that change what is benchmarked
+BENCH_CONFIG_OPTIONS = [ "tests", "steps", "argpacks", "hosts", "outputSize", "threadpool", "seed" ]
+
+PASS_SCRIPT = """#!/bin/sh
+echo "TEST $(basename $0) PASS"
+"""
+# Prints as many bytes of output as requested in its first argument after the framework's own
+OUTPUT_SCRIPT = """#!/bin/sh
+yes "benchmark step output, long enough to look like a real line of build or model output" | head -c $3
+echo
+echo "TEST $(basename $0) PASS"
+"""
+
+# Parents of each step of each generated test
+generated = {}
+
+def quiet( *args, **kwargs ) :
+  pass
+
+def hpcArguments( rng ) :
+  return { "select" : { "-l " : { "select" : rng.randint( 1, 4 ), "ncpus" : rng.choice( [ 1, 4, 16, 32 ] ) } } }
+
+def argpacks( rng, count, prefix ) :
+  packs = OrderedDict()
+  for idx in range( count ) :
+    values = [ "{0}{1}_{2}".format( prefix, idx, arg ) for arg in range( rng.randint( 1, 4 ) ) ]
+    if idx % 2 :
+      # Regexes matching some of the steps of some of the tests
+      packs[ ".*{0}.*step_{1}.*::{2}regex_{3:03d}".format( rng.choice( BENCH_SHAPES ), rng.randint( 0, 9 ), prefix, idx ) ] = values
+    else :
+      packs[ "{0}argset_{1:03d}".format( prefix, idx ) ] = values
+  return packs
+
+def dependencies( rng, shape, step ) :
+  if step == 0 :
+    return {}
+  if shape == "wide" :
+    return { "step_000" : "afterok" }
+  if shape == "deep" :
+    return { "step_{0:03d}".format( step - 1 ) : "afterok" }
+  return { "step_{0:03d}".format( parent ) : "afterok" for parent in rng.sample( range( step ), min( step, rng.randint( 1, 3 ) ) ) }
+
+# Wide, deep and random dependency graphs of steps submitted to PBS, with plenty
+# of argpacks and host-specific options to resolve. Runs force LOCAL submission
+def generateConfig( options ) :
+  rng = random.Random( options.seed )
+
+  submitOptions = OrderedDict()
+  submitOptions[ "submission"    ] = "PBS"
+  submitOptions[ "queue"         ] = "economy"
+  submitOptions[ "timelimit"     ] = "00:10:00"
+  submitOptions[ "hpc_arguments" ] = hpcArguments( rng )
+  submitOptions[ "arguments"     ] = argpacks( rng, options.argpacks, "" )
+  for host in range( options.hosts ) :
+    submitOptions[ BENCH_HOST.format( host ) ] = {
+                                                    "queue"         : "host{0}".format( host ),
+                                                    "hpc_arguments" : hpcArguments( rng ),
+                                                    "arguments"     : argpacks( rng, max( options.argpacks // 4, 1 ), "host{0}_".format( host ) )
+                                                  }
+
+  config = OrderedDict( [ ( "submit_options", submitOptions ) ] )
+  for test in range( options.tests ) :
+    shape = BENCH_SHAPES[ test % len( BENCH_SHAPES ) ]
+    steps = OrderedDict()
+    for step in range( options.steps ) :
+      steps[ "step_{0:03d}".format( step ) ] = {
+                                                  "submit_options" : {
+                                                                        "timelimit"     : "00:{0:02d}:00".format( rng.randint( 1, 59 ) ),
+                                                                        "hpc_arguments" : hpcArguments( rng )
+                                                                      },
+                                                  "command"      : "./pass.sh",
+                                                  "dependencies" : dependencies( rng, shape, step )
+                                                }
+    config[ "{0}-{1:04d}".format( shape, test ) ] = { "steps" : steps }
+
+  config[ "output" ] = {
+                          "steps" :
+                          {
+                            "step_000" : { "command" : "./output.sh", "arguments" : [ str( options.outputSize * 1024 * 1024 ) ] }
+                          }
+                        }
+  return config
+
+# Times a phase repeatedly, keeping the best
+def timed( repeat, func ) :
+  best = None
+  for _ in range( repeat ) :
+    start = time.perf_counter()
+    func()
+    elapsed = time.perf_counter() - start
+    best = elapsed if best is None else min( best, elapsed )
+  return best
+
+# Same preparation the runner does before parsing, without running anything
+def parseOptions( configFile, tests ) :
+  options = runner.getOptionsParser().parse_args( [ configFile, "-t" ] + tests + [ "-ff", BENCH_HOST.format( 0 ), "-a", BENCH_SUITE, "-ll", str( LogLevel.ERROR ) ] )
+  sc.LABEL_LENGTH = options.labelLength
+  SubmitLogger.configure( options.logLevel, options.logJson )
+  opts = SubmitOptions()
+  opts.account_    = options.account
+  opts.submitType_ = sc.SubmissionType.LOCAL
+  return options, opts, os.path.dirname( configFile )
+
+def benchmarkParsing( configFile, tests, repeat ) :
+  options, opts, root = parseOptions( configFile, tests )
+  suites = []
+  def parse() :
+    suites.append( runner.parseSuite( options, BENCH_SUITE, opts, root ) )
+  def construct() :
+    for test in tests :
+      suites[-1].test( test )
+
+  results = OrderedDict()
+  results[ "parse"     ] = timed( repeat, parse )
+  results[ "construct" ] = timed( 1, construct )
+  suite = suites[-1]
+
+  def validate() :
+    for test in tests :
+      suite.test( test ).validate()
+  def resolve() :
+    for test in tests :
+      for step in suite.test( test ).steps_.values() :
+        step.submitOptions_.logfile_ = step.logfile_
+        step.submitOptions_.format( print=quiet )
+  def simulate() :
+    for test in tests :
+      suite.test( test ).getMaxHPCResources()
+      suite.test( test ).estimateRuntime()
+
+  results[ "validate"        ] = timed( repeat, validate )
+  results[ "argpacks"        ] = timed( repeat, resolve )
+  results[ "join simulation" ] = timed( repeat, simulate )
+  return results
+
+# Runs the runner on some tests, returning its master log and profile
+def runTests( workDir, configFile, tests, options, extraArgs=[] ) :
+  profile = os.path.join( workDir, "profile.json" )
+  command = [
+              sys.executable, os.path.join( CI_DIR, "runner.py" ), configFile, "-t" ] + tests + [
+              "-s", "LOCAL", "-ff", BENCH_HOST.format( 0 ), "-tp", str( options.threadpool ), "-pr", profile
+            ] + extraArgs
+  start = time.perf_counter()
+  subprocess.run( command, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, check=True )
+  wallTime = time.perf_counter() - start
+
+  with open( os.path.join( workDir, BENCH_SUITE + ".log" ), "r" ) as fp :
+    masterLog = json.load( fp )
+  with open( profile, "r" ) as fp :
+    events = json.load( fp )[ "traceEvents" ]
+  return wallTime, masterLog, events
+
+def spans( events, name ) :
+  return [ event for event in events if event[ "ph" ] == "X" and event[ "name" ] == name ]
+
+def summary( values ) :
+  values = sorted( values )
+  if not values :
+    return OrderedDict()
+  return OrderedDict( [
+                        ( "min",    values[0] ),
+                        ( "median", statistics.median( values ) ),
+                        ( "p90",    values[ min( int( len( values ) * 0.9 ), len( values ) - 1 ) ] ),
+                        ( "max",    values[-1] )
+                      ] )
+
+# Time from the last dependency of a step finishing until the step is launched
+def benchmarkScheduling( workDir, configFile, options ) :
+  results = OrderedDict()
+  # First test of each shape
+  for index, shape in enumerate( BENCH_SHAPES[:options.tests] ) :
+    test        = "{0}-{1:04d}".format( shape, index )
+    latencies   = []
+    postProcess = []
+    wallTimes   = []
+    for _ in range( options.repeat ) :
+      wallTime, masterLog, events = runTests( workDir, configFile, [ test ], options )
+      steps  = masterLog[ test ][ "steps" ]
+      launch = { event[ "args" ][ "step" ] : event[ "ts" ] / 1e6 for event in spans( events, "spawn" ) }
+      for stepname, step in steps.items() :
+        parents = [ steps[ parent ][ "stop" ] for parent in generated[ test ][ stepname ] ]
+        if parents and stepname in launch :
+          latencies.append( launch[ stepname ] - max( parents ) )
+      postProcess.append( sum( event[ "dur" ] for event in spans( events, "post-process" ) ) / 1e6 )
+      wallTimes.append( wallTime )
+
+    results[ "schedule " + shape ] = min( wallTimes )
+    results[ "scheduling latency " + shape ] = summary( latencies )
+    results[ "post-processing " + shape ] = min( postProcess )
+  return results
+
+# Rate step output reaches its logfile, as is and compressed
+def benchmarkOutput( workDir, configFile, options ) :
+  results = OrderedDict()
+  size = options.outputSize * 1024 * 1024
+  for label, extraArgs in [ ( "output", [] ), ( "output gzip", [ "-z", "gzip" ] ) ] :
+    rates = []
+    for _ in range( options.repeat ) :
+      wallTime, masterLog, events = runTests( workDir, configFile, [ "output" ], options, extraArgs )
+      step = masterLog[ "output" ][ "steps" ][ "step_000" ]
+      rates.append( size / 1024 / 1024 / ( step[ "stop" ] - step[ "start" ] ) )
+    results[ label + " MiB/s" ] = max( rates )
+  return results
+
+def compare( results, options, baselineFile, threshold ) :
+  with open( baselineFile, "r" ) as fp :
+    baseline = json.load( fp )
+  # Only the same generated configs run the same way are comparable
+  differing = [
+                key for key in BENCH_CONFIG_OPTIONS
+                if baseline[ "metadata" ][ "options" ].get( key ) != getattr( options, key )
+              ]
+  if differing :
+    print( "Warning: {0} differ from {1}, results are not directly comparable".format( ", ".join( differing ), baselineFile ) )
+  baseline = baseline[ "results" ]
+
+  regressions = []
+  print( "{0:<36} {1:>12} {2:>12} {3:>8}".format( "phase", "baseline", "current", "ratio" ) )
+  for phase, value in results.items() :
+    if phase not in baseline :
+      continue
+    before = baseline[ phase ]
+    after  = value
+    if isinstance( value, dict ) :
+      if "median" not in value or "median" not in before :
+        continue
+      before, after = before[ "median" ], value[ "median" ]
+    if not before :
+      continue
+    # Rates regress when they go down, everything else when it goes up
+    ratio = after / before if not phase.endswith( "/s" ) else before / after
+    print( "{0:<36} {1:>12.6f} {2:>12.6f} {3:>7.2f}x{4}".format( phase, before, after, ratio, " REGRESSION" if ratio > threshold else "" ) )
+    if ratio > threshold :
+      regressions.append( phase )
+  return regressions
+
+def getOptionsParser():
+  parser = argparse.ArgumentParser(
+                                    description="Benchmark the overhead of runner.py on generated test configs",
+                                  )
+
+  parser.add_argument(
+                      "-o", "--output",
+                      dest="output",
+                      help="JSON file to write results to (default : %(default)s)",
+                      type=str,
+                      default="benchmark.json"
+                      )
+  parser.add_argument(
+                      "-c", "--compare",
+                      dest="compare",
+                      help="Results of a previous benchmark to compare against, exits with failure on regressions",
+                      type=str,
+                      default=None
+                      )
+  parser.add_argument(
+                      "-th", "--threshold",
+                      dest="threshold",
+                      help="Ratio to the previous results past which a phase has regressed (default : %(default)s)",
+                      type=float,
+                      default=BENCH_THRESHOLD
+                      )
+  parser.add_argument(
+                      "-n", "--tests",
+                      dest="tests",
+                      help="Number of generated tests (default : %(default)s)",
+                      type=int,
+                      default=60
+                      )
+  parser.add_argument(
+                      "-m", "--steps",
+                      dest="steps",
+                      help="Number of steps in each generated test (default : %(default)s)",
+                      type=int,
+                      default=20
+                      )
+  parser.add_argument(
+                      "-a", "--argpacks",
+                      dest="argpacks",
+                      help="Number of argpacks, half of them regex, at suite level (default : %(default)s)",
+                      type=int,
+                      default=40
+                      )
+  parser.add_argument(
+                      "-hs", "--hosts",
+                      dest="hosts",
+                      help="Number of host-specific option tables (default : %(default)s)",
+                      type=int,
+                      default=100
+                      )
+  parser.add_argument(
+                      "-os", "--outputSize",
+                      dest="outputSize",
+                      help="MiB of output written by the output step (default : %(default)s)",
+                      type=int,
+                      default=64
+                      )
+  parser.add_argument(
+                      "-tp", "--threadpool",
+                      dest="threadpool",
+                      help="Threadpool size of runs (default : %(default)s)",
+                      type=int,
+                      default=4
+                      )
+  parser.add_argument(
+                      "-r", "--repeat",
+                      dest="repeat",
+                      help="Times each phase is repeated, the best is kept (default : %(default)s)",
+                      type=int,
+                      default=3
+                      )
+  parser.add_argument(
+                      "-sd", "--seed",
+                      dest="seed",
+                      help="Seed for generating configs (default : %(default)s)",
+                      type=int,
+                      default=0
+                      )
+  parser.add_argument(
+                      "-np", "--noRuns",
+                      dest="noRuns",
+                      help="Only benchmark phases that do not run steps",
+                      default=False,
+                      const=True,
+                      action='store_const'
+                      )
+  return parser
+
+class Options(object):
+  """Empty namespace"""
+  pass
+
+def commit() :
+  try :
+    return subprocess.run( [ "git", "rev-parse", "HEAD" ], cwd=CI_DIR, capture_output=True, text=True, check=True ).stdout.strip()
+  except ( OSError, subprocess.CalledProcessError ) :
+    return None
+
+def main() :
+  parser  = getOptionsParser()
+  options = Options()
+  parser.parse_args( namespace=options )
+
+  workDir = tempfile.mkdtemp( prefix="hpc-workflows-benchmark-" )
+  try :
+    config = generateConfig( options )
+    for test, testConfig in config.items() :
+      if test != "submit_options" :
+        generated[ test ] = { stepname : list( step.get( "dependencies", {} ).keys() ) for stepname, step in testConfig[ "steps" ].items() }
+
+    configFile = os.path.join( workDir, BENCH_SUITE + ".json" )
+    with open( configFile, "w" ) as fp :
+      json.dump( config, fp, indent=2 )
+    for script, contents in [ ( "pass.sh", PASS_SCRIPT ), ( "output.sh", OUTPUT_SCRIPT ) ] :
+      with open( os.path.join( workDir, script ), "w" ) as fp :
+        fp.write( contents )
+      os.chmod( os.path.join( workDir, script ), 0o755 )
+
+    tests = [ test for test in config if test not in [ "submit_options", "output" ] ]
+    results = OrderedDict()
+    print( "Benchmarking parsing of {0} tests x {1} steps...".format( options.tests, options.steps ) )
+    results.update( benchmarkParsing( configFile, tests, options.repeat ) )
+    if not options.noRuns :
+      print( "Benchmarking scheduling of {0} steps in a threadpool of {1}...".format( options.steps, options.threadpool ) )
+      results.update( benchmarkScheduling( workDir, configFile, options ) )
+      print( "Benchmarking {0} MiB of step output...".format( options.outputSize ) )
+      results.update( benchmarkOutput( workDir, configFile, options ) )
+  finally :
+    shutil.rmtree( workDir, ignore_errors=True )
+
+  for phase, value in results.items() :
+    if isinstance( value, dict ) :
+      print( "{0:<36} {1}".format( phase, "  ".join( "{0} {1:.6f}".format( key, stat ) for key, stat in value.items() ) ) )
+    else :
+      print( "{0:<36} {1:.6f}".format( phase, value ) )
+
+  metadata = OrderedDict( [
+                            ( "commit",   commit() ),
+                            ( "date",     time.time() ),
+                            ( "host",     socket.gethostname() ),
+                            ( "python",   platform.python_version() ),
+                            ( "platform", platform.platform() ),
+                            ( "cpus",     os.cpu_count() ),
+                            ( "options",  vars( options ) )
+                          ] )
+  with open( options.output, "w" ) as fp :
+    json.dump( { "metadata" : metadata, "results" : results }, fp, indent=2 )
+  print( "Results written to {0}".format( options.output ) )
+
+  if options.compare is not None :
+    regressions = compare( results, options, options.compare, options.threshold )
+    if regressions :
+      print( "Phases [ {0} ] regressed past {1}x".format( ", ".join( regressions ), options.threshold ) )
+      exit( 1 )
+
+if __name__ == '__main__' :
+  main()
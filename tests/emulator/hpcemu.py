@@ -0,0 +1,449 @@
+#!/usr/bin/env python3
+# Local stand-in for HPC scheduler commands, used to exercise non-LOCAL
+# submissions offline. Jobs run as detached local processes and their state
+# is kept as JSON files under $HPCEMU_DIR
+import sys
+import os
+import glob
+import json
+import time
+import fcntl
+import signal
+import shutil
+import contextlib
+import subprocess
+
+EMU_DIR         = os.environ.get( "HPCEMU_DIR", "/tmp/hpcemu-{0}".format( os.getuid() ) )
+# Delay before a job starts, keeps submission output ahead of job output
+EMU_QUEUE_DELAY = float( os.environ.get( "HPCEMU_QUEUE_DELAY", "1" ) )
+# Most jobs running at once, 0 for no limit
+EMU_SLOTS       = int( os.environ.get( "HPCEMU_SLOTS", "0" ) )
+# How often queued jobs check their dependencies and for a free slot
+EMU_QUEUE_POLL  = 0.1
+EMU_FIRST_JOBID = 100000
+EMU_SERVER      = "hpcemu"
+
+SLURM_ACTIVE_STATES = [ "PENDING", "RUNNING" ]
+EMU_FINISHED_STATES = [ "COMPLETED", "FAILED", "CANCELLED" ]
+PBS_STATES          = { "PENDING" : "Q", "HELD" : "H", "RUNNING" : "R" }
+
+def jobFile( jobid ) :
+  return os.path.join( EMU_DIR, "{0}.json".format( jobid ) )
+
+def readJob( jobid ) :
+  try :
+    with open( jobFile( jobid ), "r" ) as f :
+      return json.load( f )
+  except ( OSError, ValueError ) :
+    return None
+
+def writeJob( job ) :
+  tmpfile = jobFile( job["id"] ) + ".tmp"
+  with open( tmpfile, "w" ) as f :
+    json.dump( job, f )
+  os.replace( tmpfile, jobFile( job["id"] ) )
+
+def allJobs() :
+  jobs = [ readJob( os.path.basename( filename )[:-len( ".json" )] ) for filename in glob.glob( os.path.join( EMU_DIR, "*.json" ) ) ]
+  return [ job for job in jobs if job is not None ]
+
+# Held while changing the state of jobs, so slots and cancellations never race
+@contextlib.contextmanager
+def schedulerLock() :
+  os.makedirs( EMU_DIR, exist_ok=True )
+  with open( os.path.join( EMU_DIR, "lock" ), "a" ) as f :
+    fcntl.flock( f, fcntl.LOCK_EX )
+    yield
+
+def nextJobid() :
+  os.makedirs( EMU_DIR, exist_ok=True )
+  with open( os.path.join( EMU_DIR, "jobid" ), "a+" ) as f :
+    fcntl.flock( f, fcntl.LOCK_EX )
+    f.seek( 0 )
+    content = f.read().strip()
+    jobid = int( content ) + 1 if content else EMU_FIRST_JOBID
+    f.seek( 0 )
+    f.truncate()
+    f.write( str( jobid ) )
+  return jobid
+
+def splitIds( ids ) :
+  return [ jobid for jobid in ids.split( "," ) if jobid ]
+
+# Job ID without any server suffix or array index, e.g. 12345[].server
+def baseJobid( jobid ) :
+  return jobid.split( "." )[0].split( "[" )[0]
+
+# Indices of a job array as both PBS and SLURM take them, e.g. 0-9:2 or 1,3,5
+def parseArray( spec ) :
+  if spec is None :
+    return None
+  indices = []
+  # SLURM may limit how many run at once with %<limit>
+  for part in spec.split( "%" )[0].split( "," ) :
+    rangeStep = part.split( ":" )
+    bounds    = rangeStep[0].split( "-" )
+    indices.extend( range( int( bounds[0] ), int( bounds[-1] ) + 1, int( rangeStep[1] ) if len( rangeStep ) > 1 else 1 ) )
+  return indices
+
+# Where each index of a job writes to, scheduler output first then the spool file
+def outputs( job ) :
+  if job["array"] is None :
+    return [ ( None, job["output"], os.path.join( EMU_DIR, "{0}.out".format( job["id"] ) ) ) ]
+  return [
+          (
+            index,
+            job["output"].replace( "^array_index^", str( index ) ).replace( "%a", str( index ) ),
+            os.path.join( EMU_DIR, "{0}.{1}.out".format( job["id"], index ) )
+          )
+          for index in job["array"]
+          ]
+
+# Split options from the command, options listed in flags take no value and
+# those listed in repeated keep every value given
+def parseArgs( args, flags, repeated=[] ) :
+  opts = {}
+  idx  = 0
+  while idx < len( args ) :
+    arg = args[idx]
+    if arg == "--" :
+      idx += 1
+      break
+    if not arg.startswith( "-" ) :
+      break
+    if "=" in arg and arg.startswith( "--" ) :
+      key, value = arg.split( "=", 1 )
+    elif arg in flags :
+      key, value = arg, True
+    else :
+      key, value = arg, args[idx + 1]
+      idx += 1
+    if key in repeated :
+      opts.setdefault( key, [] ).append( value )
+    else :
+      opts[key] = value
+    idx += 1
+  return opts, args[idx:]
+
+# <type>:<jobid>[:<jobid>...][,<type>:...] as both PBS and SLURM take them
+def parseDependencies( depends ) :
+  dependencies = []
+  for depend in depends.split( "," ) if depends else [] :
+    fields = depend.split( ":" )
+    dependencies.extend( [ [ fields[0], baseJobid( jobid ) ] for jobid in fields[1:] if jobid ] )
+  return dependencies
+
+# Whether a dependency is met, None if it never can be
+def dependencyMet( depType, job ) :
+  if job is None :
+    return None
+  state = job["state"]
+  if depType == "after" :
+    return state not in [ "PENDING", "HELD" ]
+  if state not in EMU_FINISHED_STATES :
+    return False
+  if depType == "afterok" :
+    return True if state == "COMPLETED" else None
+  if depType == "afternotok" :
+    return True if state != "COMPLETED" else None
+  return True
+
+def submit( command, output, name, flavor, dependencies=[], array=None ) :
+  for depType, depJobid in dependencies :
+    if readJob( depJobid ) is None :
+      print( "Unknown job {0} in dependencies".format( depJobid ), file=sys.stderr )
+      return None
+
+  jobid = nextJobid()
+  job   = {
+            "id"           : jobid,
+            "name"         : name,
+            "command"      : command,
+            "output"       : os.path.abspath( output ) if output else os.path.abspath( "emu-{0}.out".format( jobid ) ),
+            "cwd"          : os.getcwd(),
+            "flavor"       : flavor,
+            "dependencies" : dependencies,
+            "array"        : array,
+            "tasks"        : {},
+            "state"        : "HELD" if dependencies else "PENDING",
+            "exit"         : None,
+            "submit"       : time.time()
+          }
+  writeJob( job )
+
+  proc = subprocess.Popen(
+                          [ sys.executable, os.path.abspath( __file__ ), "_run", str( jobid ) ],
+                          stdin =subprocess.DEVNULL,
+                          stdout=subprocess.DEVNULL,
+                          stderr=subprocess.DEVNULL,
+                          start_new_session=True
+                          )
+  with schedulerLock() :
+    job = readJob( jobid )
+    job["pid"] = proc.pid
+    writeJob( job )
+  return jobid
+
+# Waits in the queue until dependencies are met and a slot is free, True if the job may run
+def queueJob( jobid ) :
+  time.sleep( EMU_QUEUE_DELAY )
+  while True :
+    with schedulerLock() :
+      job = readJob( jobid )
+      if job["state"] == "CANCELLED" :
+        return False
+
+      met = [ dependencyMet( depType, readJob( depJobid ) ) for depType, depJobid in job["dependencies"] ]
+      if None in met :
+        # Both schedulers can drop jobs whose dependencies will never be met, do so always
+        job["state"] = "CANCELLED"
+        job["end"]   = time.time()
+        writeJob( job )
+        return False
+
+      if all( met ) :
+        job["state"] = "PENDING"
+        running = len( [ other for other in allJobs() if other["state"] == "RUNNING" ] )
+        if EMU_SLOTS <= 0 or running < EMU_SLOTS :
+          job["state"] = "RUNNING"
+          job["start"] = time.time()
+          writeJob( job )
+          return True
+        writeJob( job )
+    time.sleep( EMU_QUEUE_POLL )
+
+def runJob( jobid ) :
+  if not queueJob( jobid ) :
+    return
+  job = readJob( jobid )
+
+  # Every index of an array runs at once as part of the one job
+  procs = []
+  for index, output, spool in outputs( job ) :
+    env = dict( os.environ )
+    if job["flavor"] == "PBS" :
+      env[ "PBS_JOBID" ] = pbsJobid( job )
+      if index is not None :
+        env[ "PBS_ARRAY_INDEX" ] = str( index )
+    else :
+      env[ "SLURM_JOB_ID" ] = str( jobid )
+      if index is not None :
+        env[ "SLURM_ARRAY_TASK_ID" ] = str( index )
+
+    # Write output aside and move it in place at the end, like a scheduler staging output
+    with open( spool, "wb" ) as spoolOutput :
+      procs.append( ( index, output, spool, subprocess.Popen( job["command"], cwd=job["cwd"], env=env, stdin=subprocess.DEVNULL, stdout=spoolOutput, stderr=subprocess.STDOUT ) ) )
+
+  tasks = {}
+  for index, output, spool, proc in procs :
+    tasks[ str( index ) ] = proc.wait()
+    # Spool and output may be on different filesystems, e.g. a tmpfs /tmp
+    shutil.move( spool, output )
+  # The first failing index stands for the whole array
+  retval = next( ( taskRetval for taskRetval in tasks.values() if taskRetval != 0 ), 0 )
+
+  with schedulerLock() :
+    job = readJob( jobid )
+    job["state"] = "COMPLETED" if retval == 0 else "FAILED"
+    job["exit"]  = retval
+    job["tasks"] = tasks if job["array"] is not None else {}
+    job["end"]   = time.time()
+    writeJob( job )
+
+def cancelJob( jobid ) :
+  with schedulerLock() :
+    job = readJob( jobid )
+    if job is None or job["state"] in EMU_FINISHED_STATES :
+      return job is not None
+    if job["state"] == "RUNNING" and "pid" in job :
+      # The job runs in its own session along with everything it started
+      try :
+        os.killpg( job["pid"], signal.SIGTERM )
+      except ProcessLookupError :
+        pass
+      # Whatever it managed to output is still staged out
+      for _, output, spool in outputs( job ) :
+        if os.path.exists( spool ) :
+          shutil.move( spool, output )
+    job["exit"]  = 128 + int( signal.SIGTERM ) if job["state"] == "RUNNING" else None
+    job["state"] = "CANCELLED"
+    job["end"]   = time.time()
+    writeJob( job )
+  return True
+
+def waitJob( jobid ) :
+  while readJob( jobid )["state"] not in EMU_FINISHED_STATES :
+    time.sleep( 0.25 )
+  # Jobs that never ran still failed
+  exitCode = readJob( jobid )["exit"]
+  return exitCode if exitCode is not None else 1
+
+################################################################################
+# SLURM
+def sbatch( args ) :
+  opts, command = parseArgs( args, [ "-W", "--wait", "--parsable" ] )
+  jobid = submit(
+                  command,
+                  opts.get( "-o", opts.get( "--output" ) ),
+                  opts.get( "-J", opts.get( "--job-name" ) ),
+                  "SLURM",
+                  parseDependencies( opts.get( "-d", opts.get( "--dependency" ) ) ),
+                  parseArray( opts.get( "-a", opts.get( "--array" ) ) )
+                  )
+  if jobid is None :
+    print( "sbatch: error: Batch job submission failed: Job dependency problem", file=sys.stderr )
+    return 1
+
+  if "--parsable" in opts :
+    print( jobid )
+  else :
+    print( "Submitted batch job {0}".format( jobid ) )
+  sys.stdout.flush()
+
+  if "-W" in opts or "--wait" in opts :
+    return waitJob( jobid )
+  return 0
+
+def slurmState( job ) :
+  return "PENDING" if job["state"] == "HELD" else job["state"]
+
+def slurmJobid( job ) :
+  if job["array"] is None :
+    return str( job["id"] )
+  return "{0}_[{1}-{2}]".format( job["id"], job["array"][0], job["array"][-1] )
+
+def squeue( args ) :
+  opts, _ = parseArgs( args, [ "-h", "--noheader" ] )
+  fmt     = opts.get( "-o", opts.get( "--format", "%i %j %T" ) )
+  jobids  = splitIds( opts.get( "-j", opts.get( "--jobs", "" ) ) )
+
+  if "-h" not in opts and "--noheader" not in opts :
+    print( fmt.replace( "%i", "JOBID" ).replace( "%j", "NAME" ).replace( "%T", "STATE" ) )
+
+  for jobid in jobids :
+    job = readJob( jobid )
+    if job is not None and slurmState( job ) in SLURM_ACTIVE_STATES :
+      print( fmt.replace( "%i", slurmJobid( job ) ).replace( "%j", str( job["name"] ) ).replace( "%T", slurmState( job ) ) )
+  return 0
+
+def sacct( args ) :
+  opts, _ = parseArgs( args, [ "-n", "-P", "-X", "--noheader", "--parsable2", "--allocations" ] )
+  fields  = opts.get( "-o", opts.get( "--format", "JobIDRaw,State,ExitCode" ) ).split( "," )
+  jobids  = splitIds( opts.get( "-j", opts.get( "--jobs", "" ) ) )
+
+  for jobid in jobids :
+    job = readJob( jobid )
+    if job is None :
+      continue
+    # Finished arrays are listed by index
+    tasks = job["tasks"].items() if job["tasks"] else [ ( None, job["exit"] ) ]
+    for index, exitCode in tasks :
+      values = {
+                "JobID"    : str( job["id"] ) if index is None else "{0}_{1}".format( job["id"], index ),
+                "JobIDRaw" : str( job["id"] ),
+                "JobName"  : str( job["name"] ),
+                "State"    : slurmState( job ) if index is None else ( "COMPLETED" if exitCode == 0 else "FAILED" ),
+                "ExitCode" : "{0}:0".format( exitCode if exitCode is not None else 0 )
+                }
+      print( "|".join( [ values.get( field, "" ) for field in fields ] ) )
+  return 0
+
+def scancel( args ) :
+  _, jobids = parseArgs( args, [] )
+  retval = 0
+  for jobid in jobids :
+    if not cancelJob( baseJobid( jobid ) ) :
+      print( "scancel: error: Invalid job id {0}".format( jobid ), file=sys.stderr )
+      retval = 1
+  return retval
+
+################################################################################
+# PBS
+def pbsJobid( job ) :
+  return "{0}{1}.{2}".format( job["id"], "[]" if job["array"] is not None else "", EMU_SERVER )
+
+def pbsState( job, history ) :
+  if job["state"] in EMU_FINISHED_STATES :
+    return "F" if history else None
+  # Arrays that have begun running
+  if job["array"] is not None and job["state"] == "RUNNING" :
+    return "B"
+  return PBS_STATES[ job["state"] ]
+
+def qsub( args ) :
+  opts, command = parseArgs( args, [], repeated=[ "-W", "-l" ] )
+  attributes = dict( attribute.split( "=", 1 ) for attribute in opts.get( "-W", [] ) if "=" in attribute )
+  jobid = submit(
+                  command,
+                  opts.get( "-o" ),
+                  opts.get( "-N" ),
+                  "PBS",
+                  parseDependencies( attributes.get( "depend" ) ),
+                  parseArray( opts.get( "-J" ) )
+                  )
+  if jobid is None :
+    print( "qsub: Job has unknown dependency", file=sys.stderr )
+    return 1
+
+  print( pbsJobid( readJob( jobid ) ) )
+  sys.stdout.flush()
+
+  if attributes.get( "block", "false" ).lower() == "true" :
+    return waitJob( jobid )
+  return 0
+
+def qstat( args ) :
+  opts, jobids = parseArgs( args, [ "-x", "-f" ] )
+  history = "-x" in opts
+  jobs    = []
+  retval  = 0
+  for jobid in jobids :
+    job = readJob( baseJobid( jobid ) )
+    if job is None or pbsState( job, history ) is None :
+      print( "qstat: {0} Job has finished, use -x or -H to obtain historical job information".format( jobid ) if job is not None else "qstat: Unknown Job Id {0}".format( jobid ), file=sys.stderr )
+      retval = 35 if job is not None else 153
+      continue
+    jobs.append( job )
+
+  if "-f" in opts and opts.get( "-F" ) == "json" :
+    info = {}
+    for job in jobs :
+      info[ pbsJobid( job ) ] = { "Job_Name" : job["name"], "job_state" : pbsState( job, history ), "queue" : "workq" }
+      if job["exit"] is not None :
+        info[ pbsJobid( job ) ][ "Exit_status" ] = job["exit"]
+    print( json.dumps( { "timestamp" : int( time.time() ), "pbs_version" : EMU_SERVER, "pbs_server" : EMU_SERVER, "Jobs" : info }, indent=4 ) )
+  elif jobs :
+    print( "{0:<17} {1:<16} {2:<16} {3:>8} S {4:<8}".format( "Job id", "Name", "User", "Time Use" , "Queue" ) )
+    print( "{0} {1} {2} {3} - {4}".format( "-" * 17, "-" * 16, "-" * 16, "-" * 8, "-" * 8 ) )
+    for job in jobs :
+      print( "{0:<17} {1:<16} {2:<16} {3:>8} {4} {5:<8}".format( pbsJobid( job ), str( job["name"] )[:16], "emulator", "0", pbsState( job, history ), "workq" ) )
+  return retval
+
+def qdel( args ) :
+  _, jobids = parseArgs( args, [] )
+  retval = 0
+  for jobid in jobids :
+    if not cancelJob( baseJobid( jobid ) ) :
+      print( "qdel: Unknown Job Id {0}".format( jobid ), file=sys.stderr )
+      retval = 153
+  return retval
+
+COMMANDS = {
+            "sbatch"  : sbatch,
+            "squeue"  : squeue,
+            "sacct"   : sacct,
+            "scancel" : scancel,
+            "qsub"    : qsub,
+            "qstat"   : qstat,
+            "qdel"    : qdel
+            }
+
+def main() :
+  command = sys.argv[1]
+  if command == "_run" :
+    runJob( sys.argv[2] )
+    return 0
+  return COMMANDS[ command ]( sys.argv[2:] )
+
+if __name__ == '__main__' :
+  exit( main() )
@@ -0,0 +1,9 @@
+#!/bin/sh
+
+config=$1
+dir=$2
+cd $dir
+
+shift; shift
+echo $*
+exit 1
@@ -3,6 +3,7 @@ helper_result=$1
 helper_logdir=$2
 helper_suiteStdout=$3
 helper_numTests=$4
+helper_spawnType=${5:-process pool}
 
 SOURCE_DIR=$( CDPATH= cd -- "$(dirname -- "$0")" && pwd )
 . $SOURCE_DIR/helpers.sh
@@ -25,7 +26,7 @@ checkTest
   "Only $helper_numTests test(s) in queue"                                      \
   0 $helper_result                                                              \
   $helper_suiteStdout                                                           \
-  "Spawning process pool of size [0-9]+ to perform $helper_numTests tests"
+  "Spawning $helper_spawnType of size [0-9]+ to perform $helper_numTests tests"
 helper_result=$?
 
 exit $helper_result
\ No newline at end of file